@@ -0,0 +1,120 @@
+"""
+Benchmark of the /place tile placements.
+
+Compares the CSV round-trip (read the whole CSV file, change one tile,
+write it back) with the Canvas memory-mapped .npy file, flushed at the
+end or after every placement. Reports placements per second for a few
+canvas sizes, then the time of a CanvasRenderer render from scratch,
+from its cache, and after a placement.
+Usage: python bench_canvas.py [size ...]
+"""
+import os
+
+os.environ.setdefault("BOT_TOKEN", "1:bench")  # The settings are read on import
+
+import csv
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from omar_bot.services.place import Canvas, CanvasRenderer
+from omar_bot.services.user_service import UserService
+
+
+SIZES = (20, 100, 1000)
+CSV_SECONDS = 1.0  # The CSV round-trip is run for about this long
+N_PLACEMENTS = 100_000
+N_USERS = 200  # Distinct users on the rendered canvases
+
+
+def make_canvas_csv(path: Path, size: int) -> None:
+    """Writes a size x size canvas with a quarter of the tiles placed."""
+    rng = np.random.default_rng(0)
+    grid = rng.integers(100_000, 6_000_000_000, (size, size), dtype=np.int64)
+    grid[rng.random((size, size)) < 0.75] = 0
+    np.savetxt(path, grid, fmt="%d", delimiter=",")
+
+
+def csv_place(path: Path, x: int, y: int, user_id: int) -> None:
+    """One placement with the CSV file as the storage."""
+    with open(path, newline="") as f:
+        rows = [[int(value) for value in row] for row in csv.reader(f)]
+    rows[y][x] = user_id
+    with open(path, "w", newline="") as f:
+        csv.writer(f).writerows(rows)
+
+
+def bench_csv(path: Path, moves: list) -> float:
+    """Placements per second of the CSV round-trip."""
+    count = 0
+    t = time.perf_counter()
+    while time.perf_counter() - t < CSV_SECONDS and count < len(moves):
+        csv_place(path, *moves[count])
+        count += 1
+    return count / (time.perf_counter() - t)
+
+
+def bench_canvas(canvas_dir: Path, moves: list, flush_each: bool) -> float:
+    """Placements per second of Canvas.place()."""
+    canvas = Canvas.load("bench", canvas_dir)
+    t = time.perf_counter()
+    for x, y, user_id in moves:
+        canvas.place(x, y, user_id)
+        if flush_each:
+            canvas.flush()
+    canvas.flush()
+    return len(moves) / (time.perf_counter() - t)
+
+
+def bench_render(size: int, user_service: UserService) -> tuple:
+    """Milliseconds of a full render, a cached render and a render after one placement."""
+    rng = np.random.default_rng(1)
+    user_ids = np.array(user_service.get_user_ids(), dtype=np.int64)
+    canvas = Canvas(rng.choice(np.append(user_ids, [0, 0, 0]), (size, size)))
+    renderer = CanvasRenderer(canvas, user_service)
+    times = []
+    for step in ("full", "cached", "placed"):
+        if step == "placed":
+            canvas.place(size // 2, size // 2, int(user_ids[0]))
+        t = time.perf_counter()
+        renderer.render()
+        times.append((time.perf_counter() - t) * 1000)
+    return tuple(times)
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    print(f"{'size':>6} {'CSV round-trip/s':>17} {'npy, flush at end/s':>20} {'npy, flush each/s':>18}")
+    for size in sizes:
+        canvas_dir = Path(tempfile.mkdtemp())
+        try:
+            rng = random.Random(size)
+            moves = [(rng.randrange(size), rng.randrange(size), rng.randrange(100_000, 6_000_000_000))
+                     for _ in range(N_PLACEMENTS)]
+            make_canvas_csv(canvas_dir / "bench.csv", size)
+            Canvas.load("bench", canvas_dir)  # One-time conversion to .npy, not measured
+            csv_rate = bench_csv(canvas_dir / "bench.csv", moves)
+            npy_rate = bench_canvas(canvas_dir, moves, flush_each=False)
+            flush_rate = bench_canvas(canvas_dir, moves[:10_000], flush_each=True)
+            print(f"{size:>6} {csv_rate:>17.0f} {npy_rate:>20.0f} {flush_rate:>18.0f}")
+        finally:
+            shutil.rmtree(canvas_dir)
+
+    users_dir = Path(tempfile.mkdtemp())
+    try:
+        user_service = UserService(users_dir=users_dir)
+        for i in range(N_USERS):
+            user_service.add_user(100_000 + i, f"User {i}")
+        print(f"\n{'size':>6} {'full render ms':>15} {'cached ms':>10} {'after a placement ms':>21}")
+        for size in sizes:
+            full, cached, placed = bench_render(size, user_service)
+            print(f"{size:>6} {full:>15.3f} {cached:>10.3f} {placed:>21.3f}")
+    finally:
+        shutil.rmtree(users_dir)
+
+
+if __name__ == "__main__":
+    main()
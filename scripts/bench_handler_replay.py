@@ -0,0 +1,125 @@
+"""
+Offline replay of synthetic updates through the real handlers.
+
+Builds an Application whose Bot answers from a local FakeBotAPI, with
+the handlers registered by add_user_handlers and add_callback_handlers,
+and feeds it a mix of commands sent by the users of a synthetic users
+directory. Reports the updates per second and the latency of each
+command, as recorded by the HandlerStats of the application.
+Usage: python bench_handler_replay.py [n_users] [n_updates] [concurrency]
+"""
+import os
+
+# The settings are read on import: no token is needed offline,
+# and the replayed updates must all reach their handler
+os.environ.setdefault("BOT_TOKEN", "1:replay")
+for level in ("USER", "CHAT", "GLOBAL"):
+    os.environ[f"RATE_LIMIT_{level}_RATE"] = "0"
+
+import asyncio
+import json
+import logging
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from telegram import Update
+from telegram.ext import Application
+from omar_bot.handlers.callback_handlers import add_callback_handlers
+from omar_bot.handlers.user_commands import add_user_handlers, USER_SERVICE_KEY, HANDLER_STATS_KEY
+from omar_bot.services.user_service import UserService, get_default_user_dict
+from omar_bot.utils.fake_api import FakeBotAPI, make_command_update, make_callback_update
+
+
+N_USERS = 1_000
+N_UPDATES = 5_000
+CONCURRENCY = 1
+# (weight, command) of the replayed mix
+COMMANDS = (
+    (30, "/myprofile"),
+    (15, "/users"),
+    (15, "/gems"),
+    (10, "/gold"),
+    (10, "/leaderboard"),
+    (10, "/leaderboard tiles"),
+    (5, "/help"),
+    (5, "/santa status"),
+)
+PAGE_CALLBACKS = 10  # weight of the presses of the list page buttons
+
+
+def make_users_dir(n_users: int) -> Path:
+    """Creates a temporary users directory with n_users synthetic users."""
+    users_dir = Path(tempfile.mkdtemp())
+    rng = random.Random(0)
+    for i in range(n_users):
+        user_id = 100_000 + i
+        data = get_default_user_dict(f"User {i}", user_id)
+        data["gems"] = rng.randrange(100)
+        data["tiles_count"] = rng.randrange(1_000)
+        with open(users_dir / f"{user_id}.json", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+    return users_dir
+
+
+def make_updates(n_users: int, n_updates: int, bot) -> list:
+    """A reproducible random mix of command and button updates."""
+    rng = random.Random(1)
+    weights = [weight for weight, _ in COMMANDS] + [PAGE_CALLBACKS]
+    choices = [command for _, command in COMMANDS] + [None]
+    updates = []
+    for update_id in range(1, n_updates + 1):
+        user_id = 100_000 + rng.randrange(n_users)
+        command = rng.choices(choices, weights)[0]
+        if command is None:
+            data = make_callback_update(update_id, user_id, f"list:users:{rng.randrange(5)}")
+        else:
+            data = make_command_update(update_id, user_id, command)
+        updates.append(Update.de_json(data, bot))
+    return updates
+
+
+async def replay(users_dir: Path, n_users: int, n_updates: int, concurrency: int) -> None:
+    """Replays the updates and prints the throughput and the latency per command."""
+    api = FakeBotAPI()
+    application = Application.builder().token("1:replay").request(api).get_updates_request(api).build()
+    application.bot_data[USER_SERVICE_KEY] = UserService(
+        users_dir=users_dir, rank_keys=("gems", "gold", "tiles_count"))
+    add_user_handlers(application)
+    add_callback_handlers(application)
+    await application.initialize()
+    updates = make_updates(n_users, n_updates, application.bot)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(update):
+        async with semaphore:
+            await application.process_update(update)
+
+    t = time.perf_counter()
+    await asyncio.gather(*(process(update) for update in updates))
+    elapsed = time.perf_counter() - t
+    await application.shutdown()
+
+    print(f"{n_users} users, {n_updates} updates, concurrency {concurrency}")
+    print(f"{n_updates / elapsed:.0f} updates/s, {len(api.sent)} replies\n")
+    for line in application.bot_data[HANDLER_STATS_KEY].report():
+        print(line)
+
+
+def main():
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else N_USERS
+    n_updates = int(sys.argv[2]) if len(sys.argv) > 2 else N_UPDATES
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else CONCURRENCY
+    logging.basicConfig(level=logging.ERROR)  # The handlers log every call
+    users_dir = make_users_dir(n_users)
+    try:
+        asyncio.run(replay(users_dir, n_users, n_updates, concurrency))
+    finally:
+        shutil.rmtree(users_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark of the command latency against the number of users.
+
+Compares a UserService built for every command (the old behaviour)
+with the service shared through application.bot_data.
+With the shared service /myprofile no longer depends on the number
+of users; /users and /gems walk every user only when a field they
+show changed, repeated calls are served from the render cache.
+"""
+import asyncio
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from omar_bot.handlers.user_commands import (
+    users_command, gems_command, myprofile_command, USER_SERVICE_KEY
+)
+from omar_bot.services.user_service import UserService, get_default_user_dict
+
+
+USER_COUNTS = (100, 1_000, 10_000)
+REPEATS = 20
+
+
+def make_users_dir(n_users: int) -> Path:
+    """Creates a temporary users directory with n_users synthetic users."""
+    users_dir = Path(tempfile.mkdtemp())
+    for i in range(n_users):
+        user_id = 100_000 + i
+        data = get_default_user_dict(f"User {i}", user_id)
+        data["gems"] = i % 7
+        with open(users_dir / f"{user_id}.json", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    return users_dir
+
+
+def make_update():
+    """Minimal stand-in for a telegram Update."""
+    async def reply_text(*args, **kwargs):
+        pass
+    user = SimpleNamespace(id=100_000, full_name="Bench User")
+    return SimpleNamespace(effective_user=user, message=SimpleNamespace(reply_text=reply_text))
+
+
+async def time_command(command, users_dir: Path, shared: bool) -> float:
+    """Returns the mean latency of a command in milliseconds."""
+    update = make_update()
+    bot_data = {USER_SERVICE_KEY: UserService(users_dir=users_dir)}
+    t = time.perf_counter()
+    for _ in range(REPEATS):
+        if not shared:
+            bot_data = {USER_SERVICE_KEY: UserService(users_dir=users_dir)}
+        context = SimpleNamespace(bot_data=bot_data, args=[])
+        await command(update, context)
+    return (time.perf_counter() - t) / REPEATS * 1000
+
+
+def main():
+    print(f"{'users':>8} {'command':>10} {'per-command (ms)':>18} {'shared (ms)':>12}")
+    for n_users in USER_COUNTS:
+        users_dir = make_users_dir(n_users)
+        try:
+            for command in (myprofile_command, users_command, gems_command):
+                fresh = asyncio.run(time_command(command, users_dir, shared=False))
+                shared = asyncio.run(time_command(command, users_dir, shared=True))
+                name = command.__name__.replace("_command", "")
+                print(f"{n_users:>8} {name:>10} {fresh:>18.3f} {shared:>12.3f}")
+        finally:
+            shutil.rmtree(users_dir)
+
+
+if __name__ == "__main__":
+    main()
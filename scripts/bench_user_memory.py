@@ -0,0 +1,68 @@
+"""
+Benchmark of the memory used by the users kept in memory.
+
+Loads the same synthetic users directory with the default dict-per-user
+layout and with the columnar layout, and reports the memory allocated
+per user (measured with tracemalloc) and the time of a few aggregates.
+Usage: python bench_user_memory.py [n_users]
+"""
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from omar_bot.services.user_service import UserService, get_default_user_dict
+
+
+N_USERS = 50_000
+
+
+def make_users_dir(n_users: int) -> Path:
+    """Creates a temporary users directory with n_users synthetic users."""
+    users_dir = Path(tempfile.mkdtemp())
+    rng = random.Random(0)
+    for i in range(n_users):
+        user_id = 100_000 + i
+        data = get_default_user_dict(f"User {i}", user_id)
+        data["gems"] = rng.randrange(10_000)
+        data["gold"] = rng.randrange(3)
+        data["tiles_count"] = rng.randrange(1_000)
+        with open(users_dir / f"{user_id}.json", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+    return users_dir
+
+
+def measure(users_dir: Path, n_users: int, columnar: bool) -> None:
+    """Prints the memory per user and the aggregate timings of one layout."""
+    tracemalloc.start()
+    service = UserService(users_dir=users_dir, columnar=columnar)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    t = time.perf_counter()
+    total = service.total("gems")
+    having = service.having("gold")
+    top = service.top("gems", 10)
+    elapsed = (time.perf_counter() - t) * 1000
+    layout = "columnar" if columnar else "dict"
+    print(f"{layout:>9} {current / n_users:>16.0f} {elapsed:>16.2f}   "
+          f"(total={total}, with gold={len(having)}, top={top[0]})")
+
+
+def main():
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else N_USERS
+    users_dir = make_users_dir(n_users)
+    try:
+        print(f"{n_users} users\n")
+        print(f"{'layout':>9} {'bytes per user':>16} {'aggregates (ms)':>16}")
+        measure(users_dir, n_users, columnar=False)
+        measure(users_dir, n_users, columnar=True)
+    finally:
+        shutil.rmtree(users_dir)
+
+
+if __name__ == "__main__":
+    main()
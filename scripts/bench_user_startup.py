@@ -0,0 +1,67 @@
+"""
+Benchmark of the UserService startup.
+
+For 1k, 10k and 100k synthetic users, measures the time to build the
+service and the time to first response: building it plus serving the
+profile of one user, as /myprofile would right after a restart.
+Lazy loading makes the startup cost depend only on listing the
+directory, and a valid snapshot replaces all the file reads with a single one.
+Usage: python bench_user_startup.py [n_users ...]
+"""
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from omar_bot.services.user_service import UserService, get_default_user_dict
+
+
+USER_COUNTS = (1_000, 10_000, 100_000)
+MODES = (
+    ("eager", {}),
+    ("lazy", {"lazy": True}),
+    ("snapshot", {"snapshot_path": None}),  # path filled in for each directory
+)
+
+
+def make_users_dir(n_users: int) -> Path:
+    """Creates a temporary users directory with n_users synthetic users."""
+    users_dir = Path(tempfile.mkdtemp())
+    for i in range(n_users):
+        user_id = 100_000 + i
+        with open(users_dir / f"{user_id}.json", "w", encoding="utf-8") as f:
+            json.dump(get_default_user_dict(f"User {i}", user_id), f, ensure_ascii=False, indent=2)
+    return users_dir
+
+
+def time_startup(users_dir: Path, kwargs) -> tuple:
+    """Returns (startup seconds, time to first response in seconds)."""
+    t = time.perf_counter()
+    service = UserService(users_dir=users_dir, **kwargs)
+    startup = time.perf_counter() - t
+    user = service.get_user(100_000)
+    assert user["username"] == "User 0"
+    return startup, time.perf_counter() - t
+
+
+def main():
+    user_counts = [int(arg) for arg in sys.argv[1:]] or USER_COUNTS
+    print(f"{'users':>8} {'mode':>10} {'startup (s)':>12} {'first response (s)':>19}")
+    for n_users in user_counts:
+        users_dir = make_users_dir(n_users)
+        snapshot_path = users_dir.with_name(users_dir.name + ".snapshot")
+        try:
+            UserService(users_dir=users_dir, snapshot_path=snapshot_path).save_snapshot()
+            for name, kwargs in MODES:
+                if "snapshot_path" in kwargs:
+                    kwargs = dict(kwargs, snapshot_path=snapshot_path)
+                startup, first_response = time_startup(users_dir, kwargs)
+                print(f"{n_users:>8} {name:>10} {startup:>12.3f} {first_response:>19.3f}")
+        finally:
+            shutil.rmtree(users_dir)
+            snapshot_path.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark of the user file writes.
+
+Compares the old in-place, indented writes with the atomic writes
+(temp file + os.replace) in the indented and compact encodings,
+with and without fsync. Reports writes per second and the size of
+the users directory on disk.
+"""
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from omar_bot.services.user_service import UserService
+
+
+N_USERS = 500
+N_WRITES = 5_000
+
+
+class InPlaceUserService(UserService):
+    """UserService with the original, non atomic file writes."""
+    def _save_user(self, user_id: int) -> None:
+        file_path = self.users_dir / f"{user_id}.json"
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(self._users[user_id], f, ensure_ascii=False, indent=2)
+
+
+MODES = (
+    ("in-place, indented", InPlaceUserService, {}),
+    ("atomic, indented", UserService, {}),
+    ("atomic, compact", UserService, {"compact": True}),
+    ("atomic, compact, fsync", UserService, {"compact": True, "fsync": True}),
+    ("atomic, compact, fsync, write-behind", UserService,
+     {"compact": True, "fsync": True, "write_behind": True, "flush_threshold": 100}),
+)
+
+
+def run_mode(service_class, kwargs) -> tuple:
+    """Returns (writes per second, bytes on disk) for one configuration."""
+    users_dir = Path(tempfile.mkdtemp())
+    try:
+        service = service_class(users_dir=users_dir, **kwargs)
+        for i in range(N_USERS):
+            service.add_user(100_000 + i, f"User {i}")
+        service.flush()
+
+        t = time.perf_counter()
+        for i in range(N_WRITES):
+            service.set(100_000 + i % N_USERS, "gems", i)
+        service.flush()
+        elapsed = time.perf_counter() - t
+
+        size = sum(p.stat().st_size for p in users_dir.glob("*.json"))
+        return N_WRITES / elapsed, size
+    finally:
+        shutil.rmtree(users_dir)
+
+
+def main():
+    print(f"{N_USERS} users, {N_WRITES} updates of one field\n")
+    print(f"{'mode':>38} {'writes/s':>10} {'bytes on disk':>14}")
+    for name, service_class, kwargs in MODES:
+        rate, size = run_mode(service_class, kwargs)
+        print(f"{name:>38} {rate:>10.0f} {size:>14}")
+
+
+if __name__ == "__main__":
+    main()
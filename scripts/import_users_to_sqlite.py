@@ -0,0 +1,22 @@
+from omar_bot.config.settings import USERS_DIR, USERS_DB_PATH
+from omar_bot.services.user_sqlite_service import SqliteUserService
+
+
+def main():
+    print(f"🔍 Looking for JSON user files in {USERS_DIR}")
+    if not USERS_DIR.exists():
+        print("❌ Directory not found!")
+        return
+
+    service = SqliteUserService(db_path=USERS_DB_PATH)
+    try:
+        print(f"💾 Writing {USERS_DB_PATH.name}...")
+        imported = service.import_json_dir(USERS_DIR)
+    finally:
+        service.close()
+
+    print(f"\n✅ Done! Imported {imported} users into {USERS_DB_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,7 @@
 """
 This console can quickly display and edit user info.
 """
-from omar_bot.config.settings import USERS_DIR
-from omar_bot.services.user_service import UserService
+from omar_bot.services.user_storage import create_user_service
 from omar_bot.utils.utils import convert_value
 
 
@@ -10,7 +9,8 @@ class UserEditor:
     """Console-based user management interface"""
 
     def __init__(self):
-        self.service = UserService(users_dir=USERS_DIR)
+        # Same storage backend as the bot, edits are written at once
+        self.service = create_user_service(write_behind=False)
         self.selected_users = []  # List of selected user IDs
         self.commands = dict()
 
@@ -29,6 +29,7 @@ class UserEditor:
             (self.cmd_remove_attribute, ("remove_attr", "ra")),
             (self.cmd_add_user, ("add_user", "au")),
             (self.cmd_remove_user, ("remove_user",)),
+            (self.cmd_refresh, ("refresh", "rf")),
             (self.cmd_quit, ("quit", "q", "exit")),
         )
 
@@ -97,6 +98,7 @@ class UserEditor:
         print("  remove_attr, ra     - Remove attribute from selected users")
         print("  add_user, au        - Add a new user")
         print("  remove_user         - Remove a user")
+        print("  refresh, rf         - Reload users changed by the bot")
         print("  quit, q, exit       - Exit the program")
 
     def parse_selection(self, selection_str):
@@ -348,10 +350,11 @@ class UserEditor:
 
         # Add attribute to selected users that don't have it
         updated = 0
-        for user_id in self.selected_users:
-            if key not in self.service.get_user(user_id):
-                self.service.set(user_id, key, default_value)
-                updated += 1
+        with self.service.batch():
+            for user_id in self.selected_users:
+                if key not in self.service.get_user(user_id):
+                    self.service.set(user_id, key, default_value)
+                    updated += 1
 
         print(f"✅ Added '{key}' with default value {repr(default_value)} to {updated} users")
 
@@ -385,9 +388,10 @@ class UserEditor:
 
         # Set attribute for selected users
         updated = 0
-        for user_id in self.selected_users:
-            self.service.set(user_id, key, value)
-            updated += 1
+        with self.service.batch():
+            for user_id in self.selected_users:
+                self.service.set(user_id, key, value)
+                updated += 1
 
         print(f"✅ Set '{key}' = {repr(value)} for {updated} users")
 
@@ -404,16 +408,14 @@ class UserEditor:
             return []
 
         # Find users matching the criteria
-        matched_users = []
-        for user_id in user_ids:
-            user_data = self.service.get_user(user_id)
-            if feature in user_data:
-                current_value = user_data[feature]
-                if current_value == target_value:
-                    matched_users.append(user_id)
-            elif target_value is None:
-                # Field doesn't exist, which matches "None" search
-                matched_users.append(user_id)
+        if target_value is None:
+            # Field doesn't exist, which matches "None" search
+            matched_users = [uid for uid in user_ids
+                             if self.service.get(uid, feature) is None]
+        else:
+            # Index the feature, so that repeated selections are fast
+            self.service.add_index(feature)
+            matched_users = self.service.find(feature, target_value)
 
         if not matched_users:
             print(f"❌ No users found where {feature} = {repr(target_value)}")
@@ -471,10 +473,11 @@ class UserEditor:
 
         # Remove attribute from selected users
         removed = 0
-        for user_id in self.selected_users:
-            if key in self.service.get_user(user_id):
-                self.service.delete_attribute(user_id, key)
-                removed += 1
+        with self.service.batch():
+            for user_id in self.selected_users:
+                if key in self.service.get_user(user_id):
+                    self.service.delete_attribute(user_id, key)
+                    removed += 1
 
         print(f"✅ Removed '{key}' from {removed} users")
 
@@ -560,6 +563,14 @@ class UserEditor:
 
         print(f"✅ Removed {removed} user(s)")
 
+    def cmd_refresh(self, args=""):
+        """Reload the users changed on disk since they were read"""
+        changed = self.service.refresh()
+        for user_id in list(self.selected_users):
+            if self.service.get_user(user_id) is None:
+                self.selected_users.remove(user_id)
+        print(f"🔄 Reloaded {changed} changed user(s)")
+
     @classmethod
     def cmd_quit(cls, args=""):
         """Exit the program gracefully"""
@@ -569,7 +580,10 @@ class UserEditor:
 
 def main():
     editor = UserEditor()
-    editor.run()
+    try:
+        editor.run()
+    finally:
+        editor.service.close()
 
 
 if __name__ == '__main__':
@@ -1,8 +1,23 @@
+import asyncio
 import logging
+import secrets
+from urllib.parse import urlparse
 from telegram import Update
 from telegram.ext import Application
-from omar_bot.config.settings import BOT_TOKEN
-from omar_bot.handlers.user_commands import add_user_handlers
+from omar_bot.config.settings import (
+    BOT_TOKEN, USER_REFRESH_INTERVAL, USER_SNAPSHOT_INTERVAL, CONCURRENT_UPDATES, STATS_LOG_INTERVAL,
+    BOT_MODE, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_MAX_CONCURRENT,
+    MESSAGE_QUEUE_CHAT, MESSAGE_QUEUE_GLOBAL
+)
+from omar_bot.handlers.user_commands import (
+    add_user_handlers, USER_SERVICE_KEY, HANDLER_STATS_KEY, MESSAGE_QUEUE_KEY, CANVASES_KEY
+)
+from omar_bot.handlers.callback_handlers import add_callback_handlers
+from omar_bot.services.message_queue import MessageQueue
+from omar_bot.services.user_service import UserService
+from omar_bot.services.user_storage import create_user_service
+from omar_bot.utils.handler_stats import HandlerStats
+from omar_bot.utils.webhook import WebhookServer
 
 
 # Enable logging
@@ -20,16 +35,166 @@ telegram_logger.setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 
+# Key of the background tasks in application.bot_data
+BACKGROUND_TASKS_KEY = "background_tasks"
+
+
+async def flush_periodically(user_service: UserService) -> None:
+    """Writes the buffered user changes every flush_interval seconds."""
+    while True:
+        await asyncio.sleep(user_service.flush_interval)
+        if user_service.has_pending_changes():
+            try:
+                user_service.flush()
+            except Exception:  # The dirty users are kept, and retried at the next tick
+                logger.exception("Failed to flush the buffered user data.")
+                continue
+            logger.debug("Flushed buffered user data.")
+
+
+async def refresh_periodically(user_service: UserService, interval: float) -> None:
+    """Picks up the user changes made by other processes every interval seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            changed = user_service.refresh()
+        except Exception:  # e.g. a half-written file, retried at the next tick
+            logger.exception("Failed to reload the user changes made on disk.")
+            continue
+        if changed:
+            logger.info("Reloaded %d users changed on disk.", changed)
+
+
+async def snapshot_periodically(user_service: UserService, interval: float) -> None:
+    """Saves the startup snapshot of the users every interval seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            user_service.save_snapshot()
+        except Exception:
+            logger.exception("Failed to save the user snapshot.")
+            continue
+        logger.debug("Saved the user snapshot.")
+
+
+async def log_stats_periodically(stats: HandlerStats, interval: float) -> None:
+    """Writes the command stats to the log every interval seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        for line in stats.report():
+            logger.info("Stats %s", line)
+
+
+def start_background_task(application: Application, coroutine) -> None:
+    """Runs a coroutine until the application stops."""
+    task = asyncio.get_running_loop().create_task(coroutine)
+    application.bot_data.setdefault(BACKGROUND_TASKS_KEY, []).append(task)
+
+
+async def post_init(application: Application) -> None:
+    """
+    Called once the application is initialized.
+    Starts the background tasks.
+    """
+    user_service = application.bot_data[USER_SERVICE_KEY]
+    if user_service.write_behind:
+        start_background_task(application, flush_periodically(user_service))
+    if USER_REFRESH_INTERVAL > 0:
+        start_background_task(application, refresh_periodically(user_service, USER_REFRESH_INTERVAL))
+    if user_service.snapshot_path is not None and USER_SNAPSHOT_INTERVAL > 0:
+        start_background_task(application, snapshot_periodically(user_service, USER_SNAPSHOT_INTERVAL))
+    stats = application.bot_data.get(HANDLER_STATS_KEY)
+    if stats is not None and STATS_LOG_INTERVAL > 0:
+        start_background_task(application, log_stats_periodically(stats, STATS_LOG_INTERVAL))
+
+
+async def post_stop(application: Application) -> None:
+    """
+    Called once the application has stopped.
+    Sends the queued messages and cancels the background tasks.
+    """
+    queue = application.bot_data.get(MESSAGE_QUEUE_KEY)
+    if queue is not None:
+        await queue.stop()
+    for task in application.bot_data.pop(BACKGROUND_TASKS_KEY, []):
+        task.cancel()
+
+
+async def post_shutdown(application: Application) -> None:
+    """
+    Called once the application has shut down.
+    Writes the shared user data and the canvases to disk.
+    """
+    for canvas in application.bot_data.get(CANVASES_KEY, {}).values():
+        canvas.flush()
+    user_service = application.bot_data.get(USER_SERVICE_KEY)
+    if user_service is not None:
+        user_service.close()
+        logger.info("User service closed.")
+
+
+async def serve_webhook(application: Application) -> None:
+    """
+    Runs the application behind the webhook listener until interrupted,
+    with the same lifecycle hooks as run_polling().
+    """
+    secret_token = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    server = WebhookServer(application, path=urlparse(WEBHOOK_URL).path or "/",
+                           secret_token=secret_token, max_concurrent=WEBHOOK_MAX_CONCURRENT)
+    await application.initialize()
+    await post_init(application)
+    await application.start()
+    try:
+        await server.start(WEBHOOK_LISTEN, WEBHOOK_PORT)
+        await application.bot.set_webhook(
+            WEBHOOK_URL, secret_token=secret_token, allowed_updates=Update.ALL_TYPES,
+            max_connections=min(WEBHOOK_MAX_CONCURRENT, 100),  # Telegram allows 1 to 100
+        )
+        await asyncio.Event().wait()  # Until Ctrl-C cancels the task
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+        await post_stop(application)
+        await application.shutdown()
+        await post_shutdown(application)
+
+
 def run_bot():
     """
     Builds and runs the bot application.
     """
+    # Load the user data once, it is shared by all the handlers
+    user_service = create_user_service()
+    logger.info("Loaded %d users.", len(user_service.get_user_ids()))
+
     # Build the Application
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    application.bot_data[USER_SERVICE_KEY] = user_service
+    # Replies and broadcasts share one flood budget, the replies first
+    application.bot_data[MESSAGE_QUEUE_KEY] = MessageQueue(
+        application.bot, chat=MESSAGE_QUEUE_CHAT, total=MESSAGE_QUEUE_GLOBAL)
 
     # Register handlers from the handlers module
     add_user_handlers(application)
+    add_callback_handlers(application)
 
     # Run the bot until the user presses Ctrl-C
     print("Bot is starting... Press Ctrl+C to stop.")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if BOT_MODE == "webhook":
+        try:
+            asyncio.run(serve_webhook(application))
+        except KeyboardInterrupt:
+            pass
+    elif BOT_MODE == "polling":
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+    else:
+        raise ValueError(f"Unknown BOT_MODE: {BOT_MODE}")
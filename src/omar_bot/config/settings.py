@@ -14,7 +14,10 @@ PROJECT_ROOT = SRC_PATH.parent
 DATA_DIR = PROJECT_ROOT / "data"
 PRIVATE_DIR = DATA_DIR / "PRIVATE"
 USERS_DIR = PRIVATE_DIR / "users"
-CANVAS_DIR = DATA_DIR / "canvases"
+USERS_LOG_PATH = PRIVATE_DIR / "users.log"
+USERS_DB_PATH = PRIVATE_DIR / "users.sqlite3"
+USERS_SNAPSHOT_PATH = PRIVATE_DIR / "users.snapshot"
+CANVAS_DIR = DATA_DIR / "PUBLIC" / "canvases"
 DEFAULT_EMOJI_PATH = DATA_DIR / "default_emoji.txt"
 
 
@@ -31,9 +34,76 @@ if not BOT_TOKEN:
     raise ValueError("The BOT_TOKEN environment variable is not set. Please create a .env file and add it.")
 
 
+# --- User data persistence ---
+# Storage backend: "json" (one file per user), "log" (single append-only file)
+# or "sqlite" (SQLite database, import the json files with scripts/import_users_to_sqlite.py)
+USER_STORAGE = os.getenv("USER_STORAGE", "json")
+# Buffer user changes in memory and write them to disk in batches
+USER_WRITE_BEHIND = os.getenv("USER_WRITE_BEHIND", "False").lower() == "true"
+USER_FLUSH_INTERVAL = float(os.getenv("USER_FLUSH_INTERVAL", "5"))  # seconds
+USER_FLUSH_THRESHOLD = int(os.getenv("USER_FLUSH_THRESHOLD", "100"))  # dirty users
+# Read each user file on first access instead of at startup
+USER_LAZY_LOAD = os.getenv("USER_LAZY_LOAD", "False").lower() == "true"
+# Seconds between checks for user changes made by other processes (0 = never)
+USER_REFRESH_INTERVAL = float(os.getenv("USER_REFRESH_INTERVAL", "0"))
+# Restart from a snapshot of the users saved at shutdown and every interval seconds (0 = only at shutdown)
+USER_SNAPSHOT = os.getenv("USER_SNAPSHOT", "True").lower() == "true"
+USER_SNAPSHOT_INTERVAL = float(os.getenv("USER_SNAPSHOT_INTERVAL", "600"))
+# Keep the users in memory in NumPy columns instead of one dict per user
+USER_COLUMNAR = os.getenv("USER_COLUMNAR", "False").lower() == "true"
+# User fields with a secondary index, for fast lookups by value
+USER_INDEX_KEYS = ("admin", "santa", "canvas")
+# Numeric user fields kept sorted, for the leaderboards
+USER_RANK_KEYS = ("gems", "gold", "tiles_count")
+# Write user files without indentation, and force them to disk
+USER_COMPACT_JSON = os.getenv("USER_COMPACT_JSON", "False").lower() == "true"
+USER_FSYNC = os.getenv("USER_FSYNC", "False").lower() == "true"
+
+
+# --- Update Delivery Settings ---
+# "polling" asks Telegram for updates, "webhook" receives them on WEBHOOK_URL
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Public HTTPS URL forwarded to the local listener, its path is the path served
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+# Secret token sent by Telegram with every update (random for each run if empty)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Updates processed at the same time by the listener
+WEBHOOK_MAX_CONCURRENT = int(os.getenv("WEBHOOK_MAX_CONCURRENT", "32"))
+
+
+# Ensure the WEBHOOK_URL is set in webhook mode, raise an error otherwise.
+if BOT_MODE == "webhook" and not WEBHOOK_URL:
+    raise ValueError("BOT_MODE is webhook but the WEBHOOK_URL environment variable is not set. Please add it to the .env file.")
+
+
+# --- Command Settings ---
+# Users per page of the /users, /gems and /gold lists
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "50"))
+# Updates processed at the same time (1 = one at a time)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "32"))
+# Outbound queue of the replies and broadcasts: (messages per second, burst) per chat and in total,
+# below Telegram's limits of about 1 per second per chat and 30 per second overall
+MESSAGE_QUEUE_CHAT = (float(os.getenv("MESSAGE_QUEUE_CHAT_RATE", "1")),
+                      float(os.getenv("MESSAGE_QUEUE_CHAT_BURST", "3")))
+MESSAGE_QUEUE_GLOBAL = (float(os.getenv("MESSAGE_QUEUE_GLOBAL_RATE", "25")),
+                        float(os.getenv("MESSAGE_QUEUE_GLOBAL_BURST", "25")))
+# Minutes a user waits between two /place
+PLACE_COOLDOWN_MINUTES = float(os.getenv("PLACE_COOLDOWN_MINUTES", "3"))
+# Seconds between dumps of the command stats to the log (0 = never)
+STATS_LOG_INTERVAL = float(os.getenv("STATS_LOG_INTERVAL", "3600"))
+# Token buckets of the commands: (commands per second, burst), a rate of 0 disables the limit
+RATE_LIMIT_USER = (float(os.getenv("RATE_LIMIT_USER_RATE", "0.5")),
+                   float(os.getenv("RATE_LIMIT_USER_BURST", "5")))
+RATE_LIMIT_CHAT = (float(os.getenv("RATE_LIMIT_CHAT_RATE", "2")),
+                   float(os.getenv("RATE_LIMIT_CHAT_BURST", "20")))
+RATE_LIMIT_GLOBAL = (float(os.getenv("RATE_LIMIT_GLOBAL_RATE", "25")),
+                     float(os.getenv("RATE_LIMIT_GLOBAL_BURST", "100")))
+
+
 # --- Other Settings (Optional) ---
 # You can add more settings here as your bot grows, such as:
 # ADMIN_IDS = [int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x]
 # DATABASE_URL = os.getenv("DATABASE_URL")
-# PLACE_COOLDOWN_MINUTES = 3
 # GEM_MULTIPLIER = 15
@@ -1 +1,53 @@
-"""If using InlineKeyboard"""
\ No newline at end of file
+"""If using InlineKeyboard"""
+import logging
+from telegram import Update
+from telegram.error import BadRequest
+from telegram.ext import Application, CallbackQueryHandler, ContextTypes
+from omar_bot.handlers.user_commands import render_list_page, USER_LISTS, LIST_CALLBACK_PREFIX
+
+
+# Get a logger instance for this module
+logger = logging.getLogger(__name__)
+
+
+# ----------------------
+#    Callback Handlers
+# ----------------------
+
+
+async def list_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """ "list:<name>:<page>"
+    Replaces a /users, /gems or /gold message with another page of the list.
+    """
+    query = update.callback_query
+    await query.answer()
+    try:
+        _, name, page = query.data.split(":")
+        page = int(page)
+    except ValueError:
+        logger.warning("Invalid list callback data: %s", query.data)
+        return
+    if name not in USER_LISTS:
+        logger.warning("Unknown list in callback data: %s", query.data)
+        return
+
+    msg, keyboard = render_list_page(context, name, page)
+    try:
+        await query.edit_message_text(msg, parse_mode="Markdown", reply_markup=keyboard)
+    except BadRequest as e:
+        # The same page was requested twice and nothing changed in between
+        if "not modified" not in str(e):
+            raise
+    logger.info("Sent page %d of the %s list to %s.", page + 1, name, update.effective_user.full_name)
+
+
+# ------------------------------------
+#    Adding Handlers to Application
+# ------------------------------------
+
+
+def add_callback_handlers(application: Application) -> None:
+    """
+    Adds the handlers of the inline keyboard buttons to the bot application.
+    """
+    application.add_handler(CallbackQueryHandler(list_page_callback, pattern=f"^{LIST_CALLBACK_PREFIX}"))
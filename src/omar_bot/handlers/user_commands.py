@@ -1,16 +1,155 @@
 import logging
-from telegram import Update
+import time
+from typing import Optional
+from telegram import Chat, Message, Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyParameters
+from telegram.constants import MessageLimit
 from telegram.ext import Application, MessageHandler, CommandHandler, ContextTypes, filters
 import asyncio
-from omar_bot.config.settings import USERS_DIR
+from omar_bot.config.settings import (
+    LIST_PAGE_SIZE, RATE_LIMIT_USER, RATE_LIMIT_CHAT, RATE_LIMIT_GLOBAL,
+    MESSAGE_QUEUE_CHAT, MESSAGE_QUEUE_GLOBAL, PLACE_COOLDOWN_MINUTES
+)
 from omar_bot.services.user_service import UserService
-from omar_bot.services.santa import SantaService
+from omar_bot.services.user_storage import create_user_service
+from omar_bot.services.santa import SantaService, group_key, member_group_keys
+from omar_bot.services.place import Canvas, CanvasRenderer, canvas_name
+from omar_bot.services.render_cache import RenderCache
+from omar_bot.services.message_queue import MessageQueue, INTERACTIVE
+from omar_bot.utils.rate_limit import RateLimiter, rate_limited
+from omar_bot.utils.handler_stats import HandlerStats, timed
 
 
 # Get a logger instance for this module
 logger = logging.getLogger(__name__)
 
 
+# Key of the shared UserService in application.bot_data
+USER_SERVICE_KEY = "user_service"
+
+
+def get_user_service(context: ContextTypes.DEFAULT_TYPE) -> UserService:
+    """
+    Returns the UserService shared by all handlers.
+    The service is normally created in run_bot(); if it is missing
+    (e.g. the application was built elsewhere) it is created here once,
+    for the storage backend chosen in the settings.
+    """
+    service = context.bot_data.get(USER_SERVICE_KEY)
+    if service is None:
+        service = create_user_service()
+        context.bot_data[USER_SERVICE_KEY] = service
+    return service
+
+
+# Key of the RenderCache of the list replies in application.bot_data
+RENDER_CACHE_KEY = "render_cache"
+
+
+def get_render_cache(context: ContextTypes.DEFAULT_TYPE) -> RenderCache:
+    """Returns the RenderCache shared by all handlers, creating it on first use."""
+    return context.bot_data.setdefault(RENDER_CACHE_KEY, RenderCache())
+
+
+# Key of the {group key: SantaService} in application.bot_data, they keep the last draw in memory
+SANTA_SERVICES_KEY = "santa_services"
+# Key of the set of the named santa groups with members in application.bot_data
+SANTA_GROUPS_KEY = "santa_groups"
+
+
+def get_santa_groups(context: ContextTypes.DEFAULT_TYPE) -> set:
+    """
+    Returns the attributes of the named santa groups that had members when it was
+    first called (one pass over the users) or were joined since.
+    """
+    groups = context.bot_data.get(SANTA_GROUPS_KEY)
+    if groups is None:
+        groups = context.bot_data[SANTA_GROUPS_KEY] = member_group_keys(get_user_service(context))
+    return groups
+
+
+def get_santa_service(context: ContextTypes.DEFAULT_TYPE, group: str = None,
+                      create: bool = False) -> Optional[SantaService]:
+    """
+    Returns the SantaService of a group (the default one if None) shared by
+    all handlers. A named group is set up (with its index) on first use only if
+    create is True or it is a known group (see get_santa_groups()), else None is
+    returned without looking at the users, so unknown names leave nothing behind.
+    Raises ValueError for an invalid name.
+    """
+    key_name = group_key(group)
+    santa_services = context.bot_data.setdefault(SANTA_SERVICES_KEY, {})
+    santa_service = santa_services.get(key_name)
+    if santa_service is None:
+        if group:
+            groups = get_santa_groups(context)
+            if not create and key_name not in groups:
+                return None
+            groups.add(key_name)
+        santa_service = SantaService(get_user_service(context), key_name)
+        santa_services[key_name] = santa_service
+    return santa_service
+
+
+# Key of the {name: Canvas} opened by /place in application.bot_data
+CANVASES_KEY = "canvases"
+
+
+def get_canvas(context: ContextTypes.DEFAULT_TYPE, name: str) -> Canvas:
+    """
+    Returns the Canvas shared by all handlers, opening it on first use.
+    Raises FileNotFoundError if the canvas does not exist.
+    """
+    canvases = context.bot_data.setdefault(CANVASES_KEY, {})
+    canvas = canvases.get(name)
+    if canvas is None:
+        canvas = Canvas.load(name)
+        canvases[name] = canvas
+    return canvas
+
+
+# Key of the {name: CanvasRenderer} of /canvas in application.bot_data
+CANVAS_RENDERERS_KEY = "canvas_renderers"
+
+
+def get_canvas_renderer(context: ContextTypes.DEFAULT_TYPE, name: str) -> CanvasRenderer:
+    """Returns the CanvasRenderer of a canvas, creating it on first use."""
+    renderers = context.bot_data.setdefault(CANVAS_RENDERERS_KEY, {})
+    renderer = renderers.get(name)
+    if renderer is None:
+        renderer = CanvasRenderer(get_canvas(context, name), get_user_service(context))
+        renderers[name] = renderer
+    return renderer
+
+
+# Key of the outbound MessageQueue in application.bot_data
+MESSAGE_QUEUE_KEY = "message_queue"
+
+
+def get_message_queue(context: ContextTypes.DEFAULT_TYPE) -> MessageQueue:
+    """Returns the MessageQueue shared by all handlers, creating it on first use."""
+    queue = context.bot_data.get(MESSAGE_QUEUE_KEY)
+    if queue is None:
+        queue = MessageQueue(context.bot, chat=MESSAGE_QUEUE_CHAT, total=MESSAGE_QUEUE_GLOBAL)
+        context.bot_data[MESSAGE_QUEUE_KEY] = queue
+    return queue
+
+
+async def reply(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, **kwargs) -> Message:
+    """
+    Answers the message of an update, like update.message.reply_text().
+    With a MessageQueue in bot_data (run_bot() creates it) the answer goes
+    through it in the INTERACTIVE lane: ahead of the broadcasts, within the
+    same flood budget, and retried after a 429 or a network error.
+    """
+    queue = context.bot_data.get(MESSAGE_QUEUE_KEY)
+    if queue is None:
+        return await update.message.reply_text(text, **kwargs)
+    message = update.message
+    if message.chat.type != Chat.PRIVATE:  # Quoted in groups, as reply_text() does
+        kwargs.setdefault("reply_parameters", ReplyParameters(message.message_id))
+    return await queue.send(message.chat_id, text, INTERACTIVE, **kwargs)
+
+
 # ----------------------
 #    Command Handlers
 # ----------------------
@@ -24,7 +163,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.info("User %s started the bot.", user.full_name)
     name = user.full_name.split(" ")[0]
     msg = f"Hello, {name}! I am an echo bot. Type anything and I'll repeat it back to you."
-    await update.message.reply_text(msg)
+    await reply(update, context, msg)
     logger.info("Sent a welcome message to user %s.", user.full_name)
 
 
@@ -41,96 +180,187 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "`/users` - Show the list of all users by nickname.\n"
         "`/gems` - Show the list of all users with their gems.\n"
         "`/gold` - Show the list of all users with their gold.\n"
+        "`/leaderboard [gems|gold|tiles]` - Show the top 10 users.\n"
         "`/stop` - Gracefully terminate the bot (admin-only).\n"
+        "`/stats` - Show the calls and latency of every command (admin-only).\n"
+        "`/broadcast <message>` - Send a message to every user (admin-only).\n"
         "`/myprofile` - Shows your profile info.\n"
+        "`/place <x> <y>` - Place a tile on your canvas.\n"
+        "`/canvas` - Show your canvas.\n"
         "`/santa` - Manage Secret Santa participation and assignments.\n"
-        "  - `/santa join` - Join the Secret Santa event.\n"
-        "  - `/santa who` - See your assigned giftee and participants.\n"
-        "  - `/santa status` - Check your participation status and participants.\n"
-        "  - `/santa assign` - Assign Secret Santa pairs (admin-only).\n"
-        "  - `/santa reset` - Reset the Secret Santa event (admin-only).\n"
+        "  - `/santa join [group]` - Join the Secret Santa event, or a named group.\n"
+        "  - `/santa leave [group]` - Leave the Secret Santa event.\n"
+        "  - `/santa who [group]` - See your assigned giftee and participants.\n"
+        "  - `/santa status [group]` - Check your participation status and participants.\n"
+        "  - `/santa assign [group]` - Assign Secret Santa pairs (admin-only).\n"
+        "  - `/santa reset [group]` - Reset the Secret Santa event (admin-only).\n"
     )
-    await update.message.reply_text(help_text, parse_mode="Markdown")
+    await reply(update, context, help_text, parse_mode="Markdown")
     logger.info("Sent a help message to user %s.", user.full_name)
 
 
+# Lists sent by /users, /gems and /gold: {name: (header, field shown after the nickname)}
+USER_LISTS = {
+    "users": ("👥 {} users:", None),
+    "gems": ("💎 {} users with gems:", "gems"),
+    "gold": ("🟡 {} users with gold:", "gold"),
+}
+
+# Fields shown by every list, the cached pages are rebuilt only when one of them changes
+LIST_FIELDS = ('nickname', 'username', 'emoji')
+
+# Prefix of the callback data of the page buttons: "list:<name>:<page>"
+LIST_CALLBACK_PREFIX = "list:"
+
+
+def _list_version(service: UserService, name: str) -> tuple:
+    """Version of the data shown by a list."""
+    key = USER_LISTS[name][1]
+    return service.version(*LIST_FIELDS, key) if key else service.version(*LIST_FIELDS)
+
+
+def _list_ids(service: UserService, name: str) -> list:
+    """Sorted IDs of the users shown by a list, users whose value is 0 are left out."""
+    key = USER_LISTS[name][1]
+    return service.get_user_ids() if key is None else service.having(key)
+
+
+def _render_page(service: UserService, name: str, user_ids: list, page: int, n_pages: int,
+                 page_size: int) -> str:
+    """
+    Builds one page of a list: a header line, then one line per user with
+    their emoji, nickname and the value of the list's field, if any.
+    """
+    if not user_ids:
+        return "No users found."
+    header, key = USER_LISTS[name]
+    header = header.format(len(user_ids))
+    if n_pages > 1:
+        header += f" (page {page + 1}/{n_pages})"
+    lines = [header]
+    for uid in user_ids[page * page_size:(page + 1) * page_size]:
+        user_data = service.get_user(uid)
+        nickname = user_data.get('nickname', user_data.get('username', 'Unknown'))
+        emoji = user_data.get('emoji', '')
+        if key is None:
+            lines.append(f"{emoji} {nickname}")
+        else:
+            lines.append(f"{emoji} {nickname}:  {user_data.get(key, 0)}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def _page_keyboard(name: str, page: int, n_pages: int) -> Optional[InlineKeyboardMarkup]:
+    """Buttons to the previous and next pages, None if there is a single page."""
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️", callback_data=f"{LIST_CALLBACK_PREFIX}{name}:{page - 1}"))
+    if page < n_pages - 1:
+        buttons.append(InlineKeyboardButton("▶️", callback_data=f"{LIST_CALLBACK_PREFIX}{name}:{page + 1}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+def render_list_page(context: ContextTypes.DEFAULT_TYPE, name: str, page: int,
+                     page_size: int = LIST_PAGE_SIZE) -> tuple:
+    """
+    Returns (text, keyboard) of a page of a list, the page number being
+    clamped to the existing pages.
+    The sorted ID snapshot and every page are built on first request and
+    cached until a field shown by the list changes.
+    """
+    service = get_user_service(context)
+    cache = get_render_cache(context)
+    version = _list_version(service, name)
+    user_ids = cache.get(f"{name}:ids", version, lambda: _list_ids(service, name))
+    n_pages = max(1, -(-len(user_ids) // page_size))
+    page = min(max(page, 0), n_pages - 1)
+    text = cache.get(f"{name}:{page}", version,
+                     lambda: _render_page(service, name, user_ids, page, n_pages, page_size))
+    return text, _page_keyboard(name, page, n_pages)
+
+
 async def users_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """ /users
-    Displays the IDs, emojis, and nicknames of all users.
+    Displays the emojis and nicknames of all users, one page at a time.
     """
     user = update.effective_user
     logger.info("User %s requested the user list.", user.full_name)
-    service = UserService(users_dir=USERS_DIR)
-    user_ids = service.get_user_ids()
-    if not user_ids:
-        msg = "No users found."
-    else:
-        msg = f"👥 {len(user_ids)} users:\n"
-        for i, uid in enumerate(user_ids):
-            user_data = service.get_user(uid)
-            nickname = user_data.get('nickname', user_data.get('username', 'Unknown'))
-            emoji = user_data.get('emoji', '')
-            msg += f"{emoji} {nickname}\n"
-
-    await update.message.reply_text(msg, parse_mode="Markdown")
+    msg, keyboard = render_list_page(context, "users", 0)
+
+    await reply(update, context, msg, parse_mode="Markdown", reply_markup=keyboard)
     logger.info("Sent the user list to %s.", user.full_name)
 
 
 async def gems_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """ /gems
-    Displays the IDs, emojis, nicknames, and gems of all users.
+    Displays the emojis, nicknames, and gems of all users, one page at a time.
     """
     user = update.effective_user
     logger.info("User %s requested the gems list.", user.full_name)
-    service = UserService(users_dir=USERS_DIR)
-    user_ids = service.get_user_ids()
-    user_ids = [uid for uid in user_ids if service.get_user(uid).get('gems', 0)]
+    msg, keyboard = render_list_page(context, "gems", 0)
 
-    if not user_ids:
-        msg = "No users found."
-    else:
-        msg = f"💎 {len(user_ids)} users with gems:\n"
-        for i, uid in enumerate(user_ids):
-            user_data = service.get_user(uid)
-            nickname = user_data.get('nickname', user_data.get('username', 'Unknown'))
-            emoji = user_data.get('emoji', '')
-            gems = user_data.get('gems', 0)
-            line = f"{emoji} {nickname}:  {gems}"
-            # line = line.replace(" ", "_")
-            msg += f"{line}\n"
-
-    await update.message.reply_text(msg, parse_mode="Markdown")
+    await reply(update, context, msg, parse_mode="Markdown", reply_markup=keyboard)
     logger.info("Sent the gems list to %s.", user.full_name)
 
 
 async def gold_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """ /gold
-    Displays the IDs, emojis, nicknames, and gold of all users.
+    Displays the emojis, nicknames, and gold of all users, one page at a time.
     """
     user = update.effective_user
     logger.info("User %s requested the gold list.", user.full_name)
-    service = UserService(users_dir=USERS_DIR)
-    user_ids = service.get_user_ids()
-    user_ids = [uid for uid in user_ids if service.get_user(uid).get('gold', 0)]
+    msg, keyboard = render_list_page(context, "gold", 0)
 
-    if not user_ids:
-        msg = "No users found."
-    else:
-        msg = f"🟡 {len(user_ids)} users with gold:\n"
-        for i, uid in enumerate(user_ids):
-            user_data = service.get_user(uid)
-            nickname = user_data.get('nickname', user_data.get('username', 'Unknown'))
-            emoji = user_data.get('emoji', '')
-            gold = user_data.get('gold', 0)
-            if gold:
-                line = f"{emoji} {nickname}:  {gold}"
-                # line = line.replace(" ", "_")
-                msg += f"{line}\n"
-
-    await update.message.reply_text(msg, parse_mode="Markdown")
+    await reply(update, context, msg, parse_mode="Markdown", reply_markup=keyboard)
     logger.info("Sent the gold list to %s.", user.full_name)
 
 
+# Leaderboards of /leaderboard: {name: (field, title)}
+LEADERBOARDS = {
+    "gems": ("gems", "💎 Top {} by gems:"),
+    "gold": ("gold", "🟡 Top {} by gold:"),
+    "tiles": ("tiles_count", "🧱 Top {} by tiles placed:"),
+}
+LEADERBOARD_SIZE = 10
+MEDALS = ("🥇", "🥈", "🥉")
+
+
+def render_leaderboard(service: UserService, name: str, size: int = LEADERBOARD_SIZE) -> str:
+    """Builds the /leaderboard reply from the top users of the board's field."""
+    key, title = LEADERBOARDS[name]
+    user_ids = service.top(key, size)
+    if not user_ids:
+        return "No users found."
+    lines = [title.format(len(user_ids))]
+    for rank, uid in enumerate(user_ids):
+        user_data = service.get_user(uid)
+        nickname = user_data.get('nickname', user_data.get('username', 'Unknown'))
+        emoji = user_data.get('emoji', '')
+        place = MEDALS[rank] if rank < len(MEDALS) else f"{rank + 1}."
+        lines.append(f"{place} {emoji} {nickname}:  {user_data[key]}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+async def leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """ /leaderboard [gems|gold|tiles]
+    Displays the users with the most gems (default), gold or placed tiles.
+    """
+    user = update.effective_user
+    name = context.args[0].lower() if context.args else "gems"
+    if name not in LEADERBOARDS:
+        await reply(update, context, "Usage: `/leaderboard [gems|gold|tiles]`", parse_mode="Markdown")
+        return
+    logger.info("User %s requested the %s leaderboard.", user.full_name, name)
+    service = get_user_service(context)
+    key = LEADERBOARDS[name][0]
+    msg = get_render_cache(context).get(
+        f"leaderboard:{name}", service.version(*LIST_FIELDS, key), lambda: render_leaderboard(service, name))
+
+    await reply(update, context, msg, parse_mode="Markdown")
+    logger.info("Sent the %s leaderboard to %s.", name, user.full_name)
+
+
 async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """ /stop
     Gracefully stops the bot.
@@ -139,14 +369,14 @@ async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     logger.info("User %s (%s) requested bot shutdown.", user.full_name, user.id)
 
     # Check if user is an admin
-    user_service = UserService(users_dir=USERS_DIR)
+    user_service = get_user_service(context)
     if not user_service.is_admin(user.id):
         logger.warning("Non-admin user %s (%s) attempted to stop the bot.", user.full_name, user.id)
-        await update.message.reply_text("❌ Only admins can stop the bot.")
+        await reply(update, context, "❌ Only admins can stop the bot.")
         return
 
     try:
-        await update.message.reply_text("Bot is shutting down...")
+        await reply(update, context, "Bot is shutting down...")
         logger.info("Initiating bot shutdown...")
 
         # Log active tasks
@@ -158,6 +388,10 @@ async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         await asyncio.wait_for(context.application.stop(), timeout=10.0)
         logger.info("Polling stopped.")
 
+        # Write user data to disk before the loop goes away
+        user_service.close()
+        logger.info("User data flushed.")
+
         # Close httpx client
         if hasattr(context.application, 'http'):
             logger.debug("Closing httpx client...")
@@ -188,14 +422,60 @@ async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         logger.info("Event loop closed.")
     except asyncio.TimeoutError:
         logger.error("Shutdown timed out after 10 seconds, forcing termination.")
-        await update.message.reply_text("⚠️ Shutdown timed out, forcing termination.")
+        await reply(update, context, "⚠️ Shutdown timed out, forcing termination.")
         loop = asyncio.get_running_loop()
         loop.stop()
         loop.run_until_complete(loop.shutdown_asyncgens())
         loop.close()
     except Exception as e:
         logger.error("Failed to stop the bot: %s", str(e))
-        await update.message.reply_text(f"❌ Error stopping the bot: {str(e)}")
+        await reply(update, context, f"❌ Error stopping the bot: {str(e)}")
+
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """ /stats
+    Shows the calls, errors and latency of every command (admin-only).
+    """
+    user = update.effective_user
+    if not get_user_service(context).is_admin(user.id):
+        logger.warning("Non-admin user %s (%s) requested the stats.", user.full_name, user.id)
+        await reply(update, context, "❌ Only admins can see the stats.")
+        return
+    stats = context.bot_data.get(HANDLER_STATS_KEY)
+    lines = stats.report() if stats else []
+    limiter = context.bot_data.get(RATE_LIMITER_KEY)
+    if limiter:
+        lines.append(f"Rate limited: {limiter.dropped} updates dropped")
+    await reply(update, context, "📊 Command stats:\n" + "\n".join(lines or ["No calls yet."]))
+    logger.info("Sent the stats to %s.", user.full_name)
+
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """ /broadcast <message>
+    Sends a message to every user through the outbound queue (admin-only).
+    The admin gets a summary once all the messages are sent or given up.
+    """
+    user = update.effective_user
+    service = get_user_service(context)
+    if not service.is_admin(user.id):
+        logger.warning("Non-admin user %s (%s) attempted to broadcast.", user.full_name, user.id)
+        await reply(update, context, "❌ Only admins can broadcast.")
+        return
+    text = update.message.text.partition(" ")[2].strip()
+    if not text:
+        await reply(update, context, "Usage: `/broadcast <message>`", parse_mode="Markdown")
+        return
+
+    queue = get_message_queue(context)
+    futures = queue.broadcast(service.get_user_ids(), text)
+    await reply(update, context, f"📣 Broadcasting to {len(futures)} users...")
+    logger.info("Admin %s (%s) broadcast a message to %d users.", user.full_name, user.id, len(futures))
+
+    async def report():
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        failed = sum(isinstance(result, BaseException) for result in results)
+        queue.send(update.effective_chat.id, f"📣 Broadcast done: {len(results) - failed} sent, {failed} failed.")
+    context.application.create_task(report())
 
 
 async def myprofile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -204,11 +484,11 @@ async def myprofile_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     """
     user = update.effective_user
     logger.info("User %s requested their profile.", user.full_name)
-    service = UserService(users_dir=USERS_DIR)
+    service = get_user_service(context)
     user_data = service.get_user(user.id)
 
     if not user_data:
-        await update.message.reply_text("❌ You are not registered. Use /start to join!")
+        await reply(update, context, "❌ You are not registered. Use /start to join!")
         return
 
     msg = f"👤 Your Profile:\n"
@@ -223,104 +503,196 @@ async def myprofile_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     msg += f"Santa: {'Yes' if user_data['santa'] else 'No'}\n"
     msg += f"Canvas: {user_data['canvas']}\n"
 
-    await update.message.reply_text(msg, parse_mode="Markdown")
+    await reply(update, context, msg, parse_mode="Markdown")
     logger.info("Sent profile to %s.", user.full_name)
 
 
+SANTA_SUBCOMMANDS = ("join", "leave", "who", "status", "assign", "reset")
+SANTA_ADMIN_SUBCOMMANDS = ("assign", "reset")
+
+
 async def santa_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """ /santa [join|who|status|assign|reset]
-    Manages Secret Santa participation and assignments.
+    """ /santa [join|leave|who|status|assign|reset] [group]
+    Manages Secret Santa participation and assignments, in the default group or a named one.
     """
     user = update.effective_user
-    user_service = UserService(users_dir=USERS_DIR)
-    santa_service = SantaService(user_service)
+    user_service = get_user_service(context)
     args = context.args
 
     if not args:
-        await update.message.reply_text(
+        await reply(
+            update, context,
             "🎅 Secret Santa Commands:\n"
-            "`/santa join` - Join the Secret Santa event.\n"
-            "`/santa who` - See your assigned giftee and participants.\n"
-            "`/santa status` - Check your participation status and participants.\n"
-            "`/santa assign` - Assign Secret Santa pairs (admin-only).\n"
-            "`/santa reset` - Reset the Secret Santa event (admin-only)."
+            "`/santa join [group]` - Join the Secret Santa event.\n"
+            "`/santa leave [group]` - Leave the Secret Santa event.\n"
+            "`/santa who [group]` - See your assigned giftee and participants.\n"
+            "`/santa status [group]` - Check your participation status and participants.\n"
+            "`/santa assign [group]` - Assign Secret Santa pairs (admin-only).\n"
+            "`/santa reset [group]` - Reset the Secret Santa event (admin-only).\n"
+            "Without a group name, the default group is used."
         )
         return
 
     command = args[0].lower()
+    if command not in SANTA_SUBCOMMANDS:
+        await reply(update, context, "❌ Unknown subcommand. Use /santa for help.")
+        return
+    if not user_service.get_user(user.id):
+        await reply(update, context, "❌ You need to register first with /start.")
+        return
+    if command in SANTA_ADMIN_SUBCOMMANDS and not user_service.is_admin(user.id):
+        await reply(update, context, f"❌ Only admins can {command} the Secret Santa event.")
+        logger.warning("Non-admin %s (%s) attempted to %s the Santa event.", user.full_name, user.id, command)
+        return
+
+    group_arg = f" {args[1].lower()}" if len(args) > 1 else ""
+    in_group = f" in group{group_arg}" if group_arg else ""
+    try:
+        santa_service = get_santa_service(context, group_arg.strip() or None, create=command == "join")
+    except ValueError:
+        await reply(update, context, "❌ A group name is made of up to 32 letters and digits.")
+        return
+    if santa_service is None:
+        await reply(
+            update, context,
+            f"❌ There is no Secret Santa group{group_arg}. Use /santa join{group_arg} to start it.")
+        return
 
     if command == "join":
         if santa_service.join_santa(user.id):
-            await update.message.reply_text("🎅 You’ve joined the Secret Santa event!")
+            await reply(update, context, f"🎅 You’ve joined the Secret Santa event{in_group}!")
+        else:
+            await reply(update, context, "❌ You need to register first with /start.")
+        logger.info("User %s (%s) requested to join Secret Santa group %s.",
+                    user.full_name, user.id, santa_service.key_name)
+
+    elif command == "leave":
+        if santa_service.leave_santa(user.id):
+            await reply(update, context, f"🎅 You’ve left the Secret Santa event{in_group}.")
         else:
-            await update.message.reply_text("❌ You need to register first with /start.")
-        logger.info("User %s (%s) requested to join Secret Santa.", user.full_name, user.id)
+            await reply(update, context, "❌ You need to register first with /start.")
+        logger.info("User %s (%s) requested to leave Secret Santa group %s.",
+                    user.full_name, user.id, santa_service.key_name)
 
     elif command == "who":
-        if not user_service.get_user(user.id):
-            await update.message.reply_text("❌ You need to register first with /start.")
-            return
-        if not user_service.get(user.id, "santa", False):
-            await update.message.reply_text("❌ You’re not participating in Secret Santa. Use /santa join.")
+        if not user_service.get(user.id, santa_service.key_name, False):
+            await reply(
+                update, context,
+                f"❌ You’re not participating in Secret Santa{in_group}. Use /santa join{group_arg}.")
             return
         giftee_id, participants = santa_service.get_pair(user.id)
         participants_str = ", ".join(participants) if participants else "None"
         if giftee_id:
             giftee = user_service.get_user(giftee_id)
             nickname = giftee.get('nickname', giftee['username'])
-            await update.message.reply_text(
+            await reply(
+                update, context,
                 f"🎁 Your Secret Santa giftee is {nickname} (ID: {giftee_id}).\n"
                 f"Participants: {participants_str}"
             )
         else:
-            await update.message.reply_text(
+            await reply(
+                update, context,
                 f"🕒 No giftee assigned yet (not enough participants).\n"
                 f"Participants: {participants_str}"
             )
         logger.info("User %s (%s) checked their Secret Santa giftee.", user.full_name, user.id)
 
     elif command == "status":
-        if not user_service.get_user(user.id):
-            await update.message.reply_text("❌ You need to register first with /start.")
-            return
-        is_participating = user_service.get(user.id, "santa", False)
+        is_participating = user_service.get(user.id, santa_service.key_name, False)
         status = "participating" if is_participating else "not participating"
         giftee_id, participants = santa_service.get_pair(user.id)
         participants_str = ", ".join(participants) if participants else "None"
         pair_status = f", assigned to {giftee_id}" if giftee_id else ", no giftee assigned yet"
-        await update.message.reply_text(
-            f"🎅 You are {status}{pair_status}.\n"
+        await reply(
+            update, context,
+            f"🎅 You are {status}{in_group}{pair_status}.\n"
             f"Participants: {participants_str}"
         )
         logger.info("User %s (%s) checked Secret Santa status.", user.full_name, user.id)
 
     elif command == "assign":
-        if not user_service.is_admin(user.id):
-            await update.message.reply_text("❌ Only admins can assign Secret Santa pairs.")
-            logger.warning("Non-admin %s (%s) attempted to assign Santa pairs.", user.full_name, user.id)
-            return
         pairs = santa_service.assign_pairs()
-        if not pairs:
-            await update.message.reply_text("❌ Not enough participants to assign pairs (need at least 2).")
+        if not pairs and len(santa_service.get_participants()) < 2:
+            await reply(update, context, "❌ Not enough participants to assign pairs (need at least 2).")
+        elif not pairs:
+            await reply(
+                update, context,
+                "❌ No valid draw: the exclusions leave no way to give every participant a giftee.")
         else:
             participants = santa_service.get_participant_names()
-            await update.message.reply_text(
-                f"🎅 Assigned {len(pairs)} Secret Santa pairs.\n"
+            await reply(
+                update, context,
+                f"🎅 Assigned {len(pairs)} Secret Santa pairs{in_group}.\n"
                 f"Participants: {', '.join(participants)}"
             )
         logger.info("Admin %s (%s) assigned Secret Santa pairs.", user.full_name, user.id)
 
     elif command == "reset":
-        if not user_service.is_admin(user.id):
-            await update.message.reply_text("❌ Only admins can reset the Secret Santa event.")
-            logger.warning("Non-admin %s (%s) attempted to reset Santa event.", user.full_name, user.id)
-            return
         santa_service.reset_santa()
-        await update.message.reply_text("🎅 Secret Santa event has been reset.")
+        await reply(update, context, f"🎅 Secret Santa event{in_group} has been reset.")
         logger.info("Admin %s (%s) reset Secret Santa event.", user.full_name, user.id)
 
-    else:
-        await update.message.reply_text("❌ Unknown subcommand. Use /santa for help.")
+
+async def place_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """ /place <x> <y>
+    Places a tile of the user on their canvas, once every PLACE_COOLDOWN_MINUTES.
+    x is the column and y the row, both starting from 0.
+    """
+    user = update.effective_user
+    user_service = get_user_service(context)
+    if not user_service.get_user(user.id):
+        await reply(update, context, "❌ You need to register first with /start.")
+        return
+    try:
+        x, y = (int(arg) for arg in context.args)
+    except (TypeError, ValueError):
+        await reply(update, context, "❌ Usage: /place <x> <y>")
+        return
+
+    async with user_service.lock(user.id):
+        now = time.time()
+        name = canvas_name(user_service.get(user.id, "canvas") or "default")
+        last_place_time = user_service.get(user.id, "last_place_time")
+        wait = (last_place_time or 0) + PLACE_COOLDOWN_MINUTES * 60 - now
+        try:
+            canvas = get_canvas(context, name)
+        except FileNotFoundError:
+            answer = f"❌ Your canvas {name} does not exist."
+        else:
+            if wait > 0:
+                answer = f"⏳ You can place your next tile in {int(wait) + 1} s."
+            elif not canvas.in_bounds(x, y):
+                answer = (f"❌ The canvas {name} is {canvas.width}x{canvas.height}: "
+                          f"x goes from 0 to {canvas.width - 1} and y from 0 to {canvas.height - 1}.")
+            else:
+                canvas.place(x, y, user.id)
+                user_service.update(user.id, last_place_time=now,
+                                    tiles_count=user_service.get(user.id, "tiles_count", 0) + 1)
+                answer = f"🧱 Tile placed at ({x}, {y}) on the canvas {name}."
+                logger.info("User %s (%s) placed a tile at (%d, %d) on %s.", user.full_name, user.id, x, y, name)
+    await reply(update, context, answer)
+
+
+async def canvas_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """ /canvas
+    Shows the canvas of the user, one emoji per tile.
+    """
+    user = update.effective_user
+    user_service = get_user_service(context)
+    if not user_service.get_user(user.id):
+        await reply(update, context, "❌ You need to register first with /start.")
+        return
+    name = canvas_name(user_service.get(user.id, "canvas") or "default")
+    try:
+        text = get_canvas_renderer(context, name).render()
+    except FileNotFoundError:
+        await reply(update, context, f"❌ Your canvas {name} does not exist.")
+        return
+    if len(text.encode("utf-16-le")) // 2 > MessageLimit.MAX_TEXT_LENGTH:  # Telegram counts UTF-16 units
+        text = f"❌ The canvas {name} is too large to be shown in a message."
+    await reply(update, context, text)
+    logger.info("Sent the canvas %s to %s.", name, user.full_name)
 
 
 # ----------------------
@@ -334,24 +706,33 @@ async def echo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     user = update.effective_user
     logger.info(f"{user.full_name}: {update.message.text}")
-    reply = update.message.text
-    await update.message.reply_text(reply)
-    logger.info(reply)
+    text = update.message.text
+    await reply(update, context, text)
+    logger.info(text)
 
 
 # ------------------------------------
 #    Adding Handlers to Application
 # ------------------------------------
 
+# Keys of the RateLimiter and HandlerStats of the commands in application.bot_data
+RATE_LIMITER_KEY = "rate_limiter"
+HANDLER_STATS_KEY = "handler_stats"
+
 COMMAND_HANDLERS = {
     "start": start,
     "help": help_command,
     "users": users_command,
     "gems": gems_command,
     "gold": gold_command,
+    "leaderboard": leaderboard_command,
     "stop": stop_command,
+    "stats": stats_command,
+    "broadcast": broadcast_command,
     "myprofile": myprofile_command,
-    "santa": santa_command
+    "santa": santa_command,
+    "place": place_command,
+    "canvas": canvas_command,
 }
 
 
@@ -369,9 +750,13 @@ def add_user_handlers(application: Application) -> None:
     - ErrorHandler*: to catch and manage any exceptions that occur during a message's processing
     """
 
-    # command handlers
+    # command handlers, sharing one rate limiter; throttled updates are not timed
+    limiter = RateLimiter(user=RATE_LIMIT_USER, chat=RATE_LIMIT_CHAT, total=RATE_LIMIT_GLOBAL)
+    stats = HandlerStats()
+    application.bot_data[RATE_LIMITER_KEY] = limiter
+    application.bot_data[HANDLER_STATS_KEY] = stats
     for name, method in COMMAND_HANDLERS.items():
-        application.add_handler(CommandHandler(name, method))
+        application.add_handler(CommandHandler(name, rate_limited(timed(method, stats, name), limiter)))
 
     # todo replace with actual bot response
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, echo))
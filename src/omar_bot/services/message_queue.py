@@ -0,0 +1,178 @@
+"""
+This class sends messages through a rate-shaped outbound queue
+"""
+import asyncio
+import itertools
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from telegram import Bot
+from telegram.error import BadRequest, NetworkError, RetryAfter
+from omar_bot.utils.rate_limit import TokenBuckets
+
+
+logger = logging.getLogger(__name__)
+
+
+# Priority lanes, lower is sent first
+INTERACTIVE = 0
+BROADCAST = 1
+
+
+class _Message:
+    """A message waiting in the queue."""
+    __slots__ = ("chat_id", "text", "kwargs", "future", "attempts")
+
+    def __init__(self, chat_id: int, text: str, kwargs: Dict[str, Any], future: asyncio.Future):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.future = future
+        self.attempts = 0
+
+
+class MessageQueue:
+    """
+    Sends messages without exceeding Telegram's flood limits.
+
+    Every message needs a token from its chat's bucket and from the
+    global bucket. Messages are taken in priority order (INTERACTIVE
+    before BROADCAST, then first come first served); a message whose
+    chat has no token left is put back until it has one, so one busy
+    chat never holds up the others. On a RetryAfter error all sending
+    pauses for the time asked by Telegram and the message is retried;
+    network errors are retried with an exponential backoff.
+
+    send() returns a future resolved with the sent Message, or with the
+    error once the message is given up. The queue starts with the first
+    message; stop() lets the queued messages go out for a while, then
+    cancels the rest.
+    """
+    def __init__(self, bot: Bot, chat: Tuple[float, float] = (1.0, 3.0),
+                 total: Tuple[float, float] = (25.0, 25.0), max_in_flight: int = 8,
+                 max_retries: int = 3, retry_delay: float = 1.0):
+        """
+        :param bot: bot sending the messages
+        :param chat: (messages per second, burst) of each chat
+        :param total: (messages per second, burst) of the whole bot
+        :param max_in_flight: number of requests sent at the same time
+        :param max_retries: attempts after a network error before giving up
+        :param retry_delay: seconds before the first retry, doubled at each attempt
+        """
+        self.bot = bot
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._chat = TokenBuckets(*chat)
+        self._total = TokenBuckets(*total)
+        self._max_in_flight = max_in_flight
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._queue: Optional[asyncio.PriorityQueue] = None  # (priority, sequence number, message)
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._pending = set()  # Futures of the messages not sent nor given up yet
+        self._deliveries = set()  # Running send tasks, referenced until they finish
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def send(self, chat_id: int, text: str, priority: int = INTERACTIVE, **kwargs) -> asyncio.Future:
+        """
+        Queue a message, the keyword arguments are passed to bot.send_message().
+        :return: future of the sent Message
+        """
+        if self._dispatcher is None:
+            self._queue = asyncio.PriorityQueue()
+            self._in_flight = asyncio.Semaphore(self._max_in_flight)
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(self._done)
+        self._pending.add(future)
+        self._queue.put_nowait((priority, next(self._seq), _Message(chat_id, text, kwargs, future)))
+        return future
+
+    def broadcast(self, chat_ids: Iterable[int], text: str, **kwargs) -> List[asyncio.Future]:
+        """Queue the same message to several chats, in the broadcast lane."""
+        return [self.send(chat_id, text, BROADCAST, **kwargs) for chat_id in chat_ids]
+
+    def pending(self) -> int:
+        """Number of messages not sent nor given up yet."""
+        return len(self._pending)
+
+    def _done(self, future: asyncio.Future) -> None:
+        self._pending.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            self.failed += 1  # Retrieving the exception also silences asyncio's warning
+
+    async def _dispatch(self) -> None:
+        """Take the messages in order and send each one when the budgets allow it."""
+        loop = asyncio.get_running_loop()
+        while True:
+            entry = await self._queue.get()
+            message = entry[2]
+            if message.future.done():
+                continue  # Cancelled by the sender
+            now = time.monotonic()
+            wait = max(self._paused_until - now, self._total.wait_time(None, now))
+            if wait > 0:
+                self._queue.put_nowait(entry)  # A more urgent message may arrive meanwhile
+                await asyncio.sleep(wait)
+                continue
+            wait = self._chat.wait_time(message.chat_id, now)
+            if wait > 0:
+                loop.call_later(wait, self._queue.put_nowait, entry)
+                continue
+            self._total.take(None, now)
+            self._chat.take(message.chat_id, now)
+            await self._in_flight.acquire()
+            task = loop.create_task(self._deliver(entry))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, entry: Tuple[int, int, _Message]) -> None:
+        """Send one message, scheduling a retry if it can be retried."""
+        message = entry[2]
+        try:
+            result = await self.bot.send_message(message.chat_id, message.text, **message.kwargs)
+        except RetryAfter as e:
+            self.retried += 1
+            delay = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            logger.warning("Flood limit reached, pausing the message queue for %s s.", delay)
+            self._queue.put_nowait(entry)
+        except BadRequest as e:  # A NetworkError, but retrying would fail the same way
+            self._give_up(message, e)
+        except NetworkError as e:
+            if message.attempts >= self.max_retries:
+                self._give_up(message, e)
+            else:
+                self.retried += 1
+                delay = self.retry_delay * 2 ** message.attempts
+                message.attempts += 1
+                asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, entry)
+        except Exception as e:
+            self._give_up(message, e)
+        else:
+            self.sent += 1
+            if not message.future.done():
+                message.future.set_result(result)
+        finally:
+            self._in_flight.release()
+
+    @staticmethod
+    def _give_up(message: _Message, error: Exception) -> None:
+        logger.warning("Could not send a message to chat %s: %s", message.chat_id, error)
+        if not message.future.done():
+            message.future.set_exception(error)
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Wait up to timeout seconds for the queued messages, then cancel the rest."""
+        if self._dispatcher is None:
+            return
+        if self._pending:
+            await asyncio.wait(list(self._pending), timeout=timeout)
+        for future in list(self._pending):
+            future.cancel()
+        self._dispatcher.cancel()
+        self._dispatcher = None
@@ -0,0 +1,175 @@
+""" This class implements the canvases of /place:
+grids of the IDs of the users who placed each tile,
+and their rendering with the emoji of each user.
+"""
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+from omar_bot.config.settings import CANVAS_DIR
+from omar_bot.services.user_service import UserService
+
+
+logger = logging.getLogger(__name__)
+
+
+EMPTY = 0  # Value of a tile nobody placed
+EMPTY_TILE = "⬜"  # Shown for the free tiles
+UNKNOWN_TILE = "⬛"  # Shown for the tiles of users who no longer exist
+
+
+def canvas_name(value: str) -> str:
+    """Name of a canvas from the "canvas" field of a user ("default.csv" -> "default")."""
+    return Path(value).stem
+
+
+class Canvas:
+    """
+    Grid of user IDs in an int64 NumPy array, EMPTY for the free tiles.
+    x is the column and y the row, both starting from 0.
+
+    A canvas is first read from its CSV file in CANVAS_DIR (one row per line),
+    then kept in a .npy file beside it, opened as a memory map: place() only
+    changes one value of the mapped file, which the OS writes back, and flush()
+    forces it to disk. The CSV file is never rewritten, see to_csv() to export.
+    """
+    def __init__(self, grid: np.ndarray, name: str = "default"):
+        """
+        :param grid: 2D array of user IDs, rows first
+        :param name: name of the canvas, for the messages
+        """
+        if grid.ndim != 2:
+            raise ValueError(f"A canvas is a 2D grid, got {grid.ndim} dimensions.")
+        self.grid = grid
+        self.name = name
+        self.row_versions = np.zeros(grid.shape[0], dtype=np.int64)  # Placements in each row
+        self.version = 0  # Placements on the whole canvas
+
+    @classmethod
+    def load(cls, name: str, canvas_dir: Path = None) -> "Canvas":
+        """
+        Opens the canvas <name>.npy of canvas_dir, creating it from <name>.csv the first time.
+        Raises FileNotFoundError if neither exists.
+        """
+        canvas_dir = canvas_dir or CANVAS_DIR
+        npy_path = canvas_dir / f"{name}.npy"
+        if not npy_path.exists():
+            grid = np.loadtxt(canvas_dir / f"{name}.csv", delimiter=",", dtype=np.int64, ndmin=2)
+            tmp_path = npy_path.with_suffix(".npy.tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, grid)
+            os.replace(tmp_path, npy_path)
+            logger.info("Converted canvas %s to %s.", name, npy_path.name)
+        return cls(np.load(npy_path, mmap_mode="r+"), name)
+
+    @property
+    def width(self) -> int:
+        return self.grid.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.grid.shape[0]
+
+    def in_bounds(self, x: int, y: int) -> bool:
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def _check(self, x: int, y: int) -> None:
+        if not self.in_bounds(x, y):
+            raise IndexError(f"Tile ({x}, {y}) is outside the {self.width}x{self.height} canvas {self.name}.")
+
+    def get(self, x: int, y: int) -> int:
+        """Returns the ID of the user who placed the tile, EMPTY if nobody did."""
+        self._check(x, y)
+        return int(self.grid[y, x])
+
+    def place(self, x: int, y: int, user_id: int) -> int:
+        """
+        Places a tile of the user, replacing the previous one.
+        Raises IndexError outside the canvas (negative coordinates included).
+        :return: ID of the previous owner of the tile, EMPTY if it was free
+        """
+        self._check(x, y)
+        previous = int(self.grid[y, x])
+        self.grid[y, x] = user_id
+        self.row_versions[y] += 1
+        self.version += 1
+        return previous
+
+    def flush(self) -> None:
+        """Forces the placed tiles to disk."""
+        if isinstance(self.grid, np.memmap):
+            self.grid.flush()
+
+    def to_csv(self, path: Path) -> None:
+        """Exports the grid in the CSV format of CANVAS_DIR."""
+        np.savetxt(path, self.grid, fmt="%d", delimiter=",")
+
+
+class CanvasRenderer:
+    """
+    Renders a canvas as text, one emoji per tile: the emoji of the user who
+    placed it, EMPTY_TILE for a free one.
+
+    The rendered rows are cached. A render redraws only the rows with a
+    placement since the last one (from Canvas.row_versions) and the rows
+    with a tile of a user whose emoji changed (checked only when the emoji
+    version of the user service changed); an unchanged canvas is served
+    from the cache. The emojis are looked up once per distinct user of the
+    redrawn rows, then spread over the tiles with NumPy indexing.
+    """
+    def __init__(self, canvas: Canvas, user_service: UserService):
+        """
+        :param canvas: canvas to render
+        :param user_service: UserService holding the emoji of the users
+        """
+        self.canvas = canvas
+        self.user_service = user_service
+        self._rows: List[str] = []
+        self._row_versions = None  # Canvas.row_versions at the last render
+        self._emojis: Dict[int, str] = {}  # {user ID: emoji} of the users on the rendered rows
+        self._key = None  # (canvas version, user service version) of the cached text
+        self._text = ""
+        self.rendered_rows = 0  # Rows redrawn since the start, for the stats
+
+    def _emoji(self, user_id: int) -> str:
+        if user_id == EMPTY:
+            return EMPTY_TILE
+        return self.user_service.get(user_id, "emoji") or UNKNOWN_TILE
+
+    def _render_rows(self, rows: np.ndarray) -> None:
+        """Redraw the given rows with a lookup table of the emojis of their users."""
+        tiles = self.canvas.grid[rows]
+        user_ids, inverse = np.unique(tiles, return_inverse=True)
+        table = np.array([self._emoji(int(user_id)) for user_id in user_ids], dtype=object)
+        self._emojis.update(zip(user_ids.tolist(), table.tolist()))
+        for row, emojis in zip(rows.tolist(), table[inverse].reshape(tiles.shape)):
+            self._rows[row] = "".join(emojis)
+        self.rendered_rows += len(rows)
+
+    def _changed_emoji_rows(self) -> np.ndarray:
+        """Rows with a tile of a user whose emoji changed since it was drawn."""
+        changed = [user_id for user_id, emoji in self._emojis.items() if self._emoji(user_id) != emoji]
+        if not changed:
+            return np.empty(0, dtype=np.intp)
+        return np.flatnonzero(np.isin(self.canvas.grid, changed).any(axis=1))
+
+    def render(self) -> str:
+        """Returns the canvas as lines of emojis, redrawing only what changed."""
+        key = (self.canvas.version, self.user_service.version("emoji"))
+        if key == self._key:
+            return self._text
+        if self._row_versions is None or len(self._rows) != self.canvas.height:
+            self._rows = [""] * self.canvas.height
+            self._emojis.clear()
+            dirty = np.arange(self.canvas.height)
+        else:
+            dirty = np.flatnonzero(self.canvas.row_versions != self._row_versions)
+            if key[1] != self._key[1]:
+                dirty = np.union1d(dirty, self._changed_emoji_rows())
+        if len(dirty):
+            self._render_rows(dirty)
+        self._row_versions = self.canvas.row_versions.copy()
+        self._key = key
+        self._text = "\n".join(self._rows)
+        return self._text
@@ -0,0 +1,40 @@
+"""
+This class caches rendered replies until the data they show changes
+"""
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class RenderCache:
+    """
+    Keeps the last rendered value of each named view with the data
+    version it was built from (e.g. UserService.version("gems")).
+    get() only calls the builder when the version differs, so repeated
+    requests between changes cost a dict lookup.
+    """
+    def __init__(self):
+        self._entries: Dict[str, Tuple[Hashable, Any]] = {}  # {name: (version, value)}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name: str, version: Hashable, build: Callable[[], Any]) -> Any:
+        """
+        Return the cached value of a view, rebuilding it if its data changed.
+        :param name: name of the view
+        :param version: version of the data the view is built from
+        :param build: function building the value
+        """
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        value = build()
+        self._entries[name] = (version, value)
+        return value
+
+    def invalidate(self, name: str = None) -> None:
+        """Drop one view, or all of them if no name is given."""
+        if name is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(name, None)
@@ -3,7 +3,8 @@ service for the users designated as santa.
 """
 import logging
 import random
-from typing import List, Tuple
+import re
+from typing import Collection, Dict, List, Set, Tuple
 from datetime import datetime
 from omar_bot.services.user_service import UserService
 
@@ -11,20 +12,154 @@ from omar_bot.services.user_service import UserService
 logger = logging.getLogger(__name__)
 
 
+MAX_SEARCH_STEPS = 200_000  # Bound of the exhaustive search, reached only with many constraints
+
+
+def _search_cycle(order: List[int], allowed) -> List[int] | None:
+    """
+    Depth-first search of a cycle through all the participants, trying them in
+    the given order. Returns the cycle, or None if there is none (or none was
+    found within MAX_SEARCH_STEPS).
+    """
+    first = order[0]
+    path = [first]
+    used = {first}
+    candidates = [iter(order)]  # Receivers left to try after each participant of the path
+    for _ in range(MAX_SEARCH_STEPS):
+        if not candidates:
+            return None
+        for receiver in candidates[-1]:
+            if receiver in used or not allowed(path[-1], receiver):
+                continue
+            if len(path) + 1 == len(order):
+                if allowed(receiver, first):
+                    return path + [receiver]
+                continue
+            path.append(receiver)
+            used.add(receiver)
+            candidates.append(iter(order))
+            break
+        else:  # Dead end, backtrack
+            candidates.pop()
+            used.discard(path.pop())
+    logger.warning("No Secret Santa cycle found within %s search steps.", MAX_SEARCH_STEPS)
+    return None
+
+
+def assign_cycle(participants: List[int], rng: random.Random,
+                 forbidden: Collection[Tuple[int, int]] = frozenset()) -> List[Tuple[int, int]]:
+    """
+    Shuffles the participants into a single gift cycle: each one gives to the
+    next and the last to the first, so with 2 or more nobody draws themselves.
+    A forbidden (giver, receiver) pair is avoided by swapping in a later
+    participant, or else by moving one between two earlier ones; with few
+    forbidden pairs per participant this stays linear. When these local
+    repairs get stuck, a bounded backtracking search takes over, so a cycle
+    is found whenever one exists (small or moderately constrained groups).
+    Returns the (giver, receiver) pairs, or [] if there is no valid cycle.
+    """
+    order = list(participants)
+    rng.shuffle(order)
+    n = len(order)
+    if n < 2:
+        return []
+
+    def allowed(giver, receiver):
+        return giver != receiver and (giver, receiver) not in forbidden
+
+    def move_before(j, end):
+        """Move order[j] between two consecutive participants of order[:end] that accept it."""
+        for k in range(1, end):
+            if allowed(order[k - 1], order[j]) and allowed(order[j], order[k]):
+                order.insert(k, order.pop(j))
+                return True
+        return False
+
+    def repair() -> bool:
+        """Fix the forbidden pairs of order in place, False if stuck."""
+        for i in range(1, n):
+            if allowed(order[i - 1], order[i]):
+                continue
+            j = next((j for j in range(i + 1, n) if allowed(order[i - 1], order[j])), None)
+            if j is not None:
+                order[i], order[j] = order[j], order[i]
+            elif not any(move_before(j, i) for j in range(i, n)):
+                return False
+
+        if not allowed(order[-1], order[0]):
+            # Close the cycle by swapping the last participant with an earlier one, or moving it
+            last = order[-1]
+            for j in range(1, n - 1):
+                candidate = order[j]
+                if (allowed(order[j - 1], last) and allowed(last, order[j + 1])
+                        and (j + 1 == n - 1 or allowed(order[-2], candidate)) and allowed(candidate, order[0])):
+                    order[j], order[-1] = last, candidate
+                    break
+            else:
+                return n > 2 and allowed(order[-2], order[0]) and move_before(n - 1, n - 1)
+        return True
+
+    if not repair():
+        order = _search_cycle(order, allowed)
+        if order is None:
+            return []
+    return [(order[i], order[(i + 1) % n]) for i in range(n)]
+
+
+GROUP_NAME_PATTERN = re.compile(r"[a-z0-9]{1,32}")
+RESERVED_GROUP_NAMES = {"pair", "history", "exclude"}  # "santa_<name>" is already a field
+
+
+def group_key(group: str = None) -> str:
+    """
+    Returns the user attribute of a santa group: "santa" for the default group,
+    "santa_<group>" for a named one. Raises ValueError for an invalid name.
+    """
+    if not group:
+        return "santa"
+    group = group.lower()
+    if not GROUP_NAME_PATTERN.fullmatch(group) or group in RESERVED_GROUP_NAMES:
+        raise ValueError(f"Invalid santa group name: {group}")
+    return f"santa_{group}"
+
+
+def member_group_keys(user_service: UserService) -> Set[str]:
+    """Returns the attributes of the named groups with at least one member, in one pass over the users."""
+    keys = set()
+    for user_id in user_service.get_user_ids():
+        for key, value in user_service.get_user(user_id).items():
+            if (value is True and key.startswith("santa_") and key not in keys
+                    and GROUP_NAME_PATTERN.fullmatch(key[len("santa_"):])
+                    and key[len("santa_"):] not in RESERVED_GROUP_NAMES):
+                keys.add(key)
+    return keys
+
+
 class SantaService:
     """
     To determine the gift recipient, this class takes the list of all the users
     that are in that group (attribute value set to true). Then, the list is permuted
-    pseudo-randomly, where the seed is the current year.
+    pseudo-randomly by a private generator seeded with the year and the group name,
+    so the draw is the same all year long and the global random module is untouched.
 
     1) get the list of the members of the santa group
-    2) set random seed from current year
-    3) shuffle the list
+    2) seed a private random generator from the year and the group
+    3) shuffle the list, avoiding the excluded pairs and last year's pairs
     4) the recipient of each member is the next in the list
 
-    Every time the user uses the /santa command, the recipient is re-computed, because
-    a new member might have joined the group. Also, all the other members of the santa
-    group are also displayed.
+    Each group has its own attribute: "santa" for the default group and "santa_<name>"
+    for the named ones (see group_key()), and its pair in "<group>_pair". The participants
+    of a group are kept in a secondary index of the user service, updated on every join
+    and leave, so listing them does not scan all the users.
+
+    A user can list in "santa_exclude" the user IDs they must not be paired with,
+    in either direction. Each assigned recipient is also kept by year in the
+    "<group>_history" attribute, to avoid giving to the same person two years in a row.
+
+    The draw is kept in memory under (year, group, hash of the sorted participant IDs)
+    and only redone when that key changes, e.g. after a join, leave or reset: a query
+    is a dictionary lookup as long as the group field did not change. Also, all the
+    other members of the santa group are also displayed.
     """
     def __init__(self, user_service: UserService, key_name: str = "santa"):
         """
@@ -34,6 +169,13 @@ class SantaService:
         self.user_service = user_service
         self.logger = logger
         self.key_name = key_name
+        self.pair_key = f"{key_name}_pair"
+        self.history_key = f"{key_name}_history"
+        self._assignment = None  # (key, {giver: receiver}) of the last draw
+        self._names = []  # Usernames of the participants of the last draw
+        self._checked = None  # (year, user service version) when the draw was last known valid
+        if not user_service.lazy:  # Building the index would read every user file
+            user_service.add_index(key_name)
 
     def join_santa(self, user_id: int) -> bool:
         """Adds a user to the Secret Santa event."""
@@ -41,8 +183,10 @@ class SantaService:
         if not user_data:
             self.logger.warning("User %s not found, cannot join Secret Santa.", user_id)
             return False
-        self.user_service.set(user_id, self.key_name, True)
-        self.user_service.delete_attribute(user_id, "santa_pair")  # Clear previous pair
+        with self.user_service.batch():
+            self.user_service.set(user_id, self.key_name, True)
+            self.user_service.delete_attribute(user_id, self.pair_key)  # Clear previous pair
+        self._assignment = None
         self.logger.info("User %s joined Secret Santa.", user_id)
         return True
 
@@ -52,17 +196,16 @@ class SantaService:
         if not user_data:
             self.logger.warning("User %s not found, cannot leave Secret Santa.", user_id)
             return False
-        self.user_service.set(user_id, self.key_name, False)
-        self.user_service.delete_attribute(user_id, "santa_pair")
+        with self.user_service.batch():
+            self.user_service.set(user_id, self.key_name, False)
+            self.user_service.delete_attribute(user_id, self.pair_key)
+        self._assignment = None
         self.logger.info("User %s left Secret Santa.", user_id)
         return True
 
     def get_participants(self) -> List[int]:
         """Returns a list of user IDs participating in Secret Santa."""
-        participants = [
-            user_id for user_id in self.user_service.get_user_ids()
-            if self.user_service.get(user_id, self.key_name, False)
-        ]
+        participants = self.user_service.find(self.key_name, True)
         self.logger.debug("Secret Santa participants: %s", participants)
         return participants
 
@@ -73,81 +216,108 @@ class SantaService:
         self.logger.debug("Secret Santa participant names: %s", names)
         return names
 
-    def assign_pairs(self) -> List[Tuple[int, int]]:
+    def assign_pairs(self, year: int = None) -> List[Tuple[int, int]]:
         """
-        Assigns Secret Santa pairs randomly using the current year as the seed.
-        Ensures no user is assigned to themselves.
+        Assigns Secret Santa pairs randomly, the same way for the whole year.
+        Ensures no user is assigned to themselves nor to an excluded user, and
+        avoids last year's pairs unless there is no other way.
+        :param year: year of the draw, the current year by default
         Returns a list of (giver, receiver) tuples.
         """
         participants = self.get_participants()
         if len(participants) < 2:
             self.logger.warning("Not enough participants (%s) to assign Secret Santa pairs.",
                                 len(participants))
+            self._assignment = None
             return []
 
-        # Set random seed based on current year
-        current_year = datetime.now().year
-        random.seed(current_year)
-        self.logger.debug("Set random seed to current year: %s", current_year)
-
-        # Shuffle participants and create pairs
-        participants_shuffled = participants.copy()
-        random.shuffle(participants_shuffled)
-        n = len(participants_shuffled)
-        pairs = []
-        for i in range(n):
-            giver = participants_shuffled[i]
-            receiver = participants_shuffled[(i + 1) % n]  # Circular assignment
-            pairs.append((giver, receiver))
-
-        # Check for self-assignments and retry if necessary
-        max_attempts = 10
-        attempt = 0
-        while any(giver == receiver for giver, receiver in pairs) and attempt < max_attempts:
-            random.seed(current_year)  # Reset seed for consistency
-            random.shuffle(participants_shuffled)
-            pairs = [(participants_shuffled[i], participants_shuffled[(i + 1) % n]) for i in range(n)]
-            attempt += 1
-
-        if any(giver == receiver for giver, receiver in pairs):
-            self.logger.error("Failed to assign valid Secret Santa pairs after %s attempts.", max_attempts)
+        year = year or datetime.now().year
+        seed = f"{year}:{self.key_name}"
+        excluded = self._excluded_pairs(participants)
+        previous = self._previous_pairs(participants, year)
+        pairs = assign_cycle(participants, random.Random(seed), excluded | previous)
+        if not pairs and previous:
+            self.logger.warning("Cannot avoid last year's Secret Santa pairs, allowing them.")
+            pairs = assign_cycle(participants, random.Random(seed), excluded)
+        if not pairs:
+            self.logger.error("No valid Secret Santa pairs for the %s participants.", len(participants))
+            self._assignment = None
             return []
 
-        # Save pairs to user data
-        for giver, receiver in pairs:
-            self.user_service.set(giver, "santa_pair", receiver)
-            self.logger.info("Assigned %s to give to %s.", giver, receiver)
+        # Save pairs to user data, only the ones that changed
+        with self.user_service.batch():
+            for giver, receiver in pairs:
+                if self.user_service.get(giver, self.pair_key) != receiver:
+                    self.user_service.set(giver, self.pair_key, receiver)
+                    self.logger.info("Assigned %s to give to %s.", giver, receiver)
+                history = self.user_service.get(giver, self.history_key) or {}
+                if history.get(str(year)) != receiver:
+                    self.user_service.set(giver, self.history_key, {**history, str(year): receiver})
 
-        self.logger.info("Secret Santa pairs assigned: %s", pairs)
+        self._assignment = (self._assignment_key(participants, year), dict(pairs))
+        self._names = [self.user_service.get(user_id, "username") for user_id in participants]
+        self.logger.debug("Secret Santa pairs assigned: %s", pairs)
         return pairs
 
+    def _excluded_pairs(self, participants: List[int]) -> Set[Tuple[int, int]]:
+        """(giver, receiver) pairs excluded by the "santa_exclude" lists, in both directions."""
+        pairs = set()
+        for user_id in participants:
+            for other in self.user_service.get(user_id, "santa_exclude") or ():
+                pairs.add((user_id, other))
+                pairs.add((other, user_id))
+        return pairs
+
+    def _previous_pairs(self, participants: List[int], year: int) -> Set[Tuple[int, int]]:
+        """(giver, receiver) pairs of the year before."""
+        pairs = set()
+        for user_id in participants:
+            receiver = (self.user_service.get(user_id, self.history_key) or {}).get(str(year - 1))
+            if receiver is not None:
+                pairs.add((user_id, receiver))
+        return pairs
+
+    def _assignment_key(self, participants: List[int], year: int) -> Tuple[int, str, int]:
+        """Key of a draw: (year, group, hash of the sorted participant IDs)."""
+        return year, self.key_name, hash(tuple(sorted(participants)))
+
+    def get_assignment(self, year: int = None) -> Dict[int, int]:
+        """
+        Returns the {giver: receiver} draw of the current participants,
+        reusing the last one unless the participants changed.
+        """
+        year = year or datetime.now().year
+        version = self.user_service.version(self.key_name, "username")
+        if self._assignment is not None and self._checked == (year, version):
+            return self._assignment[1]
+        participants = self.get_participants()
+        if self._assignment is None or self._assignment[0] != self._assignment_key(participants, year):
+            self.assign_pairs(year)
+        else:  # Same participants, a username may have changed
+            self._names = [self.user_service.get(user_id, "username") for user_id in participants]
+        self._checked = (year, version)
+        return self._assignment[1] if self._assignment else {}
+
     def get_pair(self, user_id: int) -> Tuple[int | None, List[str]]:
         """
         Returns the user ID of the giftee assigned to the given user and the list of participant usernames.
-        Recomputes pairs dynamically to account for new participants.
+        The pairs are drawn again only when the participants changed.
         """
         if not self.user_service.get_user(user_id):
             self.logger.warning("User %s not found, cannot get Secret Santa pair.", user_id)
             return None, []
 
-        # Recompute pairs to ensure up-to-date assignments
-        pairs = self.assign_pairs()
-        if not pairs:
+        assignment = self.get_assignment()
+        if not assignment:
             self.logger.warning("No valid Secret Santa pairs available for user %s.", user_id)
             return None, self.get_participant_names()
-
-        # Find the user's giftee
-        giftee_id = None
-        for giver, receiver in pairs:
-            if giver == user_id:
-                giftee_id = receiver
-                break
-
-        return giftee_id, self.get_participant_names()
+        return assignment.get(user_id), list(self._names)
 
     def reset_santa(self) -> None:
         """Resets the Secret Santa event by clearing all pairings and participation."""
-        for user_id in self.user_service.get_user_ids():
-            self.user_service.set(user_id, self.key_name, False)
-            self.user_service.delete_attribute(user_id, "santa_pair")
+        with self.user_service.batch():
+            for user_id in self.get_participants():
+                self.user_service.set(user_id, self.key_name, False)
+                self.user_service.delete_attribute(user_id, self.pair_key)
+        self._assignment = None
         self.logger.info("Secret Santa event reset.")
@@ -0,0 +1,230 @@
+"""
+Compact, column-oriented storage of the users kept in memory
+"""
+import sys
+from collections.abc import MutableMapping
+from typing import Dict, Any, List, Optional
+import numpy as np
+
+
+# Fields stored in NumPy columns, with the Python type that fits the column
+COLUMN_FIELDS = {
+    "gems": int,
+    "gold": int,
+    "tiles_count": int,
+    "admin": bool,
+    "santa": bool,
+}
+
+INT64_MIN = np.iinfo(np.int64).min
+INT64_MAX = np.iinfo(np.int64).max
+
+
+def _fits_column(key: str, value: Any) -> bool:
+    """True if the value can be stored in the column of the field."""
+    kind = COLUMN_FIELDS[key]
+    if type(value) is not kind:
+        return False
+    return kind is bool or INT64_MIN <= value <= INT64_MAX
+
+
+def _intern(value: Any) -> Any:
+    """Share a single copy of equal strings (emoji, canvas names, ...)."""
+    return sys.intern(value) if type(value) is str else value
+
+
+class UserView(MutableMapping):
+    """
+    Dict-like view of one user stored in a ColumnarUserMap.
+    Reads and writes go straight to the table. The view is no longer
+    valid once the user is deleted.
+    """
+    __slots__ = ("_table", "_slot")
+
+    def __init__(self, table: "ColumnarUserMap", slot: int):
+        self._table = table
+        self._slot = slot
+
+    def __getitem__(self, key):
+        return self._table.get_field(self._slot, key)
+
+    def __setitem__(self, key, value):
+        self._table.set_field(self._slot, key, value)
+
+    def __delitem__(self, key):
+        self._table.delete_field(self._slot, key)
+
+    def __contains__(self, key):
+        return self._table.has_field(self._slot, key)
+
+    def __iter__(self):
+        return iter(self._table.field_names(self._slot))
+
+    def __len__(self):
+        return len(self._table.field_names(self._slot))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class ColumnarUserMap(MutableMapping):
+    """
+    Mapping {user_id: user data} that stores the users column by column.
+
+    Every user gets a dense slot. The fields in COLUMN_FIELDS live in
+    NumPy arrays indexed by slot, with a mask telling whether the user
+    has the field; values that do not fit the column (e.g. a float in
+    "gems") and all the other fields go in a small per-user dict, with
+    string values interned. Values are returned as plain Python objects.
+    The numeric columns allow vectorized totals, filters and top-K; the
+    slots holding a column field in their extras are tracked, so that
+    the queries merge those values in.
+    """
+    def __init__(self, capacity: int = 64):
+        self._slots: Dict[int, int] = {}  # {user_id: slot}
+        self._free: List[int] = []  # Slots of deleted users, to be reused
+        self._ids = np.zeros(capacity, dtype=np.int64)  # User ID of each slot
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._columns = {key: np.zeros(capacity, dtype=np.int64 if kind is int else bool)
+                         for key, kind in COLUMN_FIELDS.items()}
+        self._present = {key: np.zeros(capacity, dtype=bool) for key in COLUMN_FIELDS}
+        self._extras: List[Optional[dict]] = [None] * capacity
+        self._extra_slots = {key: set() for key in COLUMN_FIELDS}  # Slots with the field in their extras
+
+    # --- Mapping interface ---
+
+    def __getitem__(self, user_id):
+        return UserView(self, self._slots[user_id])
+
+    def __setitem__(self, user_id, data):
+        """Store a user, replacing their previous data."""
+        data = dict(data)  # data may be a view of this very user
+        slot = self._slots.get(user_id)
+        if slot is None:
+            slot = self._new_slot()
+            self._slots[user_id] = slot
+            self._ids[slot] = user_id
+            self._alive[slot] = True
+        for key in COLUMN_FIELDS:
+            self._present[key][slot] = False
+            self._extra_slots[key].discard(slot)
+        self._extras[slot] = {}
+        for key, value in data.items():
+            self.set_field(slot, key, value)
+
+    def __delitem__(self, user_id):
+        slot = self._slots.pop(user_id)
+        self._alive[slot] = False
+        for key in COLUMN_FIELDS:
+            self._present[key][slot] = False
+            self._extra_slots[key].discard(slot)
+        self._extras[slot] = None
+        self._free.append(slot)
+
+    def __contains__(self, user_id):
+        return user_id in self._slots
+
+    def __iter__(self):
+        return iter(self._slots)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def setdefault(self, user_id, default=None):
+        if user_id not in self._slots:
+            self[user_id] = default if default is not None else {}
+        return self[user_id]
+
+    def _new_slot(self) -> int:
+        """Return a free slot, growing the arrays if needed."""
+        if self._free:
+            return self._free.pop()
+        slot = len(self._slots)
+        capacity = len(self._ids)
+        if slot >= capacity:
+            new_capacity = capacity * 2
+            self._ids = np.resize(self._ids, new_capacity)
+            self._alive = np.concatenate([self._alive, np.zeros(capacity, dtype=bool)])
+            for key in COLUMN_FIELDS:
+                self._columns[key] = np.resize(self._columns[key], new_capacity)
+                self._present[key] = np.concatenate([self._present[key], np.zeros(capacity, dtype=bool)])
+            self._extras.extend([None] * capacity)
+        return slot
+
+    # --- Field access, used by UserView ---
+
+    def get_field(self, slot: int, key: str) -> Any:
+        if key in COLUMN_FIELDS and self._present[key][slot]:
+            return COLUMN_FIELDS[key](self._columns[key][slot])
+        return self._extras[slot][key]
+
+    def set_field(self, slot: int, key: str, value: Any) -> None:
+        key = sys.intern(key)
+        if key in COLUMN_FIELDS:
+            if _fits_column(key, value):
+                self._columns[key][slot] = value
+                self._present[key][slot] = True
+                self._extras[slot].pop(key, None)
+                self._extra_slots[key].discard(slot)
+                return
+            self._present[key][slot] = False
+            self._extra_slots[key].add(slot)
+        self._extras[slot][key] = _intern(value)
+
+    def delete_field(self, slot: int, key: str) -> None:
+        if key in COLUMN_FIELDS and self._present[key][slot]:
+            self._present[key][slot] = False
+        else:
+            del self._extras[slot][key]
+            if key in COLUMN_FIELDS:
+                self._extra_slots[key].discard(slot)
+
+    def has_field(self, slot: int, key: str) -> bool:
+        if key in COLUMN_FIELDS and self._present[key][slot]:
+            return True
+        return key in self._extras[slot]
+
+    def field_names(self, slot: int) -> list:
+        names = [key for key in COLUMN_FIELDS if self._present[key][slot]]
+        return names + list(self._extras[slot])
+
+    # --- Vectorized queries ---
+
+    def column(self, key: str):
+        """Return (user IDs, values) of the users holding the field in its column."""
+        mask = self._alive & self._present[key]
+        return self._ids[mask], self._columns[key][mask]
+
+    def extras(self, key: str) -> list:
+        """Return [(user ID, value)] of the users holding the field outside its column."""
+        return [(int(self._ids[slot]), self._extras[slot][key]) for slot in self._extra_slots[key]]
+
+    def total(self, key: str) -> Any:
+        """Sum of a numeric field over all users."""
+        return int(self.column(key)[1].sum()) + sum(value or 0 for _, value in self.extras(key))
+
+    def nonzero_ids(self, key: str) -> list:
+        """Sorted IDs of the users with a non-zero (truthy) value of the field."""
+        ids, values = self.column(key)
+        ids = ids[values != 0].tolist()
+        ids.extend(user_id for user_id, value in self.extras(key) if value)
+        return sorted(ids)
+
+    def top_ids(self, key: str, n: int) -> list:
+        """IDs of the n users with the highest value, ties broken by lower ID."""
+        ids, values = self.column(key)
+        if n <= 0:
+            return []
+        if n < len(values):
+            # Keep everything at least as large as the n-th largest value
+            threshold = np.partition(values, len(values) - n)[len(values) - n]
+            keep = values >= threshold
+            ids, values = ids[keep], values[keep]
+        order = np.lexsort((ids, -values))[:n]
+        if not self._extra_slots[key]:
+            return ids[order].tolist()
+        # Merge the numbers that did not fit the column (floats, huge ints)
+        ranked = list(zip(values[order].tolist(), ids[order].tolist()))
+        ranked += [(value, user_id) for user_id, value in self.extras(key)
+                   if isinstance(value, (int, float)) and not isinstance(value, bool) and value == value]
+        return [user_id for _, user_id in sorted(ranked, key=lambda entry: (-entry[0], entry[1]))[:n]]
@@ -0,0 +1,293 @@
+"""
+This class handles user data stored in a single append-only log
+"""
+import bisect
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, List
+from omar_bot.config.settings import USERS_LOG_PATH
+from omar_bot.services.user_service import UserService
+
+try:
+    import fcntl
+except ImportError:  # Windows: no locking, a single process must write the log
+    fcntl = None
+
+
+class LogUserService(UserService):
+    """
+    Manages user data using a single append-only log file.
+
+    Drop-in replacement for UserService: instead of rewriting one JSON
+    file per user, every change is appended to the log as one line.
+    Each line is a JSON record:
+        {"id": 123, "put": {...}}           full user data
+        {"id": 123, "set": {"gems": 10}}    changed fields
+        {"id": 123, "del": ["santa_pair"]}  removed fields
+        {"id": 123, "drop": true}           deleted user
+    On startup the log is replayed. The offsets of the records of each
+    user are kept in memory; when the log holds too many superseded
+    records it is compacted into a single "put" per user.
+    refresh() replays only the records appended since the last read.
+
+    Several processes can share the log (e.g. the bot and the console):
+    appends, compactions and the truncation of a torn record on load are
+    done under an exclusive flock of <log>.lock, and a compaction first
+    replays the records appended by the others.
+    """
+    def __init__(self, users_dir: Path = None, log_path: Path = None,
+                 compact_min_records: int = 1000, compact_ratio: float = 4.0, **kwargs):
+        """
+        :param users_dir: directory of the log, if log_path is not given
+        :param log_path: path of the log file
+        :param compact_min_records: never compact logs shorter than this
+        :param compact_ratio: compact when there are more than this many records per user
+        :param kwargs: the other UserService options (write_behind, fsync, ...)
+        """
+        if log_path is None:
+            log_path = users_dir / USERS_LOG_PATH.name if users_dir else USERS_LOG_PATH
+        self.log_path = Path(log_path)
+        self.compact_min_records = compact_min_records
+        self.compact_ratio = compact_ratio
+        self._offsets: Dict[int, List[int]] = {}  # {user_id: offsets of their records}
+        self._n_records = 0
+        self._changed = {}  # {user_id: changed keys, None if the whole user changed}
+        self._applied_offset = 0  # End of the last record applied to memory
+        self._log_ino = None  # Inode of the log, changes when it is compacted
+        self.lock_path = self.log_path.with_name(self.log_path.name + ".lock")
+        self._lock_file = None  # Open while this instance holds the lock
+        super().__init__(users_dir=self.log_path.parent, **kwargs)
+
+    def _load_all(self) -> None:
+        """Replay the log into memory."""
+        self._users.clear()
+        self._offsets.clear()
+        self._n_records = 0
+        self._applied_offset = 0
+        self._log_ino = None
+        if not self.log_path.exists():
+            return
+        with self._locked():
+            self._replay()
+
+    @contextmanager
+    def _locked(self):
+        """Hold the exclusive lock of the log, shared by all the processes writing it. Reentrant."""
+        if fcntl is None or self._lock_file is not None:
+            yield
+            return
+        with open(self.lock_path, "ab") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            self._lock_file = f
+            try:
+                yield
+            finally:
+                self._lock_file = None
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _replay(self, skip=(), truncate_torn: bool = True) -> set:
+        """
+        Apply the records appended after the last applied one.
+        :param skip: IDs of users whose records must not change the memory
+        :param truncate_torn: cut off an incomplete last record, instead of
+            assuming that another process is still writing it
+        :return: IDs of the users changed
+        """
+        offset = self._applied_offset
+        changed = set()
+        torn = False
+        with open(self.log_path, "rb") as f:
+            self._log_ino = os.fstat(f.fileno()).st_ino
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    torn = True  # The last append was interrupted, or is in progress
+                    break
+                try:
+                    record = json.loads(line)
+                    user_id = record["id"]
+                    if user_id not in skip:
+                        self._apply_indexed(record, offset)
+                        changed.add(user_id)
+                except (ValueError, KeyError) as e:
+                    raise RuntimeError(f"Failed to load user log record at offset {offset}") from e
+                offset += len(line)
+        if torn and truncate_torn:
+            os.truncate(self.log_path, offset)
+        self._applied_offset = offset
+        return changed
+
+    def _apply_indexed(self, record: Dict[str, Any], offset: int) -> None:
+        """Apply a log record, keeping the secondary indexes and rankings in sync."""
+        user_id = record["id"]
+        if not self._indexes and not self._rankings:
+            self._apply(record, offset)
+            return
+        if user_id in self._users:
+            self._untrack(user_id)
+        self._apply(record, offset)
+        if user_id in self._users:
+            self._track(user_id)
+
+    def _apply(self, record: Dict[str, Any], offset: int) -> None:
+        """Apply a log record to the in-memory data."""
+        user_id = record["id"]
+        if "drop" in record:
+            self._users.pop(user_id, None)
+            self._offsets.pop(user_id, None)
+        elif "put" in record:
+            self._users[user_id] = record["put"]
+            later = [o for o in self._offsets.get(user_id, []) if o > offset]
+            self._offsets[user_id] = [offset] + later
+        else:
+            user = self._users.setdefault(user_id, {})
+            user.update(record.get("set", {}))
+            for key in record.get("del", ()):
+                user.pop(key, None)
+            offsets = self._offsets.setdefault(user_id, [])
+            if offset not in offsets:
+                bisect.insort(offsets, offset)
+        self._n_records += 1
+
+    def _encode(self, data: Dict[str, Any]) -> str:
+        """Serialize a log record to a single line."""
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+    def _mark_dirty(self, user_id: int, key: str = None) -> None:
+        """Remember which fields changed, so that only those are appended."""
+        keys = self._changed.get(user_id, set())
+        if key is None or keys is None:
+            self._changed[user_id] = None
+        else:
+            keys.add(key)
+            self._changed[user_id] = keys
+        super()._mark_dirty(user_id, key)
+
+    def _rollback(self) -> None:
+        """Forget the fields changed by the failed batch, unless still pending from before it."""
+        for user_id in self._batch_dirty - self._dirty:
+            self._changed.pop(user_id, None)
+        super()._rollback()
+
+    def _make_record(self, user_id: int):
+        """Build the log record describing the pending change of a user."""
+        keys = self._changed.pop(user_id, None)
+        if user_id not in self._users:
+            return {"id": user_id, "drop": True}
+        user = self._users[user_id]
+        if keys is None:
+            return {"id": user_id, "put": self._user_data(user_id)}
+        record = {"id": user_id}
+        changed = {key: user[key] for key in sorted(keys) if key in user}
+        removed = sorted(key for key in keys if key not in user)
+        if changed:
+            record["set"] = changed
+        if removed:
+            record["del"] = removed
+        return record if len(record) > 1 else None
+
+    def _persist(self, user_ids) -> None:
+        """Append one record per changed user to the log, in a single write."""
+        records = [self._make_record(user_id) for user_id in user_ids]
+        records = [record for record in records if record]
+        if not records:
+            return
+        lines = [self._encode(record).encode("utf-8") for record in records]
+        with self._locked(), open(self.log_path, "ab") as f:
+            offset = f.tell()
+            f.write(b"".join(lines))
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+            if self._log_ino is None:
+                self._log_ino = os.fstat(f.fileno()).st_ino
+        if offset == self._applied_offset:
+            # Nothing was appended by others in between: our records are applied
+            self._applied_offset = offset + sum(len(line) for line in lines)
+        for record, line in zip(records, lines):
+            if "drop" in record:
+                self._offsets.pop(record["id"], None)
+            elif "put" in record:
+                self._offsets[record["id"]] = [offset]
+            else:
+                self._offsets.setdefault(record["id"], []).append(offset)
+            offset += len(line)
+        self._n_records += len(records)
+
+        if (self._n_records >= self.compact_min_records
+                and self._n_records > self.compact_ratio * max(len(self._users), 1)):
+            self.compact_log()
+
+    def compact_log(self) -> None:
+        """
+        Rewrite the log with a single record per user, after applying the
+        records appended by other processes so that none is dropped.
+        """
+        with self._locked():
+            self.refresh()
+            self._rewrite_log()
+
+    def _rewrite_log(self) -> None:
+        """Replace the log with one "put" record per user in memory."""
+        tmp_path = self.log_path.with_name(self.log_path.name + ".tmp")
+        offsets = {}
+        offset = 0
+        with open(tmp_path, "wb") as f:
+            for user_id in self._users:
+                line = self._encode({"id": user_id, "put": self._user_data(user_id)}).encode("utf-8")
+                f.write(line)
+                offsets[user_id] = [offset]
+                offset += len(line)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.log_path)
+        if self.fsync:
+            self._sync_dir()
+        self._offsets = offsets
+        self._n_records = len(offsets)
+        self._applied_offset = offset
+        self._log_ino = os.stat(self.log_path).st_ino
+
+    def refresh(self, full: bool = False) -> int:
+        """
+        Apply the records appended to the log by someone else.
+        Users with changes not yet written by this instance are skipped.
+        If the log was compacted by someone else it is replayed from the start.
+        :param full: replay the whole log
+        :return: number of users added, changed or removed
+        """
+        if not self.log_path.exists():
+            return 0
+        stat = os.stat(self.log_path)
+        if full or stat.st_ino != self._log_ino or stat.st_size < self._applied_offset:
+            self.flush()
+            self._load_all()
+            self._after_reload()
+            return len(self._users)
+        if stat.st_size == self._applied_offset:
+            return 0
+        changed = self._replay(skip=self._dirty | self._batch_dirty, truncate_torn=False)
+        if changed:
+            self._bump()
+            self.sorted_ids = None
+        return len(changed)
+
+    def read_user(self, user_id: int) -> Dict[str, Any]:
+        """
+        Rebuild a user's data from disk, reading only their own records.
+        Changes not flushed yet are not included.
+        """
+        user = {}
+        with open(self.log_path, "rb") as f:
+            for offset in self._offsets.get(user_id, []):
+                f.seek(offset)
+                record = json.loads(f.readline())
+                if "put" in record:
+                    user = dict(record["put"])
+                user.update(record.get("set", {}))
+                for key in record.get("del", ()):
+                    user.pop(key, None)
+        return user
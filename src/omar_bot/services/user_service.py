@@ -1,13 +1,28 @@
 """
 This class handles user data
 """
+import asyncio
+import bisect
+import copy
+import heapq
 import json
+import os
+import pickle
+import time
+import weakref
 from pathlib import Path
+from collections.abc import Hashable, MutableMapping
+from contextlib import contextmanager
 from typing import Dict, Any, Optional
 from omar_bot.config.settings import USERS_DIR
+from omar_bot.services.user_columns import ColumnarUserMap, COLUMN_FIELDS
 from omar_bot.utils.helpers import get_random_emoji
 
 
+# Version of the snapshot layout, snapshots of another version are ignored
+SNAPSHOT_FORMAT = 2
+
+
 def compute_default_nickname(username, user_id):
     nickname = username.split()[0]
     nickname += str(user_id)[-3:]
@@ -34,20 +49,107 @@ def get_default_user_dict(username, user_id):
     return dct
 
 
+class LazyUserMap(MutableMapping):
+    """
+    Mapping {user_id: data} whose values are read from disk on first access.
+    The keys are known from the start, so membership tests and iteration
+    over the IDs never touch the files.
+    """
+    _NOT_LOADED = object()
+
+    def __init__(self, loader, user_ids=()):
+        """
+        :param loader: function returning the data of a user ID
+        :param user_ids: IDs of the users that exist on disk
+        """
+        self._loader = loader
+        self._data = dict.fromkeys(user_ids, self._NOT_LOADED)
+
+    def __getitem__(self, user_id):
+        value = self._data[user_id]
+        if value is self._NOT_LOADED:
+            value = self._data[user_id] = self._loader(user_id)
+        return value
+
+    def __setitem__(self, user_id, value):
+        self._data[user_id] = value
+
+    def __delitem__(self, user_id):
+        del self._data[user_id]
+
+    def __contains__(self, user_id):
+        return user_id in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def loaded_count(self) -> int:
+        """Number of users whose data has been read."""
+        return sum(value is not self._NOT_LOADED for value in self._data.values())
+
+
 class UserService:
     """
-    Manages user data using JSON files.
+    Manages user data using JSON files, one per user, cached in memory.
 
-    This service handles loading, saving, and modifying user information
-    stored in individual JSON files within a designated directory.
-    It provides methods to add, retrieve, update, and delete users.
+    The bot creates a single instance at startup and shares it between
+    all handlers; call close() when the application shuts down.
     """
-    def __init__(self, users_dir: Path = None):
+    def __init__(self, users_dir: Path = None, write_behind: bool = False,
+                 flush_interval: float = 5.0, flush_threshold: int = 100,
+                 compact: bool = False, fsync: bool = False, index_keys=(),
+                 lazy: bool = False, columnar: bool = False,
+                 rank_keys=(), snapshot_path: Path = None):
+        """
+        :param users_dir: directory containing one JSON file per user
+        :param write_behind: buffer changes in memory and write them in batches
+        :param flush_interval: seconds after which buffered changes are written
+        :param flush_threshold: number of dirty users that triggers a flush
+        :param compact: write JSON without indentation and spaces
+        :param fsync: force every write to disk before replacing the old file
+        :param index_keys: fields to keep a secondary index for
+        :param lazy: read each user file only when the user is first accessed
+            (an index or ranking on a field reads all of them)
+        :param columnar: keep the users in a ColumnarUserMap, numeric fields in
+            NumPy columns; get_user() then returns a dict-like view
+        :param rank_keys: numeric fields to keep sorted for top()
+        :param snapshot_path: file of the startup snapshot, outside users_dir;
+            not used in lazy mode
+        """
+        if lazy and columnar:
+            raise ValueError("The lazy and columnar modes cannot be combined.")
         self.users_dir = users_dir or USERS_DIR
         self.users_dir.mkdir(parents=True, exist_ok=True)
-        self._users = {}  # In-memory cache: {user_id: data}
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.compact = compact
+        self.fsync = fsync
+        self.lazy = lazy
+        self.columnar = columnar
+        self.snapshot_path = Path(snapshot_path) if snapshot_path and not lazy else None
+        self._users = ColumnarUserMap() if columnar else {}  # In-memory cache: {user_id: data}
+        self._file_stats = {}  # {user_id: (mtime_ns, size) of their file}
+        self._dirty = set()  # IDs of users changed since the last flush
+        self._last_flush = time.monotonic()
+        self._indexes = {}  # Secondary indexes: {key: {value: set of user IDs}}
+        self._rankings = {}  # {key: sorted list of (-value, user ID)}
+        self._batch_depth = 0
+        self._batch_dirty = set()  # IDs of users changed in the current batch
+        self._batch_backup = {}  # {user_id: copy of their data before the batch}
+        self._users_version = 0  # Bumped when users are added, removed or replaced
+        self._field_versions = {}  # {key: version}, bumped when the field changes
+        self._locks = weakref.WeakValueDictionary()  # {user_id: asyncio.Lock}, while in use
         self._load_all()
+        for key in index_keys:
+            self.add_index(key)
+        for key in rank_keys:
+            self.add_ranking(key)
         self.sorted_ids = None
+        self.closed = False
 
     def get_user_index(self, user_id):
         if self.sorted_ids is None:
@@ -57,32 +159,337 @@ class UserService:
     def _load_all(self) -> None:
         """Load all user JSON files into memory."""
         self._users.clear()
-        for file_path in self.users_dir.glob("*.json"):
-            try:
-                user_id = int(file_path.stem)
-                with open(file_path, "r", encoding="utf-8") as f:
-                    self._users[user_id] = json.load(f)
-            except (ValueError, json.JSONDecodeError) as e:
-                raise RuntimeError(f"Failed to load user file: {file_path.name}") from e
+        for tmp_path in self.users_dir.glob("*.json.tmp"):
+            tmp_path.unlink()  # Left over by an interrupted write
+        file_stats = dict(self._scan_user_files())
+        if self._load_snapshot(file_stats):
+            return
+        self._file_stats = file_stats
+        user_ids = list(self._file_stats)
+        if self.lazy:
+            self._users = LazyUserMap(self._load_user, user_ids)
+        else:
+            self._users.update((user_id, self._load_user(user_id)) for user_id in user_ids)
+
+    def _load_snapshot(self, file_stats: Dict[int, tuple]) -> bool:
+        """
+        Load the users from the snapshot, False if there is none or it is stale:
+        a user file was added, removed or changed (mtime or size) since it was taken.
+        :param file_stats: {user_id: (mtime_ns, size)} of the files now on disk
+        """
+        if self.snapshot_path is None or not self.snapshot_path.exists():
+            return False
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                snapshot = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            return False  # Unreadable, it will be replaced by the next one
+        if (snapshot.get("format") != SNAPSHOT_FORMAT
+                or snapshot.get("users_dir") != str(self.users_dir.resolve())
+                or snapshot.get("file_stats") != file_stats):
+            return False
+        self._file_stats = file_stats
+        self._users.update(snapshot["users"])
+        return True
+
+    def save_snapshot(self) -> None:
+        """
+        Write the users to the snapshot file, after flushing the pending
+        changes and picking up those made on disk by other processes.
+        """
+        if self.snapshot_path is None:
+            return
+        self.flush()
+        self.refresh()  # Also records the stat of every file
+        snapshot = {
+            "format": SNAPSHOT_FORMAT,
+            "users_dir": str(self.users_dir.resolve()),
+            "file_stats": self._file_stats,
+            "users": {user_id: self._user_data(user_id) for user_id in self._users},
+        }
+        tmp_path = self.snapshot_path.with_name(self.snapshot_path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _scan_user_files(self):
+        """Yield (user ID, (mtime_ns, size)) for every file in the users directory."""
+        with os.scandir(self.users_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".json"):
+                    try:
+                        user_id = int(entry.name[:-len(".json")])
+                    except ValueError as e:
+                        raise RuntimeError(f"Failed to load user file: {entry.name}") from e
+                    stat = entry.stat()
+                    yield user_id, (stat.st_mtime_ns, stat.st_size)
+
+    def _load_user(self, user_id: int) -> Dict[str, Any]:
+        """Read a user's data from their JSON file."""
+        file_path = self.users_dir / f"{user_id}.json"
+        try:
+            with open(file_path, "rb") as f:
+                return json.loads(f.read())
+        except ValueError as e:
+            raise RuntimeError(f"Failed to load user file: {file_path.name}") from e
+
+    def add_index(self, key: str) -> None:
+        """
+        Start keeping a secondary index {value: set of user IDs} for a field,
+        so that find() runs in O(matches).
+        """
+        if key in self._indexes:
+            return
+        self._indexes[key] = {}
+        for user_id in self._users:
+            self._index_add(user_id, key)
+
+    def add_ranking(self, key: str) -> None:
+        """
+        Start keeping the users sorted by a numeric field,
+        so that top() is a slice instead of a scan.
+        """
+        if key in self._rankings:
+            return
+        self._rankings[key] = []
+        for user_id in self._users:
+            self._rank_add(user_id, key)
+
+    def _rebuild_indexes(self) -> None:
+        """Rebuild all the secondary indexes and rankings from the in-memory data."""
+        for key in list(self._indexes):
+            del self._indexes[key]
+            self.add_index(key)
+        for key in list(self._rankings):
+            del self._rankings[key]
+            self.add_ranking(key)
+
+    def _after_reload(self) -> None:
+        """Bring the derived state up to date after the users were reloaded."""
+        self._rebuild_indexes()
+        self._bump()
+        self.sorted_ids = None
+
+    def _bump(self, key: str = None) -> None:
+        """Record that a field changed, or with key=None that users were added or removed."""
+        if key is None:
+            self._users_version += 1
+        else:
+            self._field_versions[key] = self._field_versions.get(key, 0) + 1
+
+    def version(self, *keys) -> tuple:
+        """
+        Return a value that changes whenever users are added or removed,
+        or whenever one of the given fields changes for any user.
+        """
+        return (self._users_version,) + tuple(self._field_versions.get(key, 0) for key in keys)
+
+    def _index_add(self, user_id: int, key: str) -> None:
+        """Add a user to the index of a field, under their current value."""
+        user = self._users[user_id]
+        if key in user and isinstance(user[key], Hashable):
+            self._indexes[key].setdefault(user[key], set()).add(user_id)
+
+    def _index_remove(self, user_id: int, key: str) -> None:
+        """Remove a user from the index of a field."""
+        user = self._users[user_id]
+        if key in user and isinstance(user[key], Hashable):
+            bucket = self._indexes[key].get(user[key])
+            if bucket is not None:
+                bucket.discard(user_id)
+                if not bucket:
+                    del self._indexes[key][user[key]]
+
+    @staticmethod
+    def _rank_entry(user: Dict[str, Any], key: str):
+        """Entry of a user in the ranking of a field, None if the value is not a number."""
+        value = user.get(key)
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and value == value:
+            return -value  # NaN is left out, it cannot be sorted
+        return None
+
+    def _rank_add(self, user_id: int, key: str) -> None:
+        """Insert a user in the ranking of a field, at their current value."""
+        value = self._rank_entry(self._users[user_id], key)
+        if value is not None:
+            bisect.insort(self._rankings[key], (value, user_id))
+
+    def _rank_remove(self, user_id: int, key: str) -> None:
+        """Remove a user from the ranking of a field."""
+        value = self._rank_entry(self._users[user_id], key)
+        if value is not None:
+            ranking = self._rankings[key]
+            i = bisect.bisect_left(ranking, (value, user_id))
+            if i < len(ranking) and ranking[i] == (value, user_id):
+                del ranking[i]
+
+    def _track(self, user_id: int, keys=None) -> None:
+        """Add a user to the indexes and rankings of the given fields (default: all)."""
+        for key in self._indexes:
+            if keys is None or key in keys:
+                self._index_add(user_id, key)
+        for key in self._rankings:
+            if keys is None or key in keys:
+                self._rank_add(user_id, key)
+
+    def _untrack(self, user_id: int, keys=None) -> None:
+        """Remove a user from the indexes and rankings of the given fields (default: all)."""
+        for key in self._indexes:
+            if keys is None or key in keys:
+                self._index_remove(user_id, key)
+        for key in self._rankings:
+            if keys is None or key in keys:
+                self._rank_remove(user_id, key)
+
+    def _encode(self, data: Dict[str, Any]) -> str:
+        """Serialize a user's data to JSON text."""
+        if self.compact:
+            return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        return json.dumps(data, ensure_ascii=False, indent=2)
 
     def _save_user(self, user_id: int) -> None:
-        """Save a user's data to their JSON file."""
+        """
+        Atomically replace a user's JSON file with their current data, so a
+        crash leaves either the old or the new version on disk.
+        """
         file_path = self.users_dir / f"{user_id}.json"
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(self._users[user_id], f, ensure_ascii=False, indent=2)
+        tmp_path = file_path.with_name(file_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self._encode(self._user_data(user_id)))
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+        stat = os.stat(file_path)
+        self._file_stats[user_id] = (stat.st_mtime_ns, stat.st_size)
+
+    def _sync_dir(self) -> None:
+        """Make renames and deletions in the users directory durable."""
+        if os.name != "posix":
+            return  # Directories cannot be opened on Windows
+        fd = os.open(self.users_dir, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _remove_user_file(self, user_id: int) -> None:
+        """Delete a user's JSON file, if present."""
+        file_path = self.users_dir / f"{user_id}.json"
+        if file_path.exists():
+            file_path.unlink()  # Delete file
+        self._file_stats.pop(user_id, None)
+
+    def _persist(self, user_ids) -> None:
+        """Write the given users to disk, removing the files of deleted users."""
+        for user_id in user_ids:
+            if user_id in self._users:
+                self._save_user(user_id)
+            else:
+                self._remove_user_file(user_id)
+        if self.fsync and user_ids:
+            self._sync_dir()
+
+    def _mark_dirty(self, user_id: int, key: str = None) -> None:
+        """
+        Record a change to a user, writing it now unless in write-behind mode.
+        In write-behind mode the user is written by the next flush, triggered
+        when flush_threshold users are dirty or flush_interval has elapsed.
+        :param user_id: ID of the changed user
+        :param key: the changed field, None if the whole user changed
+        """
+        self._bump(key)
+        if self._batch_depth:
+            self._batch_dirty.add(user_id)
+            return
+        if not self.write_behind:
+            self._persist((user_id,))
+            return
+        self._dirty.add(user_id)
+        if (len(self._dirty) >= self.flush_threshold
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def _backup(self, user_id: int) -> None:
+        """Inside a batch, remember a user's data before their first change."""
+        if self._batch_depth and user_id not in self._batch_backup:
+            data = self._user_data(user_id) if user_id in self._users else None
+            self._batch_backup[user_id] = copy.deepcopy(data)
+
+    @contextmanager
+    def batch(self):
+        """
+        Group changes so that they are written once, when the block ends.
+        If the block raises, the changed users are restored in memory and
+        nothing is written. Batches can be nested, only the outermost counts.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self._rollback()
+            raise
+        self._batch_depth -= 1
+        if not self._batch_depth:
+            self._commit()
+
+    def _commit(self) -> None:
+        """Write the changes of the finished batch."""
+        dirty, self._batch_dirty = self._batch_dirty, set()
+        self._batch_backup = {}
+        if not dirty:
+            return
+        if not self.write_behind:
+            try:
+                self._persist(dirty)
+            except Exception:
+                self._dirty |= dirty  # Kept for the next flush, as in flush()
+                raise
+            return
+        self._dirty |= dirty
+        if (len(self._dirty) >= self.flush_threshold
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def _rollback(self) -> None:
+        """Restore the users changed by the failed batch."""
+        for user_id, data in self._batch_backup.items():
+            self._replace_user(user_id, data)
+        self._batch_dirty = set()
+        self._batch_backup = {}
+
+    def update(self, user_id: int, **fields) -> None:
+        """Set several fields of a user, saving them with a single write."""
+        if user_id not in self._users:
+            raise KeyError(f"User {user_id} not found.")
+        with self.batch():
+            for key, value in fields.items():
+                self.set(user_id, key, value)
 
     def add_user(self, user_id: int, username: str) -> Dict[str, Any]:
         """Add a new user with default values."""
         if user_id in self._users:
             raise ValueError(f"User with ID {user_id} already exists.")
+        self._backup(user_id)
 
         # Fill the basic fields with default values
         self._users[user_id] = get_default_user_dict(username, user_id)
-        self._save_user(user_id)
+        self._track(user_id)
+        self._mark_dirty(user_id)
         self.sorted_ids = None
 
         return self._users[user_id]
 
+    def _user_data(self, user_id: int) -> Dict[str, Any]:
+        """Return a user's data as a plain dictionary, ready to be serialized."""
+        user = self._users[user_id]
+        return user if isinstance(user, dict) else dict(user)
+
     def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get full user data."""
         return self._users.get(user_id)
@@ -96,20 +503,46 @@ class UserService:
         """Set a field for a user and save to disk."""
         if user_id not in self._users:
             raise KeyError(f"User {user_id} not found.")
-        self._users[user_id][key] = value
-        self._save_user(user_id)
+        self._backup(user_id)
+        if key in self._indexes or key in self._rankings:
+            self._untrack(user_id, (key,))
+            self._users[user_id][key] = value
+            self._track(user_id, (key,))
+        else:
+            self._users[user_id][key] = value
+        self._mark_dirty(user_id, key)
 
     def delete_user(self, user_id: int) -> bool:
         """Delete a user and their JSON file."""
         if user_id not in self._users:
             return False
-        file_path = self.users_dir / f"{user_id}.json"
-        if file_path.exists():
-            file_path.unlink()  # Delete file
+        self._backup(user_id)
+        self._untrack(user_id)
         del self._users[user_id]
+        self._mark_dirty(user_id)
         self.sorted_ids = None
         return True
 
+    def increment(self, user_id: int, key: str, delta: int = 1) -> Any:
+        """Add delta to a numeric field of a user (missing counts as 0), return the new value."""
+        value = (self.get(user_id, key) or 0) + delta
+        self.set(user_id, key, value)
+        return value
+
+    def lock(self, user_id: int) -> asyncio.Lock:
+        """
+        Return the lock of a user, to hold across awaits in a read-modify-write:
+            async with user_service.lock(user_id):
+                ...
+        Without it a concurrent update of the same user may be lost.
+        Batches must not span an await. Locks are dropped once nobody
+        holds or waits for them.
+        """
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+        return lock
+
     def get_user_ids(self) -> list:
         """Return list of all user IDs."""
         return sorted(list(self._users.keys()))
@@ -124,12 +557,104 @@ class UserService:
 
     def get_admin_ids(self) -> list:
         """Return list of admin user IDs."""
-        return [uid for uid in self._users if self.is_admin(uid)]
+        return self.find("admin", True)
+
+    def find(self, key: str, value: Any) -> list:
+        """Return the sorted IDs of the users whose field equals value."""
+        if key in self._indexes and isinstance(value, Hashable):
+            return sorted(self._indexes[key].get(value, ()))
+        return sorted(uid for uid, user in self._users.items() if key in user and user[key] == value)
+
+    def top(self, key: str, n: int = 10) -> list:
+        """
+        Return the IDs of the n users with the highest value of a numeric
+        field, ties broken by lower ID.
+        """
+        if key in self._rankings:
+            return [user_id for _, user_id in self._rankings[key][:n]]
+        if self.columnar and COLUMN_FIELDS.get(key) is int:
+            return self._users.top_ids(key, n)
+        ranked = [uid for uid, user in self._users.items()
+                  if isinstance(user.get(key), (int, float)) and not isinstance(user[key], bool)]
+        return heapq.nsmallest(n, ranked, key=lambda uid: (-self._users[uid][key], uid))
+
+    def having(self, key: str) -> list:
+        """Return the sorted IDs of the users with a non-zero (truthy) value of a field."""
+        if self.columnar and COLUMN_FIELDS.get(key) is int:
+            return self._users.nonzero_ids(key)
+        return sorted(uid for uid, user in self._users.items() if user.get(key))
+
+    def total(self, key: str) -> int:
+        """Return the sum of a numeric field over all users."""
+        if self.columnar and COLUMN_FIELDS.get(key) is int:
+            return self._users.total(key)
+        return sum(user.get(key, 0) or 0 for user in self._users.values())
 
     def delete_attribute(self, user_id: int, key: str) -> None:
         """Delete a specific attribute for a user and save to disk."""
         if user_id not in self._users:
             raise KeyError(f"User {user_id} not found.")
         if key in self._users[user_id]:
+            self._backup(user_id)
+            self._untrack(user_id, (key,))
             del self._users[user_id][key]
-            self._save_user(user_id)
+            self._mark_dirty(user_id, key)
+
+    def refresh(self, full: bool = False) -> int:
+        """
+        Re-read the user files changed on disk by someone else.
+        Users with changes not yet written by this instance are skipped.
+        Every file is stat'ed, edits in place included, but only the files
+        whose modification time or size changed are read.
+        :param full: re-read all the files
+        :return: number of users added, changed or removed
+        """
+        on_disk = dict(self._scan_user_files())
+        pending = self._dirty | self._batch_dirty
+        changed = [uid for uid, stat in on_disk.items() if full or self._file_stats.get(uid) != stat]
+        removed = [uid for uid in self._file_stats if uid not in on_disk]
+        count = 0
+        for user_id in changed:
+            if user_id not in pending:
+                self._replace_user(user_id, self._load_user(user_id))
+                self._file_stats[user_id] = on_disk[user_id]
+                count += 1
+        for user_id in removed:
+            if user_id not in pending:
+                self._replace_user(user_id, None)
+                del self._file_stats[user_id]
+                count += 1
+        return count
+
+    def _replace_user(self, user_id: int, data: Optional[Dict[str, Any]]) -> None:
+        """Swap a user's data in memory (None removes them), keeping the indexes in sync."""
+        if user_id in self._users:
+            self._untrack(user_id)
+            del self._users[user_id]
+        if data is not None:
+            self._users[user_id] = data
+            self._track(user_id)
+        self._bump()
+        self.sorted_ids = None
+
+    def has_pending_changes(self) -> bool:
+        """True if some changes have not been written to disk yet."""
+        return bool(self._dirty)
+
+    def flush(self) -> None:
+        """Write all pending changes to disk."""
+        dirty, self._dirty = self._dirty, set()
+        try:
+            self._persist(dirty)
+        except Exception:
+            self._dirty |= dirty  # Keep the changes for the next attempt
+            raise
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        """Flush pending changes, save the snapshot and mark the service as closed."""
+        if self.closed:
+            return
+        self.flush()
+        self.save_snapshot()
+        self.closed = True
@@ -0,0 +1,169 @@
+"""
+This class handles user data stored in a SQLite database
+"""
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, Any
+from omar_bot.config.settings import USERS_DB_PATH
+from omar_bot.services.user_service import UserService
+
+
+# Fields stored in their own indexed column, with the type they are read back as
+HOT_FIELDS = {
+    "gems": int,
+    "gold": int,
+    "tiles_count": int,
+    "admin": bool,
+    "santa": bool,
+    "canvas": str,
+}
+
+# Key of the JSON extra listing the hot fields present with the value None,
+# since NULL also stands for a missing field
+NULL_FIELDS_KEY = "__null__"
+
+
+class SqliteUserService(UserService):
+    """
+    Manages user data using a SQLite database in WAL mode.
+
+    Drop-in replacement for UserService. The fields in HOT_FIELDS are
+    stored in indexed columns, every other attribute lives in the JSON
+    "extra" column. A missing hot field is stored as NULL; a hot field
+    set to None is also NULL, and listed in the extra under NULL_FIELDS_KEY.
+    All users are still cached in memory for reads; find(), top() and
+    get_admin_ids() on hot fields without an in-memory index or ranking
+    run as indexed SQL queries instead.
+    refresh() reloads the table only if another connection committed
+    changes since the last load.
+    """
+    def __init__(self, users_dir: Path = None, db_path: Path = None, **kwargs):
+        """
+        :param users_dir: directory of the database, if db_path is not given
+        :param db_path: path of the SQLite file
+        :param kwargs: the other UserService options (write_behind, fsync, ...)
+        """
+        if db_path is None:
+            db_path = users_dir / USERS_DB_PATH.name if users_dir else USERS_DB_PATH
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path)
+        self._data_version = None  # Changes when another connection commits
+        self._create_schema(kwargs.get("fsync", False))
+        super().__init__(users_dir=self.db_path.parent, **kwargs)
+
+    def _create_schema(self, fsync: bool) -> None:
+        """Create the users table and its indexes, if missing."""
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={'FULL' if fsync else 'NORMAL'}")
+        columns = ", ".join(f"{key}" for key in HOT_FIELDS)
+        with self._conn:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS users "
+                f"(id INTEGER PRIMARY KEY, {columns}, extra TEXT NOT NULL)"
+            )
+            for key in HOT_FIELDS:
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_users_{key} ON users ({key})")
+
+    def _load_all(self) -> None:
+        """Load all users from the database into memory."""
+        self._users.clear()
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        query = f"SELECT id, {', '.join(HOT_FIELDS)}, extra FROM users"
+        for row in self._conn.execute(query):
+            self._users[row[0]] = self._row_to_user(row)
+
+    @staticmethod
+    def _row_to_user(row) -> Dict[str, Any]:
+        """Convert a table row back to the user's dictionary."""
+        user = json.loads(row[-1])
+        for key in user.pop(NULL_FIELDS_KEY, ()):
+            user[key] = None
+        for (key, kind), value in zip(HOT_FIELDS.items(), row[1:-1]):
+            if value is not None:
+                user[key] = kind(value) if kind is bool else value
+        return user
+
+    @staticmethod
+    def _user_to_row(user_id: int, user: Dict[str, Any]) -> tuple:
+        """Split a user's dictionary into the hot columns and the JSON extra."""
+        extra = {key: value for key, value in user.items() if key not in HOT_FIELDS}
+        null_fields = [key for key in HOT_FIELDS if key in user and user[key] is None]
+        if null_fields:
+            extra[NULL_FIELDS_KEY] = null_fields
+        hot = [user.get(key) for key in HOT_FIELDS]
+        return (user_id, *hot, json.dumps(extra, ensure_ascii=False, separators=(",", ":")))
+
+    def _persist(self, user_ids) -> None:
+        """Write the given users in a single transaction."""
+        placeholders = ", ".join("?" * (len(HOT_FIELDS) + 2))
+        rows, deleted = [], []
+        for user_id in user_ids:
+            if user_id in self._users:
+                rows.append(self._user_to_row(user_id, self._users[user_id]))
+            else:
+                deleted.append((user_id,))
+        with self._conn:
+            self._conn.executemany(f"INSERT OR REPLACE INTO users VALUES ({placeholders})", rows)
+            self._conn.executemany("DELETE FROM users WHERE id = ?", deleted)
+
+    def _query_ids(self, query: str, params: tuple = ()) -> list:
+        """Run a query returning user IDs, after writing the pending changes."""
+        if self.has_pending_changes():
+            self.flush()
+        return [row[0] for row in self._conn.execute(query, params)]
+
+    def find(self, key: str, value: Any) -> list:
+        """Return the sorted IDs of the users whose field equals value."""
+        if key not in HOT_FIELDS or key in self._indexes or value is None or self._batch_depth:
+            return super().find(key, value)  # In a batch the database does not have the changes yet
+        return self._query_ids(f"SELECT id FROM users WHERE {key} = ? ORDER BY id", (value,))
+
+    def top(self, key: str, n: int = 10) -> list:
+        """Return the IDs of the n users with the highest value of a numeric field."""
+        if HOT_FIELDS.get(key) is not int or key in self._rankings or self._batch_depth:
+            return super().top(key, n)
+        return self._query_ids(
+            f"SELECT id FROM users WHERE {key} IS NOT NULL ORDER BY {key} DESC, id LIMIT ?", (n,)
+        )
+
+    def refresh(self, full: bool = False) -> int:
+        """
+        Reload the users if another connection changed the database.
+        Pending changes of this instance are written first.
+        :param full: reload even if the database looks unchanged
+        :return: number of users loaded, 0 if nothing changed
+        """
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if not full and data_version == self._data_version:
+            return 0
+        self.flush()
+        self._load_all()
+        self._after_reload()
+        return len(self._users)
+
+    def import_json_dir(self, users_dir: Path) -> int:
+        """
+        One-shot import of a directory of <id>.json user files.
+        Existing users with the same ID are overwritten.
+        Returns the number of imported users.
+        """
+        imported = {}
+        for file_path in Path(users_dir).glob("*.json"):
+            try:
+                with open(file_path, "r", encoding="utf-8") as f:
+                    imported[int(file_path.stem)] = json.load(f)
+            except (ValueError, json.JSONDecodeError) as e:
+                raise RuntimeError(f"Failed to load user file: {file_path.name}") from e
+        self._users.update(imported)
+        self._after_reload()
+        self._persist(imported)
+        return len(imported)
+
+    def close(self) -> None:
+        """Flush pending changes and close the database."""
+        if self.closed:
+            return
+        super().close()
+        self._conn.close()
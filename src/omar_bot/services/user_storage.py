@@ -0,0 +1,42 @@
+"""
+Creation of the user service for the storage backend chosen in the settings
+"""
+from omar_bot.config.settings import (
+    USERS_DIR, USERS_LOG_PATH, USERS_DB_PATH, USERS_SNAPSHOT_PATH, USER_STORAGE,
+    USER_WRITE_BEHIND, USER_FLUSH_INTERVAL, USER_FLUSH_THRESHOLD, USER_COMPACT_JSON, USER_FSYNC,
+    USER_INDEX_KEYS, USER_LAZY_LOAD, USER_COLUMNAR, USER_RANK_KEYS, USER_SNAPSHOT
+)
+from omar_bot.services.user_service import UserService
+from omar_bot.services.user_log_service import LogUserService
+from omar_bot.services.user_sqlite_service import SqliteUserService, HOT_FIELDS
+
+
+def create_user_service(**overrides) -> UserService:
+    """
+    Creates the UserService for the storage backend chosen in the settings.
+    Used by the bot and the console, so both work on the same data.
+    :param overrides: keyword arguments replacing the ones from the settings
+    """
+    options = {"index_keys": USER_INDEX_KEYS, "rank_keys": USER_RANK_KEYS, "columnar": USER_COLUMNAR,
+               "write_behind": USER_WRITE_BEHIND, "flush_interval": USER_FLUSH_INTERVAL,
+               "flush_threshold": USER_FLUSH_THRESHOLD, "compact": USER_COMPACT_JSON, "fsync": USER_FSYNC}
+    if USER_STORAGE == "json":
+        service_class = UserService
+        options.update(users_dir=USERS_DIR, lazy=USER_LAZY_LOAD,
+                       snapshot_path=USERS_SNAPSHOT_PATH if USER_SNAPSHOT else None)
+        if USER_LAZY_LOAD:
+            # Building an index or a ranking would read every file
+            options["index_keys"] = options["rank_keys"] = ()
+    elif USER_STORAGE == "log":
+        service_class = LogUserService
+        options.update(log_path=USERS_LOG_PATH)
+    elif USER_STORAGE == "sqlite":
+        service_class = SqliteUserService
+        options.update(db_path=USERS_DB_PATH)
+        # The hot fields are found and ranked by the indexes of the database
+        options["index_keys"] = tuple(key for key in USER_INDEX_KEYS if key not in HOT_FIELDS)
+        options["rank_keys"] = tuple(key for key in USER_RANK_KEYS if key not in HOT_FIELDS)
+    else:
+        raise ValueError(f"Unknown USER_STORAGE: {USER_STORAGE}")
+    options.update(overrides)
+    return service_class(**options)
@@ -0,0 +1,132 @@
+""" Local stand-in for the Telegram Bot API
+- FakeBotAPI request class answering the Bot API methods in memory
+- builders of synthetic updates
+Used to run the real Application and handlers offline, in tests and benchmarks.
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+from telegram.request import BaseRequest, RequestData
+
+
+BOT_INFO = {"id": 1, "is_bot": True, "first_name": "Omar", "username": "omar_bot"}
+
+
+class FakeBotAPI(BaseRequest):
+    """
+    Request class answering the Bot API calls locally instead of sending
+    them to Telegram. Pass it to Application.builder().request(...).
+    Every call is recorded in requests as (method, parameters), and the
+    texts sent or edited are in sent as (chat ID, text).
+    With chat_rate or global_rate, sendMessage answers 429 with
+    retry_after like Telegram when a chat, or the bot in the last second,
+    goes over that many messages per second.
+    """
+    def __init__(self, latency: float = 0.0, chat_rate: float = 0, global_rate: float = 0,
+                 retry_after: float = 1):
+        """
+        :param latency: seconds to wait before answering, like a network round trip
+        :param chat_rate: messages per second allowed in each chat (0 = no limit)
+        :param global_rate: messages per second allowed in total (0 = no limit)
+        :param retry_after: seconds to wait given in the 429 answers
+        """
+        self.latency = latency
+        self.chat_rate = chat_rate
+        self.global_rate = global_rate
+        self.retry_after = retry_after
+        self.requests: List[Tuple[str, Dict[str, Any]]] = []
+        self.sent: List[Tuple[int, str]] = []
+        self.flood_errors = 0
+        self._message_id = 0
+        self._last_sent: Dict[int, float] = {}  # {chat ID: time of the last message}
+        self._recent = deque()  # Times of the messages of the last second
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: RequestData = None,
+                         **timeouts) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.requests.append((api_method, params))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        code, response = self.answer(api_method, params)
+        return code, json.dumps(response).encode()
+
+    def answer(self, api_method: str, params: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """Return the HTTP status and the JSON response of a Bot API call."""
+        if api_method == "getMe":
+            return 200, {"ok": True, "result": BOT_INFO}
+        if api_method == "getUpdates":
+            return 200, {"ok": True, "result": []}
+        if api_method in ("sendMessage", "editMessageText"):
+            chat_id = int(params["chat_id"])
+            if api_method == "sendMessage" and self._flooded(chat_id):
+                self.flood_errors += 1
+                return 429, {"ok": False, "error_code": 429, "description": "Too Many Requests",
+                             "parameters": {"retry_after": self.retry_after}}
+            self.sent.append((chat_id, params["text"]))
+            if api_method == "sendMessage":
+                self._message_id += 1
+            message_id = params.get("message_id", self._message_id)
+            message = {"message_id": message_id, "date": int(time.time()), "text": params["text"],
+                       "chat": {"id": chat_id, "type": "private"}, "from": BOT_INFO}
+            return 200, {"ok": True, "result": message}
+        return 200, {"ok": True, "result": True}
+
+    def _flooded(self, chat_id: int) -> bool:
+        """True if sending to the chat now goes over the rate limits, else record the message."""
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] >= 1:
+            self._recent.popleft()
+        if self.global_rate and len(self._recent) >= self.global_rate:
+            return True
+        last = self._last_sent.get(chat_id)
+        if self.chat_rate and last is not None and now - last < 1 / self.chat_rate:
+            return True
+        self._recent.append(now)
+        self._last_sent[chat_id] = now
+        return False
+
+
+def make_user(user_id: int) -> Dict[str, Any]:
+    return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+
+
+def make_command_update(update_id: int, user_id: int, text: str, chat_id: int = None) -> Dict[str, Any]:
+    """
+    JSON of an update with a message, as Telegram would send it.
+    A text starting with "/" is marked as a command.
+    """
+    chat_id = chat_id if chat_id is not None else user_id
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private" if chat_id == user_id else "group"},
+        "from": make_user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        length = len(text.split()[0])
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": length}]
+    return {"update_id": update_id, "message": message}
+
+
+def make_callback_update(update_id: int, user_id: int, data: str, message_id: int = 1) -> Dict[str, Any]:
+    """JSON of an update with the press of an inline keyboard button."""
+    message = {"message_id": message_id, "date": int(time.time()), "text": "...",
+               "chat": {"id": user_id, "type": "private"}, "from": BOT_INFO}
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "from": make_user(user_id), "chat_instance": str(user_id),
+        "message": message, "data": data,
+    }}
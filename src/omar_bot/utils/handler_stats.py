@@ -0,0 +1,88 @@
+""" Latency statistics of the command handlers
+- per-command calls, errors and latency histogram
+- timed() handler wrapper
+"""
+import bisect
+import functools
+import time
+from typing import Callable, Dict, List
+
+
+# Upper bounds of the latency buckets in seconds: 0.1 ms to ~100 s, 4 buckets per doubling
+BUCKET_BOUNDS = [1e-4 * 2 ** (i / 4) for i in range(81)]
+
+
+class CommandStats:
+    """Calls, errors and latency histogram of one command."""
+    __slots__ = ("calls", "errors", "total_time", "max_time", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)  # The last one counts the slower calls
+
+    def record(self, elapsed: float, failed: bool) -> None:
+        self.calls += 1
+        self.errors += failed
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, elapsed)] += 1
+
+    def percentile(self, p: float) -> float:
+        """
+        Latency under which p percent of the calls completed, in seconds.
+        It is the upper bound of a bucket, so at most ~19% above the exact value,
+        and never above the slowest call.
+        """
+        if not self.calls:
+            return 0.0
+        rank = p / 100 * self.calls
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(BUCKET_BOUNDS[i], self.max_time) if i < len(BUCKET_BOUNDS) else self.max_time
+        return self.max_time
+
+
+class HandlerStats:
+    """
+    Statistics of all the commands, kept in memory.
+    Recording a call is a few additions and a bisect over the bucket bounds.
+    """
+    def __init__(self):
+        self.commands: Dict[str, CommandStats] = {}
+        self.started = time.monotonic()
+
+    def record(self, name: str, elapsed: float, failed: bool = False) -> None:
+        """Record one call of a command."""
+        stats = self.commands.get(name)
+        if stats is None:
+            stats = self.commands[name] = CommandStats()
+        stats.record(elapsed, failed)
+
+    def report(self) -> List[str]:
+        """One line per command, the most called first."""
+        lines = []
+        for name, stats in sorted(self.commands.items(), key=lambda item: -item[1].calls):
+            p50, p95, p99 = (stats.percentile(p) * 1000 for p in (50, 95, 99))
+            lines.append(f"/{name}: {stats.calls} calls, {stats.errors} errors, "
+                         f"p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms, "
+                         f"max {stats.max_time * 1000:.1f} ms")
+        return lines
+
+
+def timed(handler: Callable, stats: HandlerStats, name: str) -> Callable:
+    """Wrap a handler so that its calls, errors and latency are recorded under name."""
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        t = time.perf_counter()
+        failed = True
+        try:
+            await handler(update, context)
+            failed = False
+        finally:
+            stats.record(name, time.perf_counter() - t, failed)
+    return wrapper
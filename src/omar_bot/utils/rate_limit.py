@@ -0,0 +1,105 @@
+""" Rate limiting of the command handlers
+- token buckets per user, per chat and global
+- rate_limited() handler wrapper
+"""
+import functools
+import logging
+import time
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBuckets:
+    """
+    One token bucket per key, all with the same rate and burst.
+    A bucket starts full with burst tokens and refills at rate tokens
+    per second; every allowed call takes one token.
+    """
+    def __init__(self, rate: float, burst: float, max_keys: int = 10_000):
+        """
+        :param rate: tokens added per second
+        :param burst: capacity of each bucket
+        :param max_keys: number of buckets above which the full ones are dropped
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: Dict[Hashable, List[float]] = {}  # {key: [tokens, time of the last update]}
+
+    def tokens(self, key: Hashable, now: float) -> float:
+        """Number of tokens in a bucket at the given time."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.burst
+        return min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+
+    def wait_time(self, key: Hashable, now: float) -> float:
+        """Seconds until a bucket has a whole token, 0 if it has one now."""
+        missing = 1 - self.tokens(key, now)
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, key: Hashable, now: float) -> None:
+        """Take one token from a bucket."""
+        tokens = self.tokens(key, now) - 1
+        if key not in self._buckets and len(self._buckets) >= self.max_keys:
+            self._prune(now)
+        self._buckets[key] = [tokens, now]
+
+    def _prune(self, now: float) -> None:
+        """Drop the buckets that are full again, they are the same as new ones."""
+        self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                         if self.tokens(key, now) < self.burst}
+
+
+class RateLimiter:
+    """
+    Allows a call only if the user, the chat and the whole bot all have
+    a token left, and then takes one from each.
+    A level with a rate of 0 is not limited.
+    """
+    def __init__(self, user: Tuple[float, float] = (0, 0), chat: Tuple[float, float] = (0, 0),
+                 total: Tuple[float, float] = (0, 0), clock: Callable[[], float] = time.monotonic):
+        """
+        :param user: (rate, burst) of each user
+        :param chat: (rate, burst) of each chat
+        :param total: (rate, burst) of the whole bot
+        :param clock: function returning the current time in seconds
+        """
+        self.clock = clock
+        self._user = TokenBuckets(*user) if user[0] > 0 else None
+        self._chat = TokenBuckets(*chat) if chat[0] > 0 else None
+        self._total = TokenBuckets(*total) if total[0] > 0 else None
+        self.dropped = 0
+
+    def allow(self, user_id: Optional[int], chat_id: Optional[int]) -> bool:
+        """Take a token for a call of the user in the chat, False if one budget is exhausted."""
+        now = self.clock()
+        checks = []
+        if self._user is not None and user_id is not None:
+            checks.append((self._user, user_id))
+        if self._chat is not None and chat_id is not None:
+            checks.append((self._chat, chat_id))
+        if self._total is not None:
+            checks.append((self._total, None))
+        if any(buckets.tokens(key, now) < 1 for buckets, key in checks):
+            self.dropped += 1
+            return False
+        for buckets, key in checks:
+            buckets.take(key, now)
+        return True
+
+
+def rate_limited(handler: Callable, limiter: RateLimiter) -> Callable:
+    """
+    Wrap a handler so that throttled updates are dropped before it runs.
+    Nothing is sent back, answering would cost as much as the handler.
+    """
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        user, chat = update.effective_user, update.effective_chat
+        if not limiter.allow(user.id if user else None, chat.id if chat else None):
+            logger.debug("Dropped %s from user %s: rate limited.", handler.__name__, user.id if user else None)
+            return
+        await handler(update, context)
+    return wrapper
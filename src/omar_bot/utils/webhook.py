@@ -0,0 +1,109 @@
+""" Webhook listener
+- WebhookServer receiving the updates that Telegram POSTs to the bot
+Built on asyncio streams: the webhook server of python-telegram-bot
+needs the optional tornado dependency.
+"""
+import asyncio
+import hmac
+import json
+import logging
+from http import HTTPStatus
+from typing import Dict, Optional, Tuple
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+MAX_BODY_SIZE = 1 << 20  # Updates are a few KB, anything larger is rejected
+READ_TIMEOUT = 10.0  # Seconds to receive a whole request
+
+
+class WebhookServer:
+    """
+    Minimal HTTP listener for the Telegram webhook.
+
+    Accepts POST requests on a single path whose body is the JSON of an
+    update. If secret_token is set, requests without the same value in
+    the X-Telegram-Bot-Api-Secret-Token header are refused with 403.
+    At most max_concurrent updates are processed at a time, the other
+    requests wait for their turn. The response is sent once the update
+    has been processed, so Telegram (which keeps a bounded number of
+    connections open) slows down instead of piling up updates here.
+    """
+    def __init__(self, application: Application, path: str = "/", secret_token: str = None,
+                 max_concurrent: int = 32):
+        """
+        :param application: the initialized application processing the updates
+        :param path: path of the webhook URL
+        :param secret_token: value expected in the secret token header
+        :param max_concurrent: number of updates processed at the same time
+        """
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8443) -> int:
+        """Start listening, return the port (useful with port 0)."""
+        self._server = await asyncio.start_server(self._handle, host, port)
+        port = self._server.sockets[0].getsockname()[1]
+        logger.info("Webhook listening on %s:%d%s", host, port, self.path)
+        return port
+
+    async def stop(self) -> None:
+        """Stop accepting requests."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer one HTTP request."""
+        try:
+            request = await asyncio.wait_for(self._read_request(reader), READ_TIMEOUT)
+            status = await self._process(*request)
+        except (ValueError, KeyError, TypeError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            logger.warning("Invalid webhook request: %r", e)
+            status = HTTPStatus.BAD_REQUEST
+        try:
+            writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                         f"Content-Length: 0\r\nConnection: close\r\n\r\n".encode())
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass  # The client went away
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str], bytes]:
+        """Read (method, path, headers, body) of a request, header names in lower case."""
+        method, path, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        if length > MAX_BODY_SIZE:
+            raise ValueError(f"Request body too large: {length} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return method, path, headers, body
+
+    async def _process(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> HTTPStatus:
+        """Check a request and process the update it carries."""
+        if path != self.path:
+            return HTTPStatus.NOT_FOUND
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED
+        if self.secret_token and not hmac.compare_digest(headers.get(SECRET_HEADER, ""), self.secret_token):
+            logger.warning("Webhook request with a wrong secret token.")
+            return HTTPStatus.FORBIDDEN
+        update = Update.de_json(json.loads(body), self.application.bot)
+        async with self._semaphore:
+            await self.application.process_update(update)
+        return HTTPStatus.OK
@@ -0,0 +1,39 @@
+"""
+Fixtures shared by the unit tests
+"""
+import pytest
+from pathlib import Path
+import tempfile
+import shutil
+from types import SimpleNamespace
+from omar_bot.services.user_service import UserService
+
+
+@pytest.fixture
+def temp_users_dir():
+    """Create a temporary directory for user data."""
+    temp_dir = Path(tempfile.mkdtemp())
+    yield temp_dir
+    shutil.rmtree(temp_dir)  # Cleanup after test
+
+
+@pytest.fixture
+def user_service(temp_users_dir):
+    """Create a UserService instance using the temp directory."""
+    return UserService(users_dir=temp_users_dir)
+
+
+def make_update(user_id: int = 1, full_name: str = "Alice") -> SimpleNamespace:
+    """Minimal stand-in for the Update of a command, the replied texts are collected in update.replies."""
+    replies = []
+
+    async def reply_text(msg, **kwargs):
+        replies.append(msg)
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id, full_name=full_name),
+                           message=SimpleNamespace(reply_text=reply_text), replies=replies)
+
+
+@pytest.fixture
+def fake_update():
+    """Factory of fake command updates: fake_update(user_id=1, full_name="Alice")."""
+    return make_update
@@ -0,0 +1,57 @@
+"""
+Test for the background tasks of the bot
+"""
+import asyncio
+import pytest
+from omar_bot import bot
+from omar_bot.services.user_service import UserService
+
+
+class FailingOnce:
+    """Stand-in for a UserService whose first call fails."""
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls == 1:
+            raise OSError("disk full")
+        return 0
+
+
+async def run_ticks(coroutine, condition) -> None:
+    """Run a periodic task until the condition holds, then cancel it."""
+    task = asyncio.create_task(coroutine)
+    for _ in range(100):
+        await asyncio.sleep(0.001)
+        if condition():
+            break
+    assert not task.done()  # still running
+    task.cancel()
+
+
+@pytest.mark.parametrize("task, method", [
+    (lambda service: bot.refresh_periodically(service, 0), "refresh"),
+    (lambda service: bot.snapshot_periodically(service, 0), "save_snapshot"),
+])
+def test_periodic_tasks_survive_errors(task, method, user_service, caplog):
+    """Test that a failing iteration is logged and the next one still runs."""
+    failing = FailingOnce()
+    setattr(user_service, method, failing)
+    asyncio.run(run_ticks(task(user_service), lambda: failing.calls >= 3))
+    assert failing.calls >= 3
+    assert "disk full" in caplog.text
+
+
+def test_flush_retried_after_error(temp_users_dir, monkeypatch, caplog):
+    """Test that a failed flush leaves the users dirty and is retried at the next tick."""
+    service = UserService(users_dir=temp_users_dir, write_behind=True, flush_interval=3600)
+    service.add_user(1, "Alice")
+    service.flush_interval = 0  # tick as fast as possible
+    persist = service._persist
+    failing = FailingOnce()
+    monkeypatch.setattr(service, "_persist", lambda user_ids: failing() or persist(user_ids))
+    asyncio.run(run_ticks(bot.flush_periodically(service), lambda: not service.has_pending_changes()))
+    assert failing.calls >= 2
+    assert "disk full" in caplog.text
+    assert UserService(users_dir=temp_users_dir).get(1, "username") == "Alice"
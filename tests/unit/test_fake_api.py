@@ -0,0 +1,35 @@
+"""
+Test for the offline Bot API stand-in, running updates through the real handlers
+"""
+import asyncio
+from telegram import Update
+from telegram.ext import Application
+from omar_bot.handlers.callback_handlers import add_callback_handlers
+from omar_bot.handlers.user_commands import add_user_handlers, USER_SERVICE_KEY, HANDLER_STATS_KEY
+from omar_bot.services.user_service import UserService
+from omar_bot.utils.fake_api import FakeBotAPI, make_command_update, make_callback_update
+
+
+def test_replay_through_application(temp_users_dir):
+    """Test that synthetic updates reach the handlers and the replies are captured."""
+    service = UserService(users_dir=temp_users_dir)
+    service.add_user(7, "Alice")
+    api = FakeBotAPI()
+    application = Application.builder().token("1:test").request(api).get_updates_request(api).build()
+    application.bot_data[USER_SERVICE_KEY] = service
+    add_user_handlers(application)
+    add_callback_handlers(application)
+
+    async def replay():
+        await application.initialize()
+        for data in (make_command_update(1, 7, "/myprofile"),
+                     make_callback_update(2, 7, "list:users:0")):
+            await application.process_update(Update.de_json(data, application.bot))
+        await application.shutdown()
+    asyncio.run(replay())
+
+    assert api.sent[0][0] == 7
+    assert "ID: `7`" in api.sent[0][1]
+    assert api.sent[1][1].startswith("👥 1 users:")
+    assert "answerCallbackQuery" in [method for method, _ in api.requests]
+    assert application.bot_data[HANDLER_STATS_KEY].commands["myprofile"].calls == 1
@@ -0,0 +1,36 @@
+"""
+Test for the latency statistics of the command handlers
+"""
+import asyncio
+import pytest
+from omar_bot.utils.handler_stats import CommandStats, HandlerStats, timed
+
+
+def test_percentiles():
+    """Test that the percentiles fall in the right buckets."""
+    stats = CommandStats()
+    for i in range(1, 101):
+        stats.record(i / 1000, failed=False)  # 1 ms to 100 ms
+    for p, exact in ((50, 0.050), (95, 0.095), (99, 0.099)):
+        assert exact <= stats.percentile(p) <= exact * 1.2
+    assert stats.max_time == 0.1
+    assert CommandStats().percentile(50) == 0.0
+    single = CommandStats()
+    single.record(0.0101, failed=False)
+    assert single.percentile(99) == 0.0101
+
+
+def test_timed_counts_calls_and_errors():
+    """Test that the wrapper records every call, failed or not."""
+    stats = HandlerStats()
+
+    async def handler(update, context):
+        if update == "bad":
+            raise ValueError(update)
+    wrapped = timed(handler, stats, "gems")
+    asyncio.run(wrapped("ok", None))
+    with pytest.raises(ValueError):
+        asyncio.run(wrapped("bad", None))
+
+    assert (stats.commands["gems"].calls, stats.commands["gems"].errors) == (2, 1)
+    assert stats.report()[0].startswith("/gems: 2 calls, 1 errors, p50 ")
@@ -0,0 +1,109 @@
+"""
+Test for the MessageQueue class, against the local fake Bot API
+"""
+import asyncio
+import time
+from telegram import Bot, Update
+from telegram.ext import Application
+from omar_bot.handlers.user_commands import add_user_handlers, USER_SERVICE_KEY, MESSAGE_QUEUE_KEY
+from omar_bot.services.message_queue import MessageQueue
+from omar_bot.services.user_service import UserService
+from omar_bot.utils.fake_api import FakeBotAPI, make_command_update
+
+
+def test_broadcast_stays_under_the_limits():
+    """Test that a broadcast is shaped to the global rate and interactive messages jump the line."""
+    api = FakeBotAPI(latency=0.001, chat_rate=1, global_rate=250)
+
+    async def run():
+        async with Bot("1:test", request=api) as bot:
+            queue = MessageQueue(bot, chat=(1, 1), total=(200, 10))
+            futures = queue.broadcast(range(1, 151), "news")
+            await asyncio.sleep(0.1)
+            reply = queue.send(999, "reply")
+            t = time.perf_counter()
+            await asyncio.gather(reply, *futures)
+            elapsed = time.perf_counter() - t
+            await queue.stop()
+            return queue, elapsed
+
+    queue, elapsed = asyncio.run(run())
+    assert queue.sent == 151 and queue.failed == 0
+    assert api.flood_errors == 0
+    assert elapsed > (150 - 10 - 0.1 * 200) / 200 * 0.8  # about 200 messages per second
+    assert [chat_id for chat_id, _ in api.sent].index(999) < 40
+
+
+def test_retry_after_pauses_and_retries():
+    """Test that the messages refused with 429 are sent after the pause."""
+    api = FakeBotAPI(global_rate=20, retry_after=0.05)
+
+    async def run():
+        async with Bot("1:test", request=api) as bot:
+            queue = MessageQueue(bot, chat=(100, 100), total=(1000, 1000))
+            results = await asyncio.gather(*queue.broadcast(range(1, 31), "news"))
+            await queue.stop()
+            return queue, results
+
+    queue, results = asyncio.run(run())
+    assert len(results) == 30 and queue.sent == 30
+    assert queue.retried == api.flood_errors > 0
+    assert sorted(chat_id for chat_id, _ in api.sent) == list(range(1, 31))
+
+
+def test_broadcast_command(temp_users_dir):
+    """Test that /broadcast sends to every user, then reports to the admin."""
+    service = UserService(users_dir=temp_users_dir)
+    for user_id in (1, 2, 3):
+        service.add_user(user_id, f"User {user_id}")
+    service.set(1, "admin", True)
+    api = FakeBotAPI()
+    application = Application.builder().token("1:test").request(api).get_updates_request(api).build()
+    application.bot_data[USER_SERVICE_KEY] = service
+    add_user_handlers(application)
+
+    async def run():
+        await application.initialize()
+        await application.start()
+        update = make_command_update(1, 1, "/broadcast Canvas reset tonight!")
+        await application.process_update(Update.de_json(update, application.bot))
+        await application.stop()  # Waits for the summary task
+        await application.bot_data[MESSAGE_QUEUE_KEY].stop()
+        await application.shutdown()
+    asyncio.run(run())
+
+    texts = [text for _, text in api.sent]
+    assert texts.count("Canvas reset tonight!") == 3
+    assert texts[-1] == "📣 Broadcast done: 3 sent, 0 failed."
+
+
+def test_replies_go_through_the_queue(temp_users_dir):
+    """Test that command replies during a broadcast jump the line and are retried after a 429."""
+    service = UserService(users_dir=temp_users_dir)
+    for user_id in range(1, 41):
+        service.add_user(user_id, f"User {user_id}")
+    service.set(1, "admin", True)
+    api = FakeBotAPI(global_rate=20, retry_after=0.05)
+    application = Application.builder().token("1:test").request(api).get_updates_request(api).build()
+    application.bot_data[USER_SERVICE_KEY] = service
+    application.bot_data[MESSAGE_QUEUE_KEY] = MessageQueue(application.bot, chat=(100, 100), total=(1000, 1000))
+    add_user_handlers(application)
+
+    async def run():
+        await application.initialize()
+        await application.start()
+        broadcast = make_command_update(1, 1, "/broadcast Canvas reset tonight!")
+        await application.process_update(Update.de_json(broadcast, application.bot))
+        await asyncio.sleep(0.01)  # the broadcast uses up the flood budget of the fake API
+        await application.process_update(Update.de_json(make_command_update(2, 2, "/myprofile"), application.bot))
+        await application.stop()
+        await application.bot_data[MESSAGE_QUEUE_KEY].stop()
+        await application.shutdown()
+    asyncio.run(run())
+
+    chat_ids = [chat_id for chat_id, _ in api.sent]
+    assert api.flood_errors > 0
+    assert chat_ids.count(2) == 2  # the broadcast and the profile
+    texts = [text for _, text in api.sent]
+    assert texts.index("📣 Broadcasting to 40 users...") < 20
+    assert [text.startswith("👤 Your Profile") for text in texts].index(True) < 25
@@ -0,0 +1,110 @@
+"""
+Test for the Canvas class and the /place command
+"""
+import asyncio
+import pytest
+from pathlib import Path
+import tempfile
+from types import SimpleNamespace
+import numpy as np
+from omar_bot.handlers.user_commands import canvas_command, place_command, USER_SERVICE_KEY, CANVASES_KEY
+from omar_bot.services.place import Canvas, CanvasRenderer, EMPTY, EMPTY_TILE, UNKNOWN_TILE, canvas_name
+from omar_bot.services.user_service import UserService
+
+
+def test_load_place_and_reload(tmp_path):
+    """The CSV is converted once, placed tiles are kept in the .npy file."""
+    (tmp_path / "mini.csv").write_text("0,0,0\n0,6337524767,0\n")
+    canvas = Canvas.load("mini", tmp_path)
+    assert (canvas.width, canvas.height) == (3, 2)
+    assert canvas.grid.dtype == np.int64
+    assert canvas.get(1, 1) == 6337524767
+    assert canvas.place(2, 0, 42) == EMPTY
+    assert canvas.place(2, 0, 43) == 42
+    canvas.flush()
+    del canvas
+
+    (tmp_path / "mini.csv").write_text("0,0,0\n0,0,0\n")  # no longer read
+    canvas = Canvas.load("mini", tmp_path)
+    assert canvas.get(2, 0) == 43
+    canvas.to_csv(tmp_path / "export.csv")
+    assert (tmp_path / "export.csv").read_text() == "0,0,43\n0,6337524767,0\n"
+
+
+def test_bounds():
+    """Tiles outside the canvas are refused, negative coordinates included."""
+    canvas = Canvas(np.zeros((2, 3), dtype=np.int64))
+    for x, y in ((3, 0), (0, 2), (-1, 0), (0, -1)):
+        assert not canvas.in_bounds(x, y)
+        with pytest.raises(IndexError):
+            canvas.place(x, y, 1)
+    assert not canvas.grid.any()
+    with pytest.raises(FileNotFoundError):
+        Canvas.load("missing", Path(tempfile.gettempdir()))
+    assert canvas_name("default.csv") == "default"
+
+
+def test_place_command(temp_users_dir, fake_update):
+    """Test the placement, the cooldown and the updated user fields."""
+    service = UserService(users_dir=temp_users_dir)
+    service.add_user(1, "Alice")
+    canvas = Canvas(np.zeros((4, 4), dtype=np.int64))
+    update = fake_update(1, "Alice")
+    replies = update.replies
+    context = SimpleNamespace(bot_data={USER_SERVICE_KEY: service, CANVASES_KEY: {"default": canvas}})
+
+    for args in ([], ["1"], ["a", "b"], ["4", "0"], ["1", "2"], ["2", "2"]):
+        context.args = args
+        asyncio.run(place_command(update, context))
+    assert replies[:3] == ["❌ Usage: /place <x> <y>"] * 3
+    assert replies[3].startswith("❌ The canvas default is 4x4")
+    assert replies[4] == "🧱 Tile placed at (1, 2) on the canvas default."
+    assert replies[5].startswith("⏳ You can place your next tile in ")
+    assert canvas.get(1, 2) == 1 and canvas.get(2, 2) == EMPTY
+    assert service.get(1, "tiles_count") == 1
+
+    service.set(1, "last_place_time", 0)
+    asyncio.run(place_command(update, context))
+    assert canvas.get(2, 2) == 1
+    assert service.get(1, "tiles_count") == 2
+
+
+def test_renderer_redraws_only_changed_rows(temp_users_dir):
+    """Rows are redrawn after a placement in them or an emoji change of their users."""
+    service = UserService(users_dir=temp_users_dir)
+    for user_id, emoji in ((1, "🐱"), (2, "🐶")):
+        service.add_user(user_id, f"user{user_id}")
+        service.set(user_id, "emoji", emoji)
+    canvas = Canvas(np.array([[1, 0, 0], [0, 2, 0], [0, 0, 0]], dtype=np.int64))
+    renderer = CanvasRenderer(canvas, service)
+    assert renderer.render() == "🐱⬜⬜\n⬜🐶⬜\n⬜⬜⬜"
+    assert renderer.render() == "🐱⬜⬜\n⬜🐶⬜\n⬜⬜⬜"
+    assert renderer.rendered_rows == 3
+
+    canvas.place(2, 2, 1)
+    canvas.place(0, 2, 3)  # unknown user
+    assert renderer.render().endswith(f"\n{UNKNOWN_TILE}{EMPTY_TILE}🐱")
+    assert renderer.rendered_rows == 4
+
+    service.set(2, "emoji", "🦊")
+    assert renderer.render().split("\n")[1] == "⬜🦊⬜"
+    assert renderer.rendered_rows == 5
+    service.set(1, "emoji", "🐯")
+    assert renderer.render() == "🐯⬜⬜\n⬜🦊⬜\n⬛⬜🐯"
+    assert renderer.rendered_rows == 7
+
+
+def test_canvas_command(temp_users_dir, fake_update):
+    """Test that /canvas shows the canvas of the user."""
+    service = UserService(users_dir=temp_users_dir)
+    service.add_user(1, "Alice")
+    service.set(1, "emoji", "🐱")
+    update = fake_update(1, "Alice")
+    replies = update.replies
+    canvases = {"default": Canvas(np.array([[1, 0]], dtype=np.int64)),
+                "maxi": Canvas(np.zeros((100, 100), dtype=np.int64))}
+    context = SimpleNamespace(bot_data={USER_SERVICE_KEY: service, CANVASES_KEY: canvases}, args=[])
+    asyncio.run(canvas_command(update, context))
+    service.set(1, "canvas", "maxi.csv")
+    asyncio.run(canvas_command(update, context))
+    assert replies == ["🐱⬜", "❌ The canvas maxi is too large to be shown in a message."]
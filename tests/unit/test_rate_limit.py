@@ -0,0 +1,55 @@
+"""
+Test for the rate limiting of the command handlers
+"""
+import asyncio
+from types import SimpleNamespace
+from omar_bot.utils.rate_limit import RateLimiter, TokenBuckets, rate_limited
+
+
+class FakeClock:
+    """Clock advanced by hand."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_refills():
+    """Test that a bucket allows a burst, then refills at its rate."""
+    buckets = TokenBuckets(rate=2, burst=3)
+    for _ in range(3):
+        buckets.take("a", 0.0)
+    assert buckets.tokens("a", 0.0) == 0
+    assert buckets.tokens("a", 0.5) == 1
+    assert buckets.tokens("a", 10.0) == 3
+    assert buckets.tokens("b", 0.0) == 3
+
+
+def test_user_chat_and_global_budgets():
+    """Test that each level limits on its own and a denied call costs nothing."""
+    clock = FakeClock()
+    limiter = RateLimiter(user=(1, 2), chat=(1, 3), total=(1, 4), clock=clock)
+    assert [limiter.allow(1, 10) for _ in range(3)] == [True, True, False]  # user budget
+    assert limiter.allow(2, 10)
+    assert not limiter.allow(3, 10)  # chat budget
+    assert limiter.allow(3, 20)
+    assert not limiter.allow(4, 30)  # global budget
+    assert limiter.dropped == 3
+
+    clock.now = 1.0
+    assert limiter.allow(4, 30)
+
+
+def test_throttled_update_skips_handler():
+    """Test that the wrapped handler does not run once the budget is spent."""
+    calls = []
+
+    async def handler(update, context):
+        calls.append(update)
+    wrapped = rate_limited(handler, RateLimiter(user=(0.1, 2), clock=FakeClock()))
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=1), effective_chat=SimpleNamespace(id=1))
+    for _ in range(5):
+        asyncio.run(wrapped(update, None))
+    assert len(calls) == 2
+    assert wrapped.__name__ == "handler"
@@ -0,0 +1,107 @@
+"""
+Test for the RenderCache class and the cached, paginated list replies
+"""
+import asyncio
+from types import SimpleNamespace
+from omar_bot.handlers import callback_handlers
+from omar_bot.handlers.user_commands import (
+    gems_command, leaderboard_command, render_list_page, USER_SERVICE_KEY, RENDER_CACHE_KEY
+)
+from omar_bot.services.render_cache import RenderCache
+from omar_bot.services.user_service import UserService
+
+
+def test_cache_rebuilds_on_new_version():
+    """Test that the builder runs only when the version changes."""
+    cache = RenderCache()
+    builds = []
+    build = lambda: builds.append(1) or len(builds)
+    assert cache.get("gems", 1, build) == 1
+    assert cache.get("gems", 1, build) == 1
+    assert cache.get("gems", 2, build) == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_gems_reply_is_cached(temp_users_dir, fake_update):
+    """Test that /gems is rebuilt only after a relevant change."""
+    service = UserService(users_dir=temp_users_dir)
+    service.add_user(1, "Alice")
+    service.add_user(2, "Bob")
+    service.update(1, gems=5, emoji="🐱")
+    update = fake_update(1, "Alice")
+    replies = update.replies
+    context = SimpleNamespace(bot_data={USER_SERVICE_KEY: service}, args=[])
+
+    asyncio.run(gems_command(update, context))
+    service.set(2, "gold", 1)  # not shown by /gems
+    asyncio.run(gems_command(update, context))
+    service.set(2, "gems", 7)
+    asyncio.run(gems_command(update, context))
+
+    cache = context.bot_data[RENDER_CACHE_KEY]
+    assert (cache.hits, cache.misses) == (2, 4)  # the ID snapshot and the page
+    assert replies[0] == replies[1]
+    assert replies[0].startswith("💎 1 users with gems:\n🐱 ")
+    assert replies[2].startswith("💎 2 users with gems:")
+    assert replies[2].endswith(":  7\n")
+
+
+def test_list_pages(temp_users_dir):
+    """Test that lists are split in pages with buttons to move between them."""
+    service = UserService(users_dir=temp_users_dir)
+    for user_id in range(1, 6):
+        service.add_user(user_id, f"User {user_id}")
+    context = SimpleNamespace(bot_data={USER_SERVICE_KEY: service}, args=[])
+
+    text, keyboard = render_list_page(context, "users", 0, page_size=2)
+    assert text.startswith("👥 5 users: (page 1/3)\n")
+    assert len(text.splitlines()) == 3
+    assert [b.callback_data for b in keyboard.inline_keyboard[0]] == ["list:users:1"]
+
+    text, keyboard = render_list_page(context, "users", 7, page_size=2)  # clamped to the last page
+    assert text.startswith("👥 5 users: (page 3/3)\n")
+    assert [b.callback_data for b in keyboard.inline_keyboard[0]] == ["list:users:1"]
+
+    text, keyboard = render_list_page(context, "gems", 0, page_size=2)
+    assert text == "No users found." and keyboard is None
+
+
+def test_page_callback_edits_message(temp_users_dir, monkeypatch):
+    """Test that a page button replaces the message with the requested page."""
+    monkeypatch.setattr(callback_handlers, "render_list_page",
+                        lambda context, name, page: render_list_page(context, name, page, page_size=1))
+    service = UserService(users_dir=temp_users_dir)
+    service.add_user(1, "Alice")
+    service.add_user(2, "Bob")
+    edits = []
+
+    async def answer():
+        pass
+
+    async def edit_message_text(msg, **kwargs):
+        edits.append((msg, kwargs["reply_markup"]))
+    query = SimpleNamespace(data="list:users:1", answer=answer, edit_message_text=edit_message_text)
+    update = SimpleNamespace(callback_query=query, effective_user=SimpleNamespace(full_name="Alice"))
+    context = SimpleNamespace(bot_data={USER_SERVICE_KEY: service}, args=[])
+
+    asyncio.run(callback_handlers.list_page_callback(update, context))
+    msg, keyboard = edits[0]
+    assert msg.startswith("👥 2 users: (page 2/2)\n")
+    assert [b.callback_data for b in keyboard.inline_keyboard[0]] == ["list:users:0"]
+
+
+def test_leaderboard(temp_users_dir, fake_update):
+    """Test that /leaderboard ranks the users by the requested field."""
+    service = UserService(users_dir=temp_users_dir, rank_keys=("tiles_count",))
+    for user_id, tiles in ((1, 3), (2, 9), (3, 0)):
+        service.add_user(user_id, f"User {user_id}")
+        service.set(user_id, "tiles_count", tiles)
+    update = fake_update(1, "User 1")
+    replies = update.replies
+    context = SimpleNamespace(bot_data={USER_SERVICE_KEY: service}, args=["tiles"])
+
+    asyncio.run(leaderboard_command(update, context))
+    lines = replies[0].splitlines()
+    assert lines[0] == "🧱 Top 3 by tiles placed:"
+    assert lines[1].startswith("🥇") and lines[1].endswith(":  9")
+    assert lines[3].startswith("🥉") and lines[3].endswith(":  0")
@@ -0,0 +1,223 @@
+"""
+Test for the SantaService class
+"""
+import asyncio
+import itertools
+import random
+import pytest
+from types import SimpleNamespace
+from omar_bot.handlers.user_commands import santa_command, USER_SERVICE_KEY, SANTA_SERVICES_KEY, SANTA_GROUPS_KEY
+from omar_bot.services.santa import SantaService, assign_cycle, group_key, member_group_keys
+
+
+def check_cycle(participants, pairs, forbidden=()):
+    """Every participant gives once and receives once, to someone else, in one cycle."""
+    givers = [giver for giver, _ in pairs]
+    receivers = [receiver for _, receiver in pairs]
+    assert sorted(givers) == sorted(participants)
+    assert sorted(receivers) == sorted(participants)
+    assert all(giver != receiver for giver, receiver in pairs)
+    assert not set(pairs) & set(forbidden)
+    receiver_of = dict(pairs)
+    user_id, length = givers[0], 0
+    while True:
+        user_id, length = receiver_of[user_id], length + 1
+        if user_id == givers[0]:
+            break
+    assert length == len(participants)
+
+
+def test_assign_cycle_properties():
+    """Random sizes and constraints never give a self-assignment nor a forbidden pair."""
+    rng = random.Random(0)
+    for _ in range(300):
+        participants = rng.sample(range(10_000), rng.randrange(2, 60))
+        forbidden = set()
+        if len(participants) > 4:
+            for _ in range(rng.randrange(len(participants))):
+                forbidden.add(tuple(rng.sample(participants, 2)))
+        pairs = assign_cycle(participants, random.Random(rng.random()), forbidden)
+        assert pairs
+        check_cycle(participants, pairs, forbidden)
+
+
+def has_cycle(participants, forbidden):
+    """Brute force: True if some gift cycle avoids the forbidden pairs."""
+    first, others = participants[0], participants[1:]
+    for rest in itertools.permutations(others):
+        order = (first,) + rest
+        if all((order[i], order[(i + 1) % len(order)]) not in forbidden for i in range(len(order))):
+            return True
+    return False
+
+
+def test_assign_cycle_finds_every_possible_draw():
+    """With last year's cycle and couples excluded, a draw is found whenever one exists."""
+    rng = random.Random(1)
+    for _ in range(1_500):
+        participants = list(range(1, rng.randrange(3, 8) + 1))
+        last_year = participants[:]
+        rng.shuffle(last_year)
+        forbidden = {(last_year[i], last_year[(i + 1) % len(last_year)]) for i in range(len(last_year))}
+        couples = participants[:]
+        rng.shuffle(couples)
+        for a, b in zip(couples[:rng.randrange(3)], couples[3:]):
+            forbidden |= {(a, b), (b, a)}
+        pairs = assign_cycle(participants, random.Random(rng.random()), forbidden)
+        assert bool(pairs) == has_cycle(participants, forbidden)
+        if pairs:
+            check_cycle(participants, pairs, forbidden)
+
+
+def test_assign_cycle_deterministic_and_isolated():
+    """The same seed gives the same cycle, and the global generator is untouched."""
+    participants = list(range(5_000))
+    random.seed(42)
+    expected = random.random()
+    random.seed(42)
+    first = assign_cycle(participants, random.Random("2026:santa"))
+    assert random.random() == expected
+    assert assign_cycle(participants, random.Random("2026:santa")) == first
+    check_cycle(participants, first)
+
+
+def test_assign_cycle_impossible():
+    """With 2 participants who cannot give to each other there is no cycle."""
+    assert assign_cycle([1], random.Random(0)) == []
+    assert assign_cycle([1, 2], random.Random(0), {(1, 2)}) == []
+
+
+def test_assign_pairs_constraints(user_service):
+    """Excluded users and last year's recipients are avoided."""
+    santa = SantaService(user_service)
+    for user_id in range(1, 7):
+        user_service.add_user(user_id, f"user{user_id}")
+        santa.join_santa(user_id)
+    user_service.set(1, "santa_exclude", [2])
+    last_year = santa.assign_pairs(2025)
+    this_year = santa.assign_pairs(2026)
+    excluded = {(1, 2), (2, 1)}
+    check_cycle(list(range(1, 7)), last_year, excluded)
+    check_cycle(list(range(1, 7)), this_year, excluded | set(last_year))
+    assert santa.assign_pairs(2026) == this_year
+    assert user_service.get(1, "santa_pair") == dict(this_year)[1]
+    assert user_service.get(1, "santa_history") == {"2025": dict(last_year)[1], "2026": dict(this_year)[1]}
+
+
+def test_assign_pairs_repeat_when_unavoidable(user_service):
+    """With 2 participants last year's pairs are the only ones left."""
+    santa = SantaService(user_service)
+    for user_id in (1, 2):
+        user_service.add_user(user_id, f"user{user_id}")
+        santa.join_santa(user_id)
+    assert sorted(santa.assign_pairs(2025)) == [(1, 2), (2, 1)]
+    assert sorted(santa.assign_pairs(2026)) == [(1, 2), (2, 1)]
+
+
+def test_get_pair_cached(user_service, monkeypatch):
+    """Queries reuse the draw without writing; a join draws again."""
+    santa = SantaService(user_service)
+    for user_id in range(1, 5):
+        user_service.add_user(user_id, f"user{user_id}")
+        santa.join_santa(user_id)
+    giftee, names = santa.get_pair(1)
+    assert giftee in (2, 3, 4)
+    assert names == ["user1", "user2", "user3", "user4"]
+
+    writes, draws = [], []
+    monkeypatch.setattr(user_service, "set", lambda *args: writes.append(args))
+    monkeypatch.setattr(santa, "get_participants", lambda: draws.append(1) or [1, 2, 3, 4])
+    for user_id in range(1, 5):
+        assert santa.get_pair(user_id)[0] == santa.get_assignment()[user_id]
+    assert writes == [] and draws == []
+    monkeypatch.undo()
+
+    user_service.add_user(5, "user5")
+    santa.join_santa(5)
+    assert sorted(santa.get_assignment()) == [1, 2, 3, 4, 5]
+    assert santa.get_pair(5)[1][-1] == "user5"
+    santa.reset_santa()
+    assert santa.get_pair(1) == (None, [])
+
+
+def test_group_key():
+    """Named groups get their own attribute, invalid names are refused."""
+    assert group_key() == "santa"
+    assert group_key("Office") == "santa_office"
+    for name in ("a b", "x" * 33, "pair", "my_group"):
+        with pytest.raises(ValueError):
+            group_key(name)
+
+
+def test_groups_are_independent(user_service):
+    """Each group has its own participants, pairs and index."""
+    office = SantaService(user_service, group_key("office"))
+    family = SantaService(user_service, group_key("family"))
+    for user_id in range(1, 6):
+        user_service.add_user(user_id, f"user{user_id}")
+        office.join_santa(user_id)
+    family.join_santa(1)
+    family.join_santa(2)
+    assert "santa_office" in user_service._indexes
+    assert office.get_participants() == [1, 2, 3, 4, 5]
+    assert family.get_participants() == [1, 2]
+    assert family.get_assignment() == {1: 2, 2: 1}
+    assert user_service.get(1, "santa_family_pair") == 2
+    assert sorted(office.get_assignment()) == [1, 2, 3, 4, 5]
+
+    office.leave_santa(3)
+    assert office.get_participants() == [1, 2, 4, 5]
+    assert user_service.get(3, "santa_office_pair") is None
+    family.reset_santa()
+    assert family.get_participants() == []
+    assert office.get_assignment()[1] == user_service.get(1, "santa_office_pair")
+
+
+def test_santa_command_creates_groups_only_on_join(user_service, fake_update):
+    """Unknown subcommands, unknown users and unknown groups leave no service nor index."""
+    user_service.add_user(1, "Alice")
+
+    def run(user_id, *args):
+        update = fake_update(user_id)
+        context = SimpleNamespace(bot_data=bot_data, args=list(args))
+        asyncio.run(santa_command(update, context))
+        return update.replies[-1]
+    bot_data = {USER_SERVICE_KEY: user_service}
+    indexes = set(user_service._indexes)
+
+    assert run(2, "bogus", "g1").startswith("❌ Unknown subcommand")
+    assert run(2, "join", "g2").startswith("❌ You need to register")
+    assert run(1, "who", "g3") == "❌ There is no Secret Santa group g3. Use /santa join g3 to start it."
+    assert run(1, "assign", "g4").startswith("❌ Only admins")
+    assert bot_data.get(SANTA_SERVICES_KEY, {}) == {}
+    assert set(user_service._indexes) == indexes
+
+    assert run(1, "join", "Office") == "🎅 You’ve joined the Secret Santa event in group office!"
+    assert list(bot_data[SANTA_SERVICES_KEY]) == ["santa_office"]
+    assert run(1, "status", "office").startswith("🎅 You are participating in group office")
+
+    del bot_data[SANTA_SERVICES_KEY], bot_data[SANTA_GROUPS_KEY]  # after a restart
+    assert run(1, "leave", "office") == "🎅 You’ve left the Secret Santa event in group office."
+    assert bot_data[SANTA_GROUPS_KEY] == {"santa_office"}  # found again, from its members
+
+
+def test_unknown_group_does_not_scan_users(user_service, fake_update, monkeypatch):
+    """Once the groups are known, an unknown group name is answered without reading the users."""
+    for user_id in range(1, 4):
+        user_service.add_user(user_id, f"user{user_id}")
+    SantaService(user_service, group_key("office")).join_santa(2)
+    assert member_group_keys(user_service) == {"santa_office"}
+    bot_data = {USER_SERVICE_KEY: user_service}
+
+    def run(*args):
+        update = fake_update(1)
+        asyncio.run(santa_command(update, SimpleNamespace(bot_data=bot_data, args=list(args))))
+        return update.replies[-1]
+    assert run("who", "family").startswith("❌ There is no Secret Santa group family")
+
+    def no_scan(*args):
+        raise AssertionError("scanned the users")
+    monkeypatch.setattr(user_service, "find", no_scan)
+    monkeypatch.setattr(user_service, "get_user_ids", no_scan)
+    for name in ("family", "friends", "team42"):
+        assert run("who", name).startswith(f"❌ There is no Secret Santa group {name}")
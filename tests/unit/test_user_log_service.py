@@ -0,0 +1,137 @@
+"""
+Test for the LogUserService class
+"""
+import threading
+import pytest
+from omar_bot.services.user_log_service import LogUserService, fcntl
+
+
+@pytest.fixture
+def user_service(temp_users_dir):
+    """Create a LogUserService instance using the temp directory."""
+    return LogUserService(users_dir=temp_users_dir)
+
+
+def test_changes_survive_reload(user_service):
+    """Test that the log replays to the same state."""
+    user_service.add_user(123, "Alice")
+    user_service.add_user(456, "Bob")
+    user_service.set(123, "gems", 10)
+    user_service.delete_attribute(123, "santa")
+    user_service.delete_user(456)
+
+    user_service2 = LogUserService(users_dir=user_service.users_dir)
+    assert user_service2.get_user_ids() == [123]
+    assert user_service2.get(123, "gems") == 10
+    assert "santa" not in user_service2.get_user(123)
+    assert user_service2.read_user(123) == user_service.get_user(123)
+
+
+def test_update_is_a_small_append(user_service):
+    """Test that setting a field appends a single short line."""
+    user_service.add_user(123, "Alice")
+    size = user_service.log_path.stat().st_size
+    user_service.set(123, "gems", 10)
+    appended = user_service.log_path.read_bytes()[size:]
+    assert appended == b'{"id":123,"set":{"gems":10}}\n'
+
+
+def test_compaction(temp_users_dir):
+    """Test that superseded records are dropped by compaction."""
+    service = LogUserService(users_dir=temp_users_dir, compact_min_records=10, compact_ratio=2)
+    service.add_user(123, "Alice")
+    for gems in range(20):
+        service.set(123, "gems", gems)
+    assert len(service.log_path.read_bytes().splitlines()) < 10
+
+    service2 = LogUserService(users_dir=temp_users_dir)
+    assert service2.get(123, "gems") == 19
+
+
+def test_torn_last_record_is_discarded(user_service):
+    """Test that an interrupted append does not break loading."""
+    user_service.add_user(123, "Alice")
+    with open(user_service.log_path, "ab") as f:
+        f.write(b'{"id":123,"set":{"ge')
+
+    user_service2 = LogUserService(users_dir=user_service.users_dir)
+    assert user_service2.get(123, "username") == "Alice"
+    user_service2.set(123, "gems", 3)
+    assert LogUserService(users_dir=user_service.users_dir).get(123, "gems") == 3
+
+
+def test_batch_is_a_single_append(user_service):
+    """Test that a batch over several users is appended in one write."""
+    user_service.add_user(1, "Alice")
+    user_service.add_user(2, "Bob")
+    size = user_service.log_path.stat().st_size
+    with user_service.batch():
+        user_service.update(1, gems=3, santa=True)
+        user_service.delete_attribute(2, "santa")
+    lines = user_service.log_path.read_bytes()[size:].splitlines()
+    assert sorted(lines) == [b'{"id":1,"set":{"gems":3,"santa":true}}', b'{"id":2,"del":["santa"]}']
+
+
+def test_batch_rollback_forgets_changed_fields(user_service):
+    """Test that the fields of a failed batch are not appended by the next change."""
+    user_service.add_user(1, "Alice")
+    with pytest.raises(RuntimeError):
+        with user_service.batch():
+            user_service.set(1, "gold", 7)
+            raise RuntimeError("abort")
+    size = user_service.log_path.stat().st_size
+    user_service.set(1, "gems", 3)
+    assert user_service.log_path.read_bytes()[size:] == b'{"id":1,"set":{"gems":3}}\n'
+
+
+def test_refresh_applies_appended_records(temp_users_dir):
+    """Test that refresh() replays what another instance appended."""
+    bot = LogUserService(users_dir=temp_users_dir, index_keys=("santa",))
+    bot.add_user(1, "Alice")
+    bot.add_user(2, "Bob")
+    assert bot.refresh() == 0
+
+    console = LogUserService(users_dir=temp_users_dir)
+    console.set(1, "santa", True)
+    console.delete_user(2)
+    assert bot.refresh() == 2
+    assert bot.get_user_ids() == [1]
+    assert bot.find("santa", True) == [1]
+
+    console.compact_log()
+    console.set(1, "gems", 4)
+    assert bot.refresh() == 1  # replayed from the start after the compaction
+    assert bot.get(1, "gems") == 4
+
+
+def test_compaction_keeps_records_of_other_writers(temp_users_dir):
+    """Test that compacting does not drop what another instance appended since the last read."""
+    bot = LogUserService(users_dir=temp_users_dir, compact_min_records=10, compact_ratio=2)
+    bot.add_user(1, "Alice")
+    bot.add_user(2, "Bob")
+    console = LogUserService(users_dir=temp_users_dir)
+    console.set(2, "gems", 77)
+    for gems in range(20):
+        bot.set(1, "gems", gems)  # compacts the log
+    assert len(bot.log_path.read_bytes().splitlines()) < 10
+
+    assert bot.get(2, "gems") == 77
+    assert LogUserService(users_dir=temp_users_dir).get(2, "gems") == 77
+    bot.refresh()
+    assert bot.get(2, "gems") == 77
+
+
+@pytest.mark.skipif(fcntl is None, reason="flock is not available")
+def test_appends_wait_for_the_lock(user_service):
+    """Test that an append waits while another writer holds the lock of the log."""
+    user_service.add_user(1, "Alice")
+    console = LogUserService(users_dir=user_service.users_dir)
+    size = user_service.log_path.stat().st_size
+    with console._locked():
+        writer = threading.Thread(target=user_service.set, args=(1, "gems", 5))
+        writer.start()
+        writer.join(0.2)
+        assert writer.is_alive()
+        assert user_service.log_path.stat().st_size == size
+    writer.join()
+    assert LogUserService(users_dir=user_service.users_dir).get(1, "gems") == 5
@@ -1,27 +1,12 @@
 """
 Test for the UserService class
 """
+import asyncio
+import json
 import pytest
-from pathlib import Path
-import tempfile
-import shutil
 from omar_bot.services.user_service import UserService
 
 
-@pytest.fixture
-def temp_users_dir():
-    """Create a temporary directory for user data."""
-    temp_dir = Path(tempfile.mkdtemp())
-    yield temp_dir
-    shutil.rmtree(temp_dir)  # Cleanup after test
-
-
-@pytest.fixture
-def user_service(temp_users_dir):
-    """Create a UserService instance using the temp directory."""
-    return UserService(users_dir=temp_users_dir)
-
-
 def test_add_user(user_service):
     """Test adding a new user."""
     user = user_service.add_user(123, "Alice")
@@ -114,4 +99,374 @@ def test_is_admin_and_get_admin_ids(user_service):
     # Make Alice an admin
     user_service.set(123, "admin", True)
     assert user_service.is_admin(123)
-    assert user_service.get_admin_ids() == [123]
\ No newline at end of file
+    assert user_service.get_admin_ids() == [123]
+
+
+def test_close_keeps_data_on_disk(user_service):
+    """Test that closing the service leaves the data readable."""
+    user_service.add_user(123, "Alice")
+    user_service.set(123, "gems", 5)
+    user_service.close()
+    user_service.close()  # closing twice is harmless
+    assert user_service.closed
+
+    user_service2 = UserService(users_dir=user_service.users_dir)
+    assert user_service2.get(123, "gems") == 5
+
+
+@pytest.fixture
+def buffered_service(temp_users_dir):
+    """Create a UserService in write-behind mode."""
+    return UserService(users_dir=temp_users_dir, write_behind=True,
+                       flush_interval=3600, flush_threshold=3)
+
+
+def test_write_behind_defers_writes(buffered_service):
+    """Test that changes stay in memory until flushed."""
+    buffered_service.add_user(123, "Alice")
+    buffered_service.set(123, "gems", 10)
+    assert buffered_service.get(123, "gems") == 10  # reads see the latest state
+    assert not (buffered_service.users_dir / "123.json").exists()
+    assert buffered_service.has_pending_changes()
+
+    buffered_service.flush()
+    assert not buffered_service.has_pending_changes()
+    assert UserService(users_dir=buffered_service.users_dir).get(123, "gems") == 10
+
+
+def test_write_behind_threshold_and_close(buffered_service):
+    """Test that the size threshold and close() write the dirty users."""
+    users_dir = buffered_service.users_dir
+    buffered_service.add_user(1, "Alice")
+    buffered_service.add_user(2, "Bob")
+    assert not list(users_dir.glob("*.json"))
+    buffered_service.add_user(3, "Carol")  # third dirty user triggers a flush
+    assert len(list(users_dir.glob("*.json"))) == 3
+
+    buffered_service.delete_user(1)
+    assert (users_dir / "1.json").exists()
+    buffered_service.close()
+    assert not (users_dir / "1.json").exists()
+
+
+def test_compact_encoding(temp_users_dir):
+    """Test that compact files are smaller and load back the same."""
+    pretty = UserService(users_dir=temp_users_dir / "pretty")
+    compact = UserService(users_dir=temp_users_dir / "compact", compact=True, fsync=True)
+    for service in (pretty, compact):
+        service.add_user(123, "Alice")
+        service.set(123, "emoji", "🐶")
+    pretty_size = (pretty.users_dir / "123.json").stat().st_size
+    compact_size = (compact.users_dir / "123.json").stat().st_size
+    assert compact_size < pretty_size
+    assert UserService(users_dir=compact.users_dir).get(123, "emoji") == "🐶"
+
+
+def test_interrupted_write_is_ignored(user_service):
+    """Test that a leftover temporary file does not break loading."""
+    user_service.add_user(123, "Alice")
+    tmp_path = user_service.users_dir / "123.json.tmp"
+    tmp_path.write_text('{"username": "Ali', encoding="utf-8")  # truncated write
+
+    user_service2 = UserService(users_dir=user_service.users_dir)
+    assert user_service2.get(123, "username") == "Alice"
+    assert not tmp_path.exists()
+
+
+def test_secondary_index(temp_users_dir):
+    """Test that find() follows every kind of change through the index."""
+    service = UserService(users_dir=temp_users_dir, index_keys=("santa",))
+    service.add_user(1, "Alice")
+    service.add_user(2, "Bob")
+    service.add_user(3, "Carol")
+    assert service.find("santa", False) == [1, 2, 3]
+
+    service.set(1, "santa", True)
+    service.set(3, "santa", True)
+    assert service.find("santa", True) == [1, 3]
+
+    service.delete_attribute(3, "santa")
+    service.delete_user(1)
+    assert service.find("santa", True) == []
+    assert service.find("santa", False) == [2]
+
+    # Indexes are rebuilt when the data is loaded again
+    service2 = UserService(users_dir=temp_users_dir, index_keys=("santa",))
+    service2.add_index("nickname")
+    assert service2.find("santa", False) == [2]
+    assert service2.find("nickname", service2.get(2, "nickname")) == [2]
+
+
+def test_update_writes_once(user_service, monkeypatch):
+    """Test that update() saves several fields with a single write."""
+    user_service.add_user(123, "Alice")
+    writes = []
+    monkeypatch.setattr(user_service, "_save_user", writes.append)
+    user_service.update(123, gems=5, gold=2, santa=True)
+    assert writes == [123]
+    assert user_service.get(123, "gold") == 2
+
+
+def test_batch_rollback(temp_users_dir):
+    """Test that a failing batch leaves memory, indexes and disk untouched."""
+    service = UserService(users_dir=temp_users_dir, index_keys=("santa",))
+    service.add_user(1, "Alice")
+    service.add_user(2, "Bob")
+
+    with pytest.raises(RuntimeError):
+        with service.batch():
+            service.set(1, "santa", True)
+            service.delete_user(2)
+            service.add_user(3, "Carol")
+            raise RuntimeError("abort")
+
+    assert service.get_user_ids() == [1, 2]
+    assert service.get(1, "santa") is False
+    assert service.find("santa", True) == []
+    assert service.find("santa", False) == [1, 2]
+    assert UserService(users_dir=temp_users_dir).get_user_ids() == [1, 2]
+
+
+
+def test_failed_batch_write_is_retried(user_service, monkeypatch):
+    """Test that the users of a batch whose write failed are written by the next flush."""
+    user_service.add_user(1, "Alice")
+
+    def fail(user_ids):
+        raise OSError("disk full")
+    monkeypatch.setattr(user_service, "_persist", fail)
+    with pytest.raises(OSError):
+        user_service.update(1, gems=5)
+    assert user_service.has_pending_changes()
+
+    monkeypatch.undo()
+    user_service.flush()
+    assert not user_service.has_pending_changes()
+    assert UserService(users_dir=user_service.users_dir).get(1, "gems") == 5
+
+
+def test_lazy_loading(temp_users_dir):
+    """Test that the lazy mode sees the same data, reading only the accessed files."""
+    service = UserService(users_dir=temp_users_dir)
+    for user_id in range(1, 21):
+        service.add_user(user_id, f"User {user_id}")
+    service.set(7, "gems", 70)
+
+    service2 = UserService(users_dir=temp_users_dir, lazy=True)
+    assert service2.get_user_ids() == list(range(1, 21))
+    assert service2.get(7, "gems") == 70
+    assert service2.get_user(20) == service.get_user(20)
+    assert service2._users.loaded_count() == 2
+
+
+def test_refresh_reads_only_changed_files(temp_users_dir, monkeypatch):
+    """Test that refresh() picks up another instance's changes file by file."""
+    bot = UserService(users_dir=temp_users_dir, index_keys=("santa",))
+    for user_id in range(1, 6):
+        bot.add_user(user_id, f"User {user_id}")
+    assert bot.refresh() == 0  # own writes are not reloaded
+
+    console = UserService(users_dir=temp_users_dir)
+    console.set(2, "santa", True)
+    console.delete_user(3)
+    console.add_user(6, "Frank")
+
+    reads = []
+    load_user = bot._load_user
+    monkeypatch.setattr(bot, "_load_user", lambda uid: reads.append(uid) or load_user(uid))
+    assert bot.refresh() == 3
+    assert sorted(reads) == [2, 6]
+    assert bot.get_user_ids() == [1, 2, 4, 5, 6]
+    assert bot.find("santa", True) == [2]
+    assert bot.refresh() == 0
+
+
+def test_columnar_layout(temp_users_dir):
+    """Test that the columnar layout behaves like the dict layout."""
+    service = UserService(users_dir=temp_users_dir, columnar=True, index_keys=("santa",))
+    for user_id, gems in ((1, 5), (2, 30), (3, 30), (4, 0)):
+        service.add_user(user_id, f"User {user_id}")
+        service.set(user_id, "gems", gems)
+    service.set(2, "gold", 1.5)  # does not fit the integer column
+    service.set(3, "santa", True)
+    service.delete_attribute(4, "gems")
+
+    user = service.get_user(2)
+    assert user["gems"] == 30 and type(user["gems"]) is int
+    assert user["gold"] == 1.5
+    assert user["admin"] is False
+    assert "gems" not in service.get_user(4)
+    assert service.top("gems", 2) == [2, 3]
+    assert service.total("gems") == 65
+    assert service.having("gems") == [1, 2, 3]
+    assert service.find("santa", True) == [3]
+
+    service.delete_user(1)
+    service.add_user(5, "User 5")  # reuses the free slot
+    assert service.get(5, "gems") == 0
+    assert UserService(users_dir=temp_users_dir).get_user(2) == dict(user)
+
+
+def test_queries_match_between_layouts(tmp_path):
+    """Test that having(), total() and top() agree for the dict and columnar layouts."""
+    results = []
+    for columnar in (False, True):
+        service = UserService(users_dir=tmp_path / str(columnar), columnar=columnar)
+        for user_id in (1, 2, 3, 4):
+            service.add_user(user_id, f"User {user_id}")
+        service.set(1, "gems", 5)
+        service.set(2, "gems", 4.5)
+        service.set(3, "gems", 2 ** 70)  # does not fit int64
+        service.set(4, "gems", True)
+        service.set(2, "gold", 1.5)
+        service.set(3, "gold", 2)
+        service.set(3, "gold", 2.25)  # moves from the column to the extras
+        service.set(1, "gold", 0.5)
+        service.set(1, "gold", 3)  # and back
+        results.append([(service.having(key), service.total(key), service.top(key, 3))
+                        for key in ("gems", "gold", "tiles_count")])
+        service.delete_user(2)
+        results[-1].append((service.having("gold"), service.total("gold"), service.top("gold")))
+    assert results[0] == results[1]
+    assert results[0][1] == ([1, 2, 3], 6.75, [1, 3, 2])
+
+def test_version_tracks_fields(user_service):
+    """Test that version() changes only with the given fields or the set of users."""
+    user_service.add_user(1, "Alice")
+    version = user_service.version("gems")
+    user_service.set(1, "gold", 2)
+    assert user_service.version("gems") == version
+    user_service.set(1, "gems", 2)
+    assert user_service.version("gems") != version
+
+    version = user_service.version("gems")
+    with pytest.raises(RuntimeError):
+        with user_service.batch():
+            user_service.delete_user(1)
+            raise RuntimeError
+    assert user_service.version("gems") != version  # the rollback replaced the user
+
+
+def test_ranking_follows_changes(temp_users_dir):
+    """Test that a ranked field gives the same top() as a full scan."""
+    service = UserService(users_dir=temp_users_dir, rank_keys=("gems",))
+    for user_id, gems in ((1, 5), (2, 30), (3, 30), (4, 7)):
+        service.add_user(user_id, f"User {user_id}")
+        service.set(user_id, "gems", gems)
+    service.set(1, "gems", 50)
+    service.set(4, "gems", "many")  # not a number, left out
+    service.delete_user(3)
+    with pytest.raises(RuntimeError):
+        with service.batch():
+            service.set(2, "gems", 0)
+            raise RuntimeError
+    assert service.top("gems", 3) == [1, 2]
+
+    service.set(4, "gems", 40)
+    assert service.top("gems", 2) == [1, 4]
+    assert service.top("gems") == UserService(users_dir=temp_users_dir).top("gems")
+
+
+def test_concurrent_updates_are_not_lost(temp_users_dir):
+    """Stress test: thousands of concurrent read-modify-write updates on a few users."""
+    service = UserService(users_dir=temp_users_dir, write_behind=True, rank_keys=("gems",))
+    n_users, n_updates = 20, 4000
+    for user_id in range(n_users):
+        service.add_user(user_id, f"User {user_id}")
+
+    async def award(user_id: int, gems: int, locked: bool) -> None:
+        """Like a handler that reads the balance, replies, then saves it."""
+        if locked:
+            async with service.lock(user_id):
+                balance = service.get(user_id, "gems")
+                await asyncio.sleep(0)  # e.g. sending a message
+                service.set(user_id, "gems", balance + gems)
+        else:
+            balance = service.get(user_id, "gems")
+            await asyncio.sleep(0)
+            service.set(user_id, "gems", balance + gems)
+
+    async def run(locked: bool) -> None:
+        await asyncio.gather(*(award(i % n_users, 1 + i % 3, locked) for i in range(n_updates)))
+
+    expected = {user_id: sum(1 + i % 3 for i in range(user_id, n_updates, n_users))
+                for user_id in range(n_users)}
+    asyncio.run(run(locked=True))
+    assert {user_id: service.get(user_id, "gems") for user_id in range(n_users)} == expected
+    assert service.total("gems") == sum(expected.values())
+    assert service.top("gems", 1) == [max(expected, key=lambda uid: (expected[uid], -uid))]
+    assert not service._locks  # released locks are dropped
+
+    service.flush()
+    assert UserService(users_dir=temp_users_dir).get(0, "gems") == expected[0]
+
+    asyncio.run(run(locked=False))  # without the locks, updates are lost
+    assert service.total("gems") < 2 * sum(expected.values())
+
+
+def test_increment(user_service):
+    """Test adding to a numeric field."""
+    user_service.add_user(1, "Alice")
+    assert user_service.increment(1, "gems", 5) == 5
+    assert user_service.increment(1, "gold") == 1
+    assert user_service.get(1, "gold") == 1
+
+
+def test_snapshot_restart(temp_users_dir, monkeypatch):
+    """Test that a restart uses the snapshot, unless a user file changed since."""
+    snapshot_path = temp_users_dir.parent / f"{temp_users_dir.name}.snapshot"
+    try:
+        service = UserService(users_dir=temp_users_dir, snapshot_path=snapshot_path, write_behind=True)
+        service.add_user(1, "Alice")
+        service.set(1, "gems", 3)
+        service.close()  # flushes, then saves the snapshot
+
+        def no_file_reads(self, user_id):
+            raise AssertionError("user file read")
+        with monkeypatch.context() as m:
+            m.setattr(UserService, "_load_user", no_file_reads)
+            restarted = UserService(users_dir=temp_users_dir, snapshot_path=snapshot_path)
+        assert restarted.get(1, "gems") == 3
+        assert restarted.refresh() == 0
+
+        UserService(users_dir=temp_users_dir).set(1, "gems", 4)  # e.g. the console
+        restarted = UserService(users_dir=temp_users_dir, snapshot_path=snapshot_path)
+        assert restarted.get(1, "gems") == 4
+        restarted.close()
+
+        with open(temp_users_dir / "1.json", "r+", encoding="utf-8") as f:  # edited in place
+            data = json.load(f)
+            data["gems"] = 99
+            f.seek(0)
+            f.write(json.dumps(data))
+            f.truncate()
+        assert restarted.refresh() == 1
+        assert restarted.get(1, "gems") == 99
+        restarted = UserService(users_dir=temp_users_dir, snapshot_path=snapshot_path)
+        assert restarted.get(1, "gems") == 99
+    finally:
+        snapshot_path.unlink(missing_ok=True)
+
+
+def test_create_user_service_overrides(temp_users_dir):
+    """Test that the settings can be overridden, as the console does."""
+    from omar_bot.services.user_storage import create_user_service
+    service = create_user_service(users_dir=temp_users_dir, snapshot_path=None, write_behind=False)
+    assert type(service) is UserService
+    assert service.users_dir == temp_users_dir
+    assert not service.write_behind
+
+
+def test_handlers_fall_back_to_the_configured_backend(temp_users_dir, monkeypatch):
+    """Test that without a shared service the handlers build one from the settings."""
+    from types import SimpleNamespace
+    from omar_bot.handlers import user_commands
+    from omar_bot.services import user_storage
+    from omar_bot.services.user_log_service import LogUserService
+    monkeypatch.setattr(user_storage, "USER_STORAGE", "log")
+    monkeypatch.setattr(user_storage, "USERS_LOG_PATH", temp_users_dir / "users.log")
+    context = SimpleNamespace(bot_data={})
+    service = user_commands.get_user_service(context)
+    assert type(service) is LogUserService
+    assert service.log_path == temp_users_dir / "users.log"
+    assert user_commands.get_user_service(context) is service
@@ -0,0 +1,96 @@
+"""
+Test for the SqliteUserService class
+"""
+import pytest
+from omar_bot.services import user_storage
+from omar_bot.services.user_service import UserService
+from omar_bot.services.user_sqlite_service import SqliteUserService
+
+
+@pytest.fixture
+def user_service(temp_users_dir):
+    """Create a SqliteUserService instance using the temp directory."""
+    service = SqliteUserService(users_dir=temp_users_dir)
+    yield service
+    service.close()
+
+
+def test_changes_survive_reload(user_service):
+    """Test that hot and extra fields are stored and read back."""
+    user_service.add_user(123, "Alice")
+    user_service.set(123, "gems", 10)
+    user_service.set(123, "admin", True)
+    user_service.set(123, "favourite", ["tea", 2])
+    user_service.delete_attribute(123, "santa")
+    user_service.set(123, "canvas", None)
+    user_service.close()
+
+    user_service2 = SqliteUserService(users_dir=user_service.users_dir)
+    user = user_service2.get_user(123)
+    assert user["gems"] == 10
+    assert user["admin"] is True
+    assert user["favourite"] == ["tea", 2]
+    assert "santa" not in user
+    assert "canvas" in user and user["canvas"] is None
+    assert user == user_service.get_user(123)
+    user_service2.close()
+
+
+def test_indexed_queries(temp_users_dir):
+    """Test find(), top() and get_admin_ids(), also with buffered writes."""
+    service = SqliteUserService(users_dir=temp_users_dir, write_behind=True, flush_interval=3600)
+    for user_id, gems in ((1, 5), (2, 30), (3, 30), (4, 0)):
+        service.add_user(user_id, f"User {user_id}")
+        service.set(user_id, "gems", gems)
+    service.set(3, "admin", True)
+    service.set(4, "santa", True)
+
+    assert service.get_admin_ids() == [3]
+    assert service.find("santa", True) == [4]
+    assert service.top("gems", 3) == [2, 3, 1]
+    service.close()
+
+
+def test_import_json_dir(temp_users_dir):
+    """Test the one-shot import of the JSON directory layout."""
+    json_service = UserService(users_dir=temp_users_dir / "users")
+    json_service.add_user(123, "Alice")
+    json_service.set(123, "gold", 7)
+
+    service = SqliteUserService(db_path=temp_users_dir / "users.sqlite3")
+    assert service.import_json_dir(json_service.users_dir) == 1
+    assert service.get_user(123) == json_service.get_user(123)
+    assert service.find("gold", 7) == [123]
+    service.close()
+
+
+def test_queries_see_batch_changes(user_service):
+    """Test that find() and top() include the changes of the current batch."""
+    user_service.add_user(1, "Alice")
+    user_service.add_user(2, "Bob")
+    with user_service.batch():
+        user_service.set(1, "admin", True)
+        user_service.set(2, "gems", 5)
+        assert user_service.find("admin", True) == [1]
+        assert user_service.get_admin_ids() == [1]
+        assert user_service.top("gems", 1) == [2]
+    assert user_service.find("admin", True) == [1]
+
+
+def test_bot_configuration_uses_sql_indexes(temp_users_dir, monkeypatch):
+    """Test that the service built for the bot answers find() and top() with SQL."""
+    monkeypatch.setattr(user_storage, "USER_STORAGE", "sqlite")
+    service = user_storage.create_user_service(db_path=temp_users_dir / "users.sqlite3")
+    for user_id, gems in ((1, 5), (2, 30), (3, 0)):
+        service.add_user(user_id, f"User {user_id}")
+        service.set(user_id, "gems", gems)
+    service.set(2, "admin", True)
+    queries = []
+    query_ids = service._query_ids
+    monkeypatch.setattr(service, "_query_ids", lambda *args: queries.append(args[0]) or query_ids(*args))
+    assert service.get_admin_ids() == [2]
+    assert service.find("canvas", "default.csv") == [1, 2, 3]
+    assert service.top("gems", 2) == [2, 1]
+    assert service.top("tiles_count", 1) == [1]
+    assert len(queries) == 4
+    service.close()
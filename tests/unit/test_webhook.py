@@ -0,0 +1,96 @@
+"""
+Test for the webhook listener, by POSTing recorded updates to it
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from telegram.ext import Application, TypeHandler
+from omar_bot.handlers.user_commands import add_user_handlers, USER_SERVICE_KEY
+from omar_bot.services.user_service import UserService
+from omar_bot.utils.fake_api import FakeBotAPI, make_command_update
+from omar_bot.utils.webhook import WebhookServer
+
+
+def make_application(api: FakeBotAPI) -> Application:
+    return Application.builder().token("1:test").request(api).get_updates_request(api).build()
+
+
+async def post(port: int, body: bytes, path: str = "/telegram", secret: str = "s3cret") -> int:
+    """Send a POST request to the local listener, return the HTTP status."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    writer.close()
+    await writer.wait_closed()
+    return status
+
+
+def test_recorded_update_is_processed(temp_users_dir):
+    """Test that a posted update reaches the handlers, and bad requests are refused."""
+    service = UserService(users_dir=temp_users_dir)
+    service.add_user(7, "Alice")
+    api = FakeBotAPI()
+    application = make_application(api)
+    application.bot_data[USER_SERVICE_KEY] = service
+    add_user_handlers(application)
+    update = json.dumps(make_command_update(1, 7, "/myprofile")).encode()
+
+    async def run():
+        await application.initialize()
+        server = WebhookServer(application, path="/telegram", secret_token="s3cret")
+        port = await server.start(port=0)
+        statuses = [
+            await post(port, update),
+            await post(port, update, secret="wrong"),
+            await post(port, update, path="/other"),
+            await post(port, b"{not json"),
+        ]
+        await server.stop()
+        await application.shutdown()
+        return statuses
+
+    assert asyncio.run(run()) == [200, 403, 404, 400]
+    assert len(api.sent) == 1 and "ID: `7`" in api.sent[0][1]
+
+
+def test_concurrency_is_bounded():
+    """Test that no more than max_concurrent updates are processed at a time."""
+    application = make_application(FakeBotAPI())
+    running, peak = 0, 0
+
+    async def slow_handler(update, context):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+    application.add_handler(TypeHandler(object, slow_handler))
+
+    async def run():
+        await application.initialize()
+        server = WebhookServer(application, path="/telegram", max_concurrent=3)
+        port = await server.start(port=0)
+        bodies = [json.dumps(make_command_update(i, 7, "hello")).encode() for i in range(1, 21)]
+        statuses = await asyncio.gather(*(post(port, body) for body in bodies))
+        await server.stop()
+        await application.shutdown()
+        return statuses
+
+    assert asyncio.run(run()) == [200] * 20
+    assert peak == 3
+
+
+def test_webhook_mode_requires_url():
+    """The settings refuse to load in webhook mode without a WEBHOOK_URL."""
+    for url, returncode in (("", 1), ("https://example.com/telegram", 0)):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path), BOT_TOKEN="1:test", BOT_MODE="webhook",
+                   WEBHOOK_URL=url)
+        result = subprocess.run([sys.executable, "-c", "import omar_bot.config.settings"],
+                                env=env, capture_output=True, text=True)
+        assert result.returncode == returncode
+        assert ("WEBHOOK_URL environment variable is not set" in result.stderr) == bool(returncode)